@@ -38,6 +38,26 @@ ARGO_STORAGE_PATH_MILVUS_LITE = os.path.join(ARGO_STORAGE_PATH, "milvus_lite")
 if not os.path.exists(ARGO_STORAGE_PATH_MILVUS_LITE):
     os.makedirs(ARGO_STORAGE_PATH_MILVUS_LITE)
 
+ARGO_STORAGE_PATH_EMBEDDING_CACHE = os.path.join(ARGO_STORAGE_PATH, "embedding_cache")
+if not os.path.exists(ARGO_STORAGE_PATH_EMBEDDING_CACHE):
+    os.makedirs(ARGO_STORAGE_PATH_EMBEDDING_CACHE)
+
+ARGO_STORAGE_PATH_FILE_DIGESTS = os.path.join(ARGO_STORAGE_PATH, "file_digests")
+if not os.path.exists(ARGO_STORAGE_PATH_FILE_DIGESTS):
+    os.makedirs(ARGO_STORAGE_PATH_FILE_DIGESTS)
+
+ARGO_STORAGE_PATH_FOLDER_INDEX = os.path.join(ARGO_STORAGE_PATH, "folder_index")
+if not os.path.exists(ARGO_STORAGE_PATH_FOLDER_INDEX):
+    os.makedirs(ARGO_STORAGE_PATH_FOLDER_INDEX)
+
+ARGO_STORAGE_PATH_KEYWORD_INDEX = os.path.join(ARGO_STORAGE_PATH, "keyword_index")
+if not os.path.exists(ARGO_STORAGE_PATH_KEYWORD_INDEX):
+    os.makedirs(ARGO_STORAGE_PATH_KEYWORD_INDEX)
+
+ARGO_STORAGE_PATH_RERANK_MODELS = os.path.join(ARGO_STORAGE_PATH, "rerank_models")
+if not os.path.exists(ARGO_STORAGE_PATH_RERANK_MODELS):
+    os.makedirs(ARGO_STORAGE_PATH_RERANK_MODELS)
+
 ARGO_STORAGE_PATH_SQLITE = os.path.join(ARGO_STORAGE_PATH, "sqlite")
 if not os.path.exists(ARGO_STORAGE_PATH_SQLITE):
     os.makedirs(ARGO_STORAGE_PATH_SQLITE)
@@ -1,3 +1,4 @@
+import json
 import os
 
 from configs.env import ARGO_STORAGE_PATH_SQLITE
@@ -20,12 +21,129 @@ FILE_SETTINGS = {
     "CHUNK_SIZE": 500,
     "CHUNK_OVERLAP": 50,
     "TOP_K": 5,
+    "SEARCH_WORKERS": 8,
+    "SEARCH_OVERFETCH": 4,
+    "SEARCH_PROBE_LIMIT": 2048,
+    "RRF_K": 60,
+    "MAX_UPLOAD_SIZE": int(os.getenv("MAX_UPLOAD_SIZE_MB") or 10240) * 1024 * 1024,
+    "UPLOAD_WORKERS": 10,
+}
+
+DOCUMENT_PROCESS_SETTINGS = {
+    "WORKERS": int(os.getenv("DOCUMENT_PROCESS_WORKERS") or 2),
+    "RETRY_DELAY": 5,
+    "MAX_RETRY_DELAY": 60,
+    "RECONCILE_INTERVAL": 60,
+    "THROUGHPUT_WINDOW": 300,
+    "PDF_WORKERS": int(os.getenv("PDF_EXTRACT_WORKERS") or 2),
+    "PDF_PAGE_WINDOW": 8,
+    "STREAM_WINDOW": 1024 * 1024,
+    "ENCODING_SNIFF_BYTES": 64 * 1024,
+}
+
+EMBEDDING_SETTINGS = {
+    "CONCURRENCY": int(os.getenv("EMBEDDING_CONCURRENCY") or 4),
+    "PROGRESS_INTERVAL": 2,
+    "GROW_AFTER": 8,
+    "CACHE_MAX_BYTES": int(os.getenv("EMBEDDING_CACHE_MAX_MB") or 1024) * 1024 * 1024,
+    # query vectors kept in memory, apart from the document vectors on disk
+    "QUERY_CACHE_SIZE": 1024,
+    "BATCH_SIZE": {
+        "default": 32,
+        "openai": 256,
+        "zhipuai": 64,
+        "siliconflow": 32,
+    },
+}
+
+RERANK_SETTINGS = {
+    "MODEL": os.getenv("RERANK_MODEL") or "",
+    "OVERFETCH": 4,
+    "BATCH_SIZE": 16,
+    # batches waiting on the rerank thread across queries, a query finding it fuller keeps the vector order
+    "MAX_QUEUED_BATCHES": 16,
+    "BUDGET": int(os.getenv("RERANK_BUDGET_MS") or 800) / 1000,
+    "CACHE_SIZE": 20000,
+    "THREADS": 2,
+    "MAX_LENGTH": 512,
+}
+
+MODEL_DOWNLOAD_SETTINGS = {
+    "CONNECTIONS": int(os.getenv("MODEL_DOWNLOAD_CONNECTIONS") or 8),
+    "SEGMENT_SIZE": 32 * 1024 * 1024,
+    "CHUNK_SIZE": 1024 * 1024,
+    "PROGRESS_INTERVAL": 1,
+    "MAX_RETRIES": 5,
+    "DOWNLOAD_WORKERS": int(os.getenv("MODEL_DOWNLOAD_WORKERS") or 2),
+    "CONVERT_WORKERS": 1,
+    "IMPORT_WORKERS": 1,
+    # bytes per second shared by all running downloads, 0 is unlimited
+    "BANDWIDTH_LIMIT": float(os.getenv("MODEL_DOWNLOAD_BANDWIDTH_MB") or 0) * 1024 * 1024,
+    "RECONCILE_INTERVAL": 60,
+    # seconds before a stage that ended without moving the model on runs again, doubled on every try
+    "RETRY_DELAY": 5,
+    "MAX_RETRY_DELAY": 600,
+    # seconds a site latency probe is reused by later downloads, retries and resumes
+    "SITE_LATENCY_TTL": 600,
 }
 
 MODEL_PROVIDER_SETTINGS = {
     "ollama": {"base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")},
 }
 
+OLLAMA_CLIENT_SETTINGS = {
+    "MAX_CONNECTIONS": int(os.getenv("OLLAMA_MAX_CONNECTIONS") or 32),
+    "MAX_KEEPALIVE_CONNECTIONS": 16,
+    "KEEPALIVE_EXPIRY": 60,
+    "CONNECT_TIMEOUT": 3,
+    # read timeout of chat and embedding calls, None waits for slow generations
+    "TIMEOUT": float(os.getenv("OLLAMA_TIMEOUT")) if os.getenv("OLLAMA_TIMEOUT") else None,
+    "FAILURE_THRESHOLD": 3,
+    "RECOVERY_TIMEOUT": 10,
+    "HEALTHY_WINDOW": 10,
+    # per host overrides, e.g. {"http://10.0.0.2:11434": {"max_connections": 4, "timeout": 600}}
+    "HOSTS": json.loads(os.getenv("OLLAMA_CLIENT_HOSTS") or "{}"),
+}
+
+OLLAMA_INVENTORY_SETTINGS = {
+    # seconds the /api/tags listing is served from memory, pull, create and delete invalidate it sooner
+    "TTL": int(os.getenv("OLLAMA_INVENTORY_TTL") or 30),
+}
+
+MODEL_INSTANCE_SETTINGS = {
+    # chat and embedding clients kept built, keyed by provider, model, credentials and parameters
+    "POOL_SIZE": int(os.getenv("MODEL_INSTANCE_POOL_SIZE") or 64),
+    # keep-alive connections per provider host, shared by all pooled clients of the host
+    "MAX_CONNECTIONS": int(os.getenv("MODEL_MAX_CONNECTIONS") or 100),
+    "MAX_KEEPALIVE_CONNECTIONS": 20,
+    "KEEPALIVE_EXPIRY": 60,
+}
+
+GENERATION_SETTINGS = {
+    # long-lived event loops running chat generations, each runs up to TASKS_PER_WORKER of them at once
+    "WORKERS": int(os.getenv("GENERATION_WORKERS") or 2),
+    "TASKS_PER_WORKER": int(os.getenv("GENERATION_TASKS_PER_WORKER") or 8),
+    # generations waiting for a slot, more are answered with 429
+    "QUEUE_SIZE": int(os.getenv("GENERATION_QUEUE_SIZE") or 64),
+    "PER_USER": int(os.getenv("GENERATION_PER_USER") or 4),
+    "PER_BOT": int(os.getenv("GENERATION_PER_BOT") or 8),
+}
+
+TOKENIZER_SETTINGS = {
+    # token counts kept per (tokenizer, text), prompts count the same messages and world info again and again
+    "CACHE_SIZE": 65536,
+}
+
+MEMORY_SETTINGS = {
+    # conversations whose history is kept in memory, and messages kept per conversation
+    "CACHE_CONVERSATIONS": 256,
+    "MESSAGE_LIMIT": 500,
+    # token budget of the history sent with a message
+    "MAX_TOKENS": int(os.getenv("MEMORY_MAX_TOKENS") or 20000),
+    # fold the turns beyond the budget into a summary written by the chat model, one extra call per message
+    "SUMMARIZE_TAIL": os.getenv("MEMORY_SUMMARIZE_TAIL", "false").lower() == "true",
+}
+
 
 USE_LOCAL_OLLAMA = (
     True
@@ -19,6 +19,7 @@ def create_agent(agent_name: str, llm, tools: list, prompt_template: str, config
         # enable_chunking=True,
         # enable_summarization=True,
         enable_truncation=True,
+        model_name=getattr(llm, "model_name", None) or getattr(llm, "model", ""),  # 按模型的分词器计算token
     )
 
     return create_react_agent(
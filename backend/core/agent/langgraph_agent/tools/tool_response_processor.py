@@ -9,6 +9,8 @@ from typing import Any, Optional
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import BaseMessage, ToolMessage
 
+from core.features.tokenizer import tokenization_service
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,16 +24,23 @@ class ToolResponseManager:
         enable_chunking: bool = False,
         enable_summarization: bool = False,
         enable_truncation: bool = True,
+        model_name: str = "",
     ):
         self.max_tool_response_tokens = max_tool_response_tokens
+        self.model_name = model_name
         self.summarization_model = summarization_model
         self.enable_chunking = enable_chunking
         self.enable_summarization = enable_summarization
         self.enable_truncation = enable_truncation
 
     def estimate_tokens(self, text: str) -> int:
-        """估算文本的token数量（简单估算：1个token ≈ 4个字符）"""
-        return len(text) // 4
+        """用模型的分词器计算文本的token数量，重复的文本命中缓存"""
+        return tokenization_service.count(text, self.model_name)
+
+    def target_length(self, content: str) -> int:
+        """按内容实际的字符/token比例，换算 max_tool_response_tokens 对应的字符数"""
+        token_count = max(1, self.estimate_tokens(content))
+        return int(len(content) * min(1.0, self.max_tool_response_tokens / token_count))
 
     def process_tool_responses(self, messages: list[BaseMessage]) -> list[BaseMessage]:
         """处理消息列表中的工具响应"""
@@ -122,7 +131,7 @@ class ToolResponseManager:
 
     def _chunk_content(self, content: str, tool_name: Optional[str]) -> str:
         """智能分块内容，保留最重要的部分"""
-        target_length = self.max_tool_response_tokens * 4  # 转换回字符数
+        target_length = self.target_length(content)  # 转换回字符数
 
         # 如果是JSON数据，尝试保留结构化信息
         if self._is_json_content(content):
@@ -278,7 +287,7 @@ class ToolResponseManager:
 
     def _truncate_content(self, content: str, tool_name: Optional[str]) -> str:
         """简单截断内容"""
-        target_length = self.max_tool_response_tokens * 4
+        target_length = self.target_length(content)
 
         if len(content) <= target_length:
             return content
@@ -54,7 +54,7 @@ class ToolCallAgentRunner(BaseAgentRunner):
 
         messages: list[BaseMessage] = []
         if self.memory:
-            messages.extend(self.memory.buffer)
+            messages.extend(await self.memory.abuffer())
 
         messages.append(user_message)
 
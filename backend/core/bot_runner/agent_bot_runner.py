@@ -1,7 +1,6 @@
 import asyncio
 import logging
-import threading
-from collections.abc import Iterator
+from collections.abc import AsyncIterator
 from typing import Any
 
 from langchain_core.messages import AIMessage
@@ -25,8 +24,6 @@ from core.queue.application_queue_manager import (
 )
 from core.queue.entities.llm_entities import (
     LLMResult,
-    LLMResultChunk,
-    LLMResultChunkDelta,
     LLMUsage,
 )
 from models.bot import get_bot
@@ -90,45 +87,44 @@ class AgentBotRunner(BasicApplicationRunner):
         )
 
         # agent run
-        async def agent_run(*args, **kwargs):
-            error = None
+        async def agent_run(*args, **kwargs) -> str:
+            output, error = "", None
             try:
                 output = await agent_runner.arun(*args, **kwargs)
-                usage = self._get_usage_of_all_agent_thoughts(
-                    model_config=bot_orchestration_config.bot_model_config,
-                    message=message,
-                )
-                await queue_manager.publish_message_end(
-                    llm_result=LLMResult(
-                        model=bot_orchestration_config.bot_model_config.model,
-                        prompt_messages=[],
-                        message=AIMessage(content=output),
-                        usage=usage,
-                    ),
-                    pub_from=PublishFrom.APPLICATION_MANAGER,
-                )
             except Exception as e:
                 error = e
             agent_callback.done_set(error)
-
-        def run_async_in_thread(*args, **kwargs):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(agent_run(*args, **kwargs))
-            loop.close()
-
-        worker_thread = threading.Thread(
-            target=run_async_in_thread,
-            args=(user_message, application_generate_entity.invoke_from),
-        )
-        worker_thread.start()
-
-        await self._handle_llm_result_stream(
-            queue_manager=queue_manager,
-            bot_orchestration_config=bot_orchestration_config,
-            llm_iter=agent_callback.iter(),
+            return output
+
+        # the agent and the token stream share the loop of the generation worker
+        agent_task = asyncio.create_task(agent_run(user_message, application_generate_entity.invoke_from))
+        try:
+            await self._handle_llm_result_stream(
+                queue_manager=queue_manager,
+                bot_orchestration_config=bot_orchestration_config,
+                llm_iter=agent_callback.aiter(),
+                message=message,
+            )
+            output = await agent_task
+        finally:
+            if not agent_task.done():
+                # stopped by the user, do not leave the agent running
+                agent_task.cancel()
+
+        # the message ends after the last streamed token
+        usage = self._get_usage_of_all_agent_thoughts(
+            model_config=bot_orchestration_config.bot_model_config,
             message=message,
         )
+        await queue_manager.publish_message_end(
+            llm_result=LLMResult(
+                model=bot_orchestration_config.bot_model_config.model,
+                prompt_messages=[],
+                message=AIMessage(content=output),
+                usage=usage,
+            ),
+            pub_from=PublishFrom.APPLICATION_MANAGER,
+        )
 
     def _fill_in_inputs_from_external_data_tools(self, instruction: str, inputs: dict) -> str:
         """
@@ -167,22 +163,15 @@ class AgentBotRunner(BasicApplicationRunner):
         self,
         queue_manager: ApplicationQueueManager,
         bot_orchestration_config: BotOrchestrationConfigEntity,
-        llm_iter: Iterator[Any],
+        llm_iter: AsyncIterator[Any],
         message: Message,
     ) -> None:
         index = 0
-        for result in llm_iter:
+        async for result in llm_iter:
             if not isinstance(result, tuple):
                 continue
 
             meta, token = result
 
-            await queue_manager.publish_chunk_message(
-                LLMResultChunk(
-                    model=bot_orchestration_config.bot_model_config.model,
-                    prompt_messages=[],
-                    delta=LLMResultChunkDelta(index=index, message=AIMessage(content=token), metadata=meta),
-                ),
-                PublishFrom.APPLICATION_MANAGER,
-            )
+            await queue_manager.publish_delta(index, token, PublishFrom.APPLICATION_MANAGER, metadata=meta)
             index += 1
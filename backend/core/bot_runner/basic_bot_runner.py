@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import logging
 import re
@@ -35,8 +36,6 @@ from core.queue.application_queue_manager import (
 )
 from core.queue.entities.llm_entities import (
     LLMResult,
-    LLMResultChunk,
-    LLMResultChunkDelta,
     LLMUsage,
 )
 from models.conversation import Conversation, Message
@@ -86,9 +85,11 @@ class BasicApplicationRunner:
         )
 
         if bot_model_config.network:
-            context += self.retrieve_web_context(query)
+            context += await asyncio.to_thread(self.retrieve_web_context, query)
 
-        prompt_messages = self.get_prompt_messages(
+        # the memory window may summarize through the llm and tokenizes history, keep it off the event loop
+        prompt_messages = await asyncio.to_thread(
+            self.get_prompt_messages,
             query=query,
             prologue=bot_model_config.prologue,
             prompt_template_entity=bot_orchestration_config.prompt_template,
@@ -126,6 +127,7 @@ class BasicApplicationRunner:
         index = 0
         reasoning_started = False
         reasoning_stopped = False
+        queue_manager.attach_prompt_messages(prompt_messages)
 
         async for chunk in invoke_result:
             try:
@@ -156,14 +158,7 @@ class BasicApplicationRunner:
                 if not token:
                     continue
 
-                await queue_manager.publish_chunk_message(
-                    LLMResultChunk(
-                        model=model,
-                        prompt_messages=prompt_messages,
-                        delta=LLMResultChunkDelta(index=index, message=AIMessage(content=token)),
-                    ),
-                    PublishFrom.APPLICATION_MANAGER,
-                )
+                await queue_manager.publish_delta(index, token, PublishFrom.APPLICATION_MANAGER)
                 index += 1
                 text += token
 
@@ -19,15 +19,18 @@ from core.queue.entities.queue_entities import (
     PlanEvent,
     QueueAgentThoughtEvent,
     QueueErrorEvent,
+    QueueMessageDeltaEvent,
     QueueMessageEndEvent,
     QueueMessageEvent,
     QueueMessageReplaceEvent,
     QueuePingEvent,
     QueueRetrieverResourcesEvent,
     QueueStopEvent,
+    QueueWaitingEvent,
 )
 from core.third_party.metrics.stream_metrics import StreamMetrics
 from database import db
+from events.conversation_event import conversation_messages_changed
 from models.conversation import Conversation, Message, MessageAgentThought
 
 logger = logging.getLogger(__name__)
@@ -72,6 +75,7 @@ class GenerateTaskPipeline:
                 message=AIMessage(content=""),
             )
         )
+        self._answer_parts: list[str] = []
 
     def process(self, stream: bool) -> Union[dict, AsyncGenerator]:
         """
@@ -103,6 +107,11 @@ class GenerateTaskPipeline:
             elif isinstance(event, (QueueStopEvent, QueueMessageEndEvent)):
                 if isinstance(event, QueueMessageEndEvent):
                     self._task_state.llm_result = event.llm_result
+                else:
+                    # stopped before the end, deltas carry neither the prompt nor the text so far
+                    self._task_state.llm_result.message.content = "".join(self._answer_parts)
+                    if not self._task_state.llm_result.prompt_messages:
+                        self._task_state.llm_result.prompt_messages = self._queue_manager.prompt_messages
 
                 metrics.finish_infer()
                 metadata = {}
@@ -167,23 +176,17 @@ class GenerateTaskPipeline:
                         response["conversation_id"] = self._conversation.id
 
                     yield self._yield_response(response)
+            elif isinstance(event, QueueMessageDeltaEvent):
+                metrics.output_token()
+                yield self._yield_response(self._handle_delta(event.text, event.metadata))
             elif isinstance(event, QueueMessageEvent):
                 chunk = event.chunk
                 metrics.output_token()
 
-                delta_text = chunk.delta.message.text()
-
                 if not self._task_state.llm_result.prompt_messages:
                     self._task_state.llm_result.prompt_messages = chunk.prompt_messages
 
-                content = self._task_state.llm_result.message.text()
-                content += delta_text
-                self._task_state.llm_result.message.content = content
-                response = self._handle_chunk(delta_text)
-                if chunk.delta.metadata:
-                    response["metadata"] = chunk.delta.metadata
-
-                yield self._yield_response(response)
+                yield self._yield_response(self._handle_delta(chunk.delta.message.text(), chunk.delta.metadata))
             elif isinstance(event, InterruptEvent):
                 response = {
                     "event": "interrupt",
@@ -229,6 +232,17 @@ class GenerateTaskPipeline:
                 if self._conversation.mode == "chat":
                     response["conversation_id"] = self._conversation.id
                 yield self._yield_response(response)
+            elif isinstance(event, QueueWaitingEvent):
+                response = {
+                    "event": "waiting",
+                    "task_id": self._application_generate_entity.task_id,
+                    "id": self._message.id,
+                    "message_id": self._message.id,
+                    "position": event.position,
+                }
+                if self._conversation.mode == "chat":
+                    response["conversation_id"] = self._conversation.id
+                yield self._yield_response(response)
             else:
                 continue
 
@@ -257,6 +271,20 @@ class GenerateTaskPipeline:
             self._message = message
 
             session.commit()
+            conversation_messages_changed.send(message.conversation_id, created_at=message.created_at)
+
+    def _handle_delta(self, text: str, metadata: Optional[dict] = None) -> dict:
+        """
+        Handle one streamed token.
+        :param text: token text
+        :param metadata: token metadata
+        :return:
+        """
+        self._answer_parts.append(text)
+        response = self._handle_chunk(text)
+        if metadata:
+            response["metadata"] = metadata
+        return response
 
     def _handle_chunk(self, text: str) -> dict:
         """
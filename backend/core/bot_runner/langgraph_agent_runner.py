@@ -1,8 +1,7 @@
 import asyncio
 import json
 import logging
-import threading
-from collections.abc import Iterator
+from collections.abc import AsyncIterator
 from typing import Any, Optional
 
 from langchain_core.messages import AIMessage, BaseMessage
@@ -38,8 +37,6 @@ from core.queue.application_queue_manager import (
 )
 from core.queue.entities.llm_entities import (
     LLMResult,
-    LLMResultChunk,
-    LLMResultChunkDelta,
     LLMUsage,
 )
 from models.bot import get_bot
@@ -98,7 +95,7 @@ class LanggraphAgentRunner(BasicApplicationRunner):
 
         messages: list[BaseMessage] = []
         if memory:
-            messages.extend(memory.buffer)
+            messages.extend(await memory.abuffer())
 
         messages.append(user_message)
         # logging.info(f"LanggraphAgentRunner input messages: {messages}")
@@ -189,48 +186,40 @@ class LanggraphAgentRunner(BasicApplicationRunner):
 
         global_graph[thread_id] = graph
 
-        # agent run
-        async def agent_run(queue_mgr: ApplicationQueueManager, comiled_graph: CompiledStateGraph):
-            error = None
-            final_output = ""
+        # agent run, the token stream runs next to it on the loop of the generation worker
+        stream_task = asyncio.create_task(
+            self._handle_llm_result_stream(queue_manager, bot_orchestration_config, agent_callback.aiter(), message)
+        )
+        try:
             usage = self._get_usage_of_all_agent_thoughts(
                 model_config=bot_orchestration_config.bot_model_config,
                 message=message,
             )
             final_output = await self._astream_workflow_generator(
-                queue_mgr,
+                queue_manager,
                 config,
-                comiled_graph,
+                graph,
                 initial_state,
                 thread_id,
                 application_generate_entity.conversation_id,
                 agent_callback,
             )
-
-            await queue_mgr.publish_message_end(
-                llm_result=LLMResult(
-                    model=bot_orchestration_config.bot_model_config.model,
-                    prompt_messages=[],
-                    message=AIMessage(content=final_output),
-                    usage=usage,
-                ),
-                pub_from=PublishFrom.APPLICATION_MANAGER,
-            )
             agent_callback.done_set()
-
-        def run_async_in_thread(*args, **kwargs):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(self._handle_llm_result_stream(*args, **kwargs))
-            loop.close()
-
-        worker_thread = threading.Thread(
-            target=run_async_in_thread,
-            args=(queue_manager, bot_orchestration_config, agent_callback.iter(), message),
+            # flush the last tokens before the message end
+            await stream_task
+        finally:
+            if not stream_task.done():
+                stream_task.cancel()
+
+        await queue_manager.publish_message_end(
+            llm_result=LLMResult(
+                model=bot_orchestration_config.bot_model_config.model,
+                prompt_messages=[],
+                message=AIMessage(content=final_output),
+                usage=usage,
+            ),
+            pub_from=PublishFrom.APPLICATION_MANAGER,
         )
-        worker_thread.start()
-
-        await agent_run(queue_manager, graph)
 
     async def _get_tools(self, base_runner: BaseAgentRunner, tool_configs, invoke_from: InvokeFrom) -> list[BaseTool]:
         """Get tools using the base agent runner."""
@@ -350,22 +339,15 @@ class LanggraphAgentRunner(BasicApplicationRunner):
         self,
         queue_manager: ApplicationQueueManager,
         bot_orchestration_config: BotOrchestrationConfigEntity,
-        llm_iter: Iterator[Any],
+        llm_iter: AsyncIterator[Any],
         message: Message,
     ) -> None:
         index = 0
-        for result in llm_iter:
+        async for result in llm_iter:
             if not isinstance(result, tuple):
                 continue
 
             meta, token = result
 
-            await queue_manager.publish_chunk_message(
-                LLMResultChunk(
-                    model=bot_orchestration_config.bot_model_config.model,
-                    prompt_messages=[],
-                    delta=LLMResultChunkDelta(index=index, message=AIMessage(content=token), metadata=meta),
-                ),
-                PublishFrom.APPLICATION_MANAGER,
-            )
+            await queue_manager.publish_delta(index, token, PublishFrom.APPLICATION_MANAGER, metadata=meta)
             index += 1
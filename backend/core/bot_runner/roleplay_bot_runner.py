@@ -1,7 +1,7 @@
+import asyncio
 import json
 import logging
 import re
-from copy import deepcopy
 from enum import Enum
 from typing import Any, Optional, Union
 
@@ -120,9 +120,11 @@ class RoleplayApplicationRunner(BasicApplicationRunner):
         )
 
         if bot_model_config.network:
-            context += self.retrieve_web_context(query)
+            context += await asyncio.to_thread(self.retrieve_web_context, query)
 
-        prompt_messages = prompt_method(
+        # the memory window and world info scan run synchronously, keep them off the event loop
+        prompt_messages = await asyncio.to_thread(
+            prompt_method,
             query=query,
             prologue=bot_model_config.prologue,
             prompt_template_entity=bot_orchestration_config.prompt_template,
@@ -171,7 +173,8 @@ class RoleplayApplicationRunner(BasicApplicationRunner):
         ai_prefix = "AI"
         human_prefix = "Human"
         if memory:
-            messages = deepcopy(memory.buffer)
+            # the buffer is a fresh copy, it can be edited in place
+            messages = memory.buffer
             ai_prefix = memory.ai_prefix
             human_prefix = memory.human_prefix
         if prologue:
@@ -353,7 +356,7 @@ class RoleplayApplicationRunner(BasicApplicationRunner):
         ai_prefix = "AI"
         human_prefix = "Human"
         if memory:
-            messages = deepcopy(memory.buffer)
+            messages = memory.buffer
             ai_prefix = memory.ai_prefix
             human_prefix = memory.human_prefix
         if prologue:
@@ -1,8 +1,11 @@
 import datetime
+import hashlib
 import json
 import logging
 import random
 import re
+import threading
+from collections import OrderedDict
 from collections.abc import Callable
 from copy import deepcopy
 from enum import Enum
@@ -14,6 +17,7 @@ from core.features.tokenizer import get_token_count
 from core.prompt.prompt_template import PromptTemplateParser
 from database import db
 from models.conversation import Conversation
+from utils.aho_corasick import AhoCorasick
 
 
 class ScanState(Enum):
@@ -29,6 +33,10 @@ DEFAULT_DEPTH = 4
 MAX_SCAN_DEPTH = 1000
 WORLD_INFO_MAX_RECURSION_STEPS = 10
 DEFAULT_WEIGHT = 100
+# lorebook versions whose entries and key index are kept compiled
+WORLD_INFO_CACHE_SIZE = 32
+# conversations whose world info session is kept between turns
+WORLD_INFO_SESSIONS_SIZE = 256
 
 
 class RegexPlacement(Enum):
@@ -114,6 +122,11 @@ class WIScanEntry:
     def to_dict(self):
         return self.__dict__
 
+    def copy(self) -> "WIScanEntry":
+        entry = WIScanEntry.__new__(WIScanEntry)
+        entry.__dict__.update(self.__dict__)
+        return entry
+
 
 class Macro(TypedDict):
     regex: re.Pattern[str]
@@ -313,12 +326,12 @@ def check_world_info(
 
     budget = round(DEFAULT_WORLD_INFO_BUDGET * max_context / 100) if DEFAULT_WORLD_INFO_BUDGET and max_context else 1
 
-    world_info_books = extract_world_info_books(inputs)
     regex_scripts = extract_character_regex_scripts(inputs)
 
     logging.info(f"[WI] Context size: {max_context}; WI budget: {budget} (max% = {DEFAULT_WORLD_INFO_BUDGET}%)")
 
-    sorted_entries = get_sorted_entries(world_info_books)
+    # shared with the other scans of the lorebook, entries are copied before they are changed
+    sorted_entries, index = get_compiled_world_info(inputs)
     if len(sorted_entries) == 0:
         return {
             "world_info_before": "",
@@ -327,7 +340,8 @@ def check_world_info(
             "em_entries": [],
         }
 
-    timed_effects = WorldInfoTimedEffects(conversation, messages, sorted_entries)
+    session = world_info_sessions.get(conversation.id, index)
+    timed_effects = WorldInfoTimedEffects(conversation, messages, sorted_entries, session.timed_world_info)
     timed_effects.check_timed_effects()
 
     recursion_delays = [
@@ -356,6 +370,24 @@ def check_world_info(
     token_budget_overflowed = False
     all_activated_text = ""
 
+    entry_positions = {id(entry): position for position, entry in enumerate(sorted_entries)}
+    # one lookup per distinct text to scan, keys with macros substituted once
+    key_matches: dict[str, WorldInfoKeyMatches] = {}
+    substituted_keys: dict[str, str] = {}
+
+    def scan(text: str) -> WorldInfoKeyMatches:
+        matches = key_matches.get(text)
+        if matches is None:
+            matches = key_matches[text] = WorldInfoKeyMatches(session, buffer, text)
+        return matches
+
+    def substitute_key(key: str) -> str:
+        if is_static_key(key):
+            return key
+        if key not in substituted_keys:
+            substituted_keys[key] = substitute_inputs(inputs, key)
+        return substituted_keys[key]
+
     while scan_state.value:
         if WORLD_INFO_MAX_RECURSION_STEPS and count >= WORLD_INFO_MAX_RECURSION_STEPS:
             logging.info(f"[WI] Search stopped by reaching max recursion steps {WORLD_INFO_MAX_RECURSION_STEPS}")
@@ -444,11 +476,12 @@ def check_world_info(
                 continue
 
             text_to_scan = buffer.get(entry, scan_state)
+            matches = scan(text_to_scan)
 
             primary_key_match = None
             for key in entry.key:
-                substituted = substitute_inputs(inputs, key)
-                if substituted and buffer.match_keys(text_to_scan, substituted.strip(), entry):
+                substituted = substitute_key(key)
+                if substituted and matches.match(substituted.strip(), entry):
                     primary_key_match = key
                     break
 
@@ -469,14 +502,12 @@ def check_world_info(
             # log('Entry with primary key match', primary_key_match,
             # 'has secondary keywords. Checking with logic logic', selective_logic)
 
-            def match_secondary_keys(entry=entry, selective_logic=selective_logic, text_to_scan=text_to_scan):
+            def match_secondary_keys(entry=entry, selective_logic=selective_logic, matches=matches):
                 has_any_match = False
                 has_all_match = True
                 for keysecondary in entry.keysecondary:
                     secondary_substituted = keysecondary
-                    has_secondary_match = secondary_substituted and buffer.match_keys(
-                        text_to_scan, secondary_substituted.strip(), entry
-                    )
+                    has_secondary_match = secondary_substituted and matches.match(secondary_substituted.strip(), entry)
 
                     if has_secondary_match:
                         has_any_match = True
@@ -514,7 +545,7 @@ def check_world_info(
             activated_now,
             key=lambda entry: (
                 -1 if timed_effects.is_effect_active("sticky", entry) else 0,
-                sorted_entries.index(entry),
+                entry_positions[id(entry)],
             ),
         )
 
@@ -526,7 +557,7 @@ def check_world_info(
         new_content = ""
         text_to_scan_tokens = get_token_count(all_activated_text, model_config)
 
-        for entry in new_entries:
+        for position, entry in enumerate(new_entries):
 
             def verify_probability(entry=entry, failed_probability_checks=None):
                 if failed_probability_checks is None:
@@ -554,6 +585,7 @@ def check_world_info(
                 logging.info(f"WI entry {entry.uid} failed probability check, removing from activated entries")
                 continue
 
+            entry = new_entries[position] = entry.copy()
             entry.content = substitute_inputs(inputs, entry.content)
             new_content += f"{entry.content}\n"
 
@@ -682,6 +714,7 @@ def check_world_info(
     timed_effects.set_timed_effects(list(all_activated_entries.values()))
     buffer.reset_external_effects()
     timed_effects.clean_up()
+    session.end_turn(timed_effects.timed_world_info)
 
     logging.info(f"[WI] Adding {len(all_activated_entries)} entries to prompt")
     logging.info("[WI] --- DONE ---")
@@ -695,6 +728,32 @@ def check_world_info(
     }
 
 
+_compiled_world_info: OrderedDict[bytes, tuple[list[WIScanEntry], "WorldInfoIndex"]] = OrderedDict()
+_compiled_world_info_lock = threading.Lock()
+
+
+def get_compiled_world_info(inputs: dict[str, str]) -> tuple[list[WIScanEntry], "WorldInfoIndex"]:
+    """
+    The sorted entries of the lorebooks in `inputs` and the index of their keys, built once per lorebook version:
+    parsing, hashing every entry and compiling the keys is most of the cost of a scan otherwise.
+    """
+    books = "\x00".join([inputs.get("character_book") or "", inputs.get("persona_book") or ""])
+    digest = hashlib.blake2b(books.encode("utf-8"), digest_size=16).digest()
+    with _compiled_world_info_lock:
+        compiled = _compiled_world_info.get(digest)
+        if compiled is not None:
+            _compiled_world_info.move_to_end(digest)
+            return compiled
+
+    sorted_entries = get_sorted_entries(extract_world_info_books(inputs))
+    compiled = (sorted_entries, WorldInfoIndex(sorted_entries))
+    with _compiled_world_info_lock:
+        _compiled_world_info[digest] = compiled
+        while len(_compiled_world_info) > WORLD_INFO_CACHE_SIZE:
+            _compiled_world_info.popitem(last=False)
+    return compiled
+
+
 def get_sorted_entries(world_info_books: dict):
     character_lore = get_character_lore(world_info_books.get("character_books", {}))
     persona_lore = get_persona_lore(world_info_books.get("persona_books", {}))
@@ -924,6 +983,9 @@ def run_regex_script(regex_script, raw_string, inputs: dict[str, str]):
 
 class WorldInfoBuffer:
     external_activations: dict[str, object] = {}
+    # the text to scan is MATCHER followed by the messages joined with JOINER
+    MATCHER = "\x01"
+    JOINER = "\n" + MATCHER
 
     def __init__(self, messages: list[str]):
         self._depth_buffer: list[str] = []
@@ -932,6 +994,8 @@ class WorldInfoBuffer:
         self._skew = 0
         self._start_depth = 0
         self.world_info_depth = 2
+        # the same text object for every entry of a scan with the same depth, until the buffers change
+        self._texts: dict[tuple[int, bool], str] = {}
         self._init_depth_buffer(messages)
 
     def _init_depth_buffer(self, messages: list[str]):
@@ -958,16 +1022,22 @@ class WorldInfoBuffer:
             logging.info(f"[WI] Invalid WI scan depth {depth}. Truncating to {MAX_SCAN_DEPTH}")
             depth = MAX_SCAN_DEPTH
 
-        matcher = "\x01"
-        joiner = "\n" + matcher
+        with_recurse = scan_state != ScanState.MIN_ACTIVATIONS
+        cached = self._texts.get((depth, with_recurse))
+        if cached is not None:
+            return cached
+
+        matcher = self.MATCHER
+        joiner = self.JOINER
         result = matcher + joiner.join(self._depth_buffer[self._start_depth : depth])
 
         if self._inject_buffer:
             result += joiner + joiner.join(self._inject_buffer)
 
-        if self._recurse_buffer and scan_state != ScanState.MIN_ACTIVATIONS:
+        if self._recurse_buffer and with_recurse:
             result += joiner + joiner.join(self._recurse_buffer)
 
+        self._texts[(depth, with_recurse)] = result
         return result
 
     def match_keys(self, haystack, needle, entry) -> bool:
@@ -991,15 +1061,18 @@ class WorldInfoBuffer:
 
     def add_recurse(self, message: str):
         self._recurse_buffer.append(message)
+        self._texts.clear()
 
     def add_inject(self, message: str):
         self._inject_buffer.append(message)
+        self._texts.clear()
 
     def has_recurse(self) -> bool:
         return len(self._recurse_buffer) > 0
 
     def advance_scan(self):
         self._skew += 1
+        self._texts.clear()
 
     def get_depth(self) -> int:
         return self.world_info_depth + self._skew
@@ -1041,13 +1114,207 @@ class WorldInfoBuffer:
         return primary_score
 
 
+def is_static_key(key) -> bool:
+    """Whether substitute_inputs leaves a key as it is: it has neither macros nor the <USER>-like placeholders."""
+    return isinstance(key, str) and "{{" not in key and "<" not in key
+
+
+def _is_word_char(char: str) -> bool:
+    # what \w matches in a str pattern
+    return char.isalnum() or char == "_"
+
+
+class WorldInfoIndex:
+    """
+    The keys of a lorebook compiled once: the regex keys parsed, the plain keys, lowered unless their entry is
+    case sensitive, in one Aho-Corasick automaton per case mode. A text is then scanned in a single pass
+    whatever the number of entries, see WorldInfoKeyMatches.
+
+    Keys holding a character of WorldInfoBuffer.JOINER are left out, they may match across messages; every
+    other key matches the text to scan where it matches one of its messages, so messages are scanned one by one.
+    """
+
+    def __init__(self, entries: list[WIScanEntry]):
+        self.regexes: dict[str, Optional[re.Pattern]] = {}
+        self.patterns: dict[bool, set[str]] = {False: set(), True: set()}
+        self.whole_words: dict[bool, set[str]] = {False: set(), True: set()}
+
+        for entry in entries:
+            case_sensitive = bool(entry.case_sensitive)
+            for key in [*entry.key, *entry.keysecondary]:
+                if not isinstance(key, str):
+                    continue
+                needle = key.strip()
+                if needle not in self.regexes:
+                    self.regexes[needle] = parse_regex_from_string(needle)
+                if not needle or self.regexes[needle] is not None:
+                    continue
+                transformed = needle if case_sensitive else needle.lower()
+                if any(char in transformed for char in WorldInfoBuffer.JOINER):
+                    continue
+                self.patterns[case_sensitive].add(transformed)
+                if entry.match_whole_words and len(transformed.split()) <= 1:
+                    self.whole_words[case_sensitive].add(transformed)
+
+        self.automatons = {
+            case_sensitive: AhoCorasick(sorted(patterns)) for case_sensitive, patterns in self.patterns.items()
+        }
+
+    def scan(self, haystack: str, case_sensitive: bool) -> tuple[frozenset[str], frozenset[str]]:
+        """The patterns found in `haystack`, and those of them found at least once as a whole word."""
+        whole_words = self.whole_words[case_sensitive]
+        found: set[str] = set()
+        bounded: set[str] = set()
+        for start, pattern in self.automatons[case_sensitive].iter(haystack):
+            found.add(pattern)
+            if pattern in whole_words and pattern not in bounded:
+                end = start + len(pattern)
+                if (start == 0 or not _is_word_char(haystack[start - 1])) and (
+                    end == len(haystack) or not _is_word_char(haystack[end])
+                ):
+                    bounded.add(pattern)
+        return frozenset(found), frozenset(bounded)
+
+
+class WorldInfoSession:
+    """
+    The world info state of a conversation kept from one turn to the next, for one WorldInfoIndex: the keys
+    found in every message scanned and the timed effects written by the last turn.
+
+    A turn scans the messages new to its window and reuses the results of the others; an edited message is a
+    new text, and the results of the messages that left the window are dropped by `end_turn`.
+    """
+
+    def __init__(self, index: WorldInfoIndex):
+        self.index = index
+        self.timed_world_info: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._scans: dict[tuple[bool, str], tuple[frozenset[str], frozenset[str]]] = {}
+        self._used: set[tuple[bool, str]] = set()
+
+    def scan(self, text: str, case_sensitive: bool) -> tuple[frozenset[str], frozenset[str]]:
+        key = (case_sensitive, text)
+        with self._lock:
+            scanned = self._scans.get(key)
+        if scanned is None:
+            scanned = self.index.scan(text if case_sensitive else text.lower(), case_sensitive)
+        with self._lock:
+            self._scans[key] = scanned
+            self._used.add(key)
+        return scanned
+
+    def end_turn(self, timed_world_info: dict):
+        with self._lock:
+            self._scans = {key: scanned for key, scanned in self._scans.items() if key in self._used}
+            self._used = set()
+            self.timed_world_info = timed_world_info
+
+
+class WorldInfoSessions:
+    """
+    World info sessions of the recent conversations. A lorebook edit builds another WorldInfoIndex and so starts
+    a new session; edits, deletes and regenerations of messages drop the session through `invalidate`.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, WorldInfoSession] = OrderedDict()
+
+    def get(self, conversation_id: str, index: WorldInfoIndex) -> WorldInfoSession:
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is None or session.index is not index:
+                session = self._sessions[conversation_id] = WorldInfoSession(index)
+            self._sessions.move_to_end(conversation_id)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+            return session
+
+    def invalidate(self, conversation_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+world_info_sessions = WorldInfoSessions(WORLD_INFO_SESSIONS_SIZE)
+
+
+class WorldInfoKeyMatches:
+    """
+    The keys of a WorldInfoIndex found in one text to scan, answering WorldInfoBuffer.match_keys for it.
+    For each case mode, on first use, the messages of the text are looked up in the session, which scans
+    those it has not seen. Regex keys search the whole text; keys missing from the index, those with
+    substituted macros, go through match_keys.
+    """
+
+    def __init__(self, session: WorldInfoSession, buffer: WorldInfoBuffer, text: str):
+        self.session = session
+        self.index = session.index
+        self.buffer = buffer
+        self.text = text
+        self._scans: dict[bool, tuple[set[str], set[str]]] = {}
+        self._searches: dict[str, bool] = {}
+
+    def _scan(self, case_sensitive: bool) -> tuple[set[str], set[str]]:
+        """The patterns found in the text, and those of them found at least once as a whole word."""
+        scanned = self._scans.get(case_sensitive)
+        if scanned is None:
+            found: set[str] = set()
+            bounded: set[str] = set()
+            parts = self.text.removeprefix(WorldInfoBuffer.MATCHER).split(WorldInfoBuffer.JOINER)
+            for part in parts:
+                part_found, part_bounded = self.session.scan(part, case_sensitive)
+                found.update(part_found)
+                bounded.update(part_bounded)
+            scanned = self._scans[case_sensitive] = (found, bounded)
+        return scanned
+
+    def match(self, needle: str, entry) -> bool:
+        if needle not in self.index.regexes:
+            return self.buffer.match_keys(self.text, needle, entry)
+
+        key_regex = self.index.regexes[needle]
+        if key_regex is not None:
+            if needle not in self._searches:
+                self._searches[needle] = bool(key_regex.search(self.text))
+            return self._searches[needle]
+        if not needle:
+            return True
+
+        case_sensitive = bool(entry.case_sensitive)
+        transformed = needle if case_sensitive else needle.lower()
+        if entry.match_whole_words and len(transformed.split()) <= 1:
+            if transformed not in self.index.whole_words[case_sensitive]:
+                return self.buffer.match_keys(self.text, needle, entry)
+            return transformed in self._scan(case_sensitive)[1]
+        if transformed not in self.index.patterns[case_sensitive]:
+            return self.buffer.match_keys(self.text, needle, entry)
+        return transformed in self._scan(case_sensitive)[0]
+
+
 class WorldInfoTimedEffects:
-    def __init__(self, conversation: Conversation, messages: list[str], entries):
+    def __init__(
+        self,
+        conversation: Conversation,
+        messages: list[str],
+        entries,
+        timed_world_info: Optional[dict] = None,
+    ):
         self._chat_messages = messages
         self._conversation = conversation
         self._chat_metadata = deepcopy(conversation.chat_metadata)
+        if timed_world_info is not None:
+            # written by the previous turn of the session, the conversation may have been loaded before it
+            self._chat_metadata["timed_world_info"] = deepcopy(timed_world_info)
+        self._saved_metadata = deepcopy(self._chat_metadata)
         self._entries = entries
+        self._entries_by_hash: Optional[dict[str, Any]] = None
         self._buffer: dict[str, Any] = {effect: [] for effect in ["sticky", "cooldown", "delay"]}
+        self._active: dict[str, set] = {}
         self._on_ended = {
             "sticky": self.on_sticky_ended,
             "cooldown": self.on_cooldown_ended,
@@ -1097,10 +1364,7 @@ class WorldInfoTimedEffects:
         effects = list(self._chat_metadata["timed_world_info"][effect_type].items())
         for key, value in effects:
             logging.info(f"[WI] Processing {effect_type} entry {key} \n{value}")
-            entry = next(
-                (x for x in self._entries if str(self.get_entry_hash(x)) == str(value["hash"])),
-                None,
-            )
+            entry = self.get_entry_by_hash(value["hash"])
 
             if len(self._chat_messages) <= int(value["start"]) and not value["protected"]:
                 logging.info(f"[WI] Removing {effect_type} entry {key} from timed_world_info: chat not advanced")
@@ -1139,10 +1403,25 @@ class WorldInfoTimedEffects:
                 buffer.append(entry)
                 logging.info(f'[WI] Timed effect "delay" applied to entry {entry.uid}')
 
+    def get_entry_by_hash(self, entry_hash):
+        if self._entries_by_hash is None:
+            self._entries_by_hash = {}
+            for entry in self._entries:
+                self._entries_by_hash.setdefault(str(self.get_entry_hash(entry)), entry)
+        return self._entries_by_hash.get(str(entry_hash))
+
     def check_timed_effects(self):
         self.check_timed_effect_of_type("sticky", self._buffer["sticky"], self._on_ended["sticky"])
         self.check_timed_effect_of_type("cooldown", self._buffer["cooldown"], self._on_ended["cooldown"])
         self.check_delay_effect(self._buffer["delay"])
+        self._active = {
+            effect_type: {self.get_entry_hash(entry) for entry in buffer}
+            for effect_type, buffer in self._buffer.items()
+        }
+
+    @property
+    def timed_world_info(self) -> dict:
+        return self._chat_metadata["timed_world_info"]
 
     def get_effect_metadata(self, effect_type, entry):
         if not self.is_valid_effect_type(effect_type):
@@ -1177,17 +1456,21 @@ class WorldInfoTimedEffects:
             )
 
     def is_effect_active(self, effect_type, entry):
-        if not self.is_valid_effect_type(effect_type):
-            return False
+        active = self._active.get(effect_type)
+        if active is None:
+            if not self.is_valid_effect_type(effect_type):
+                return False
+            active = self._active.get(effect_type.strip().lower(), ())
 
-        return any(self.get_entry_hash(x) == self.get_entry_hash(entry) for x in self._buffer.get(effect_type, []))
+        return self.get_entry_hash(entry) in active
 
     def clean_up(self):
-        with db.session_scope() as session:
-            session.query(Conversation).filter_by(id=self._conversation.id).update(
-                {Conversation.chat_metadata: self._chat_metadata}
-            )
-            session.commit()
+        if self._chat_metadata != self._saved_metadata:
+            with db.session_scope() as session:
+                session.query(Conversation).filter_by(id=self._conversation.id).update(
+                    {Conversation.chat_metadata: self._chat_metadata}
+                )
+                session.commit()
 
         for buffer in self._buffer.values():
             buffer.clear()
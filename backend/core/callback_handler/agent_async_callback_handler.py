@@ -1,4 +1,5 @@
 import ast
+import asyncio
 import json
 import logging
 import queue
@@ -109,12 +110,34 @@ class AgentAsyncCallbackHandler(AsyncCallbackHandler, _StreamingCallbackHandler)
         self.queue: queue.Queue = queue.Queue()
         self.done = threading.Event()
         self.done_error: Optional[Exception] = None
+        # wakes aiter, whose loop is remembered so tokens from other threads can wake it too
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
         self.seen: set[str] = set()
 
     def done_set(self, e: Optional[Exception] = None):
         self.done_error = e
         self.done.set()
+        self._wake()
+
+    def _wake(self):
+        loop = self._loop
+        if loop is None:
+            # aiter is not running yet, it drains the queue when it starts
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wakeup.set()
+            return
+        try:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # loop closed, nobody is listening any more
+            pass
 
     async def step_agent_loop(self, run_id: UUID, meta: dict[str, Any], message: BaseMessage) -> None:
         if message.id in self.seen:
@@ -241,6 +264,7 @@ class AgentAsyncCallbackHandler(AsyncCallbackHandler, _StreamingCallbackHandler)
         """Do nothing."""
         if loop := self._agent_loops.get(run_id):
             self.queue.put_nowait((loop.metadata, token))
+            self._wake()
 
     async def on_tool_start(
         self,
@@ -365,6 +389,7 @@ class AgentAsyncCallbackHandler(AsyncCallbackHandler, _StreamingCallbackHandler)
         # Final Answer
         if outputs == "__end__":
             self.done.set()
+            self._wake()
 
     async def _init_agent_thought(self, loop: AgentLoop) -> MessageAgentThought:
         with db.session_scope() as session:
@@ -408,13 +433,15 @@ class AgentAsyncCallbackHandler(AsyncCallbackHandler, _StreamingCallbackHandler)
             )
             session.commit()
 
-    def iter(self) -> Iterator[Any]:
-        while not self.queue.empty() or not self.done.is_set():
-            try:
-                token_or_done = self.queue.get(timeout=0.1)
-                yield token_or_done
-            except queue.Empty:
-                if self.done.is_set():
-                    break
+    async def aiter(self) -> AsyncIterator[Any]:
+        """Streamed tokens until the agent is done, waiting on the running loop instead of polling."""
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            while not self.queue.empty():
+                yield self.queue.get_nowait()
+            if self.done.is_set() and self.queue.empty():
+                break
+            await self._wakeup.wait()
         if self.done_error:
             raise self.done_error
@@ -27,6 +27,7 @@ class Errcode(Enum):
     ErrcodeBotModelNotConfigured = -302
     ErrcodeOllamaConnectionError = -303
     ErrcodeOllamaMemoryError = -304
+    ErrcodeTooManyGenerations = -305
 
     ErrcodeUnauthorized = -88888
     ErrcodeInvalidRequest = -99999
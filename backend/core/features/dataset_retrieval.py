@@ -17,7 +17,6 @@ from core.entities.application_entities import (
     ModelConfigEntity,
 )
 from core.features.knowledge_tool import KnowledgeSearchTool
-from models.knowledge import get_collection_by_name
 
 
 class DatasetRetrievalFeature:
@@ -73,13 +72,7 @@ class DatasetRetrievalFeature:
         doc_map: dict[str, list[str]],
         hit_callback: Optional[DatasetIndexToolCallbackHandler] = None,
     ) -> list[BaseTool]:
-        tools = []
+        # one tool over all selected knowledge bases, they are searched in a single batched query
         hit_callbacks = [hit_callback] if hit_callback else []
-        for collection_name, partition_names in doc_map.items():
-            knowledge = get_collection_by_name(collection_name=collection_name)
-            if knowledge:
-                tool = KnowledgeSearchTool.from_knowledge(collection_name, partition_names, hit_callbacks=hit_callbacks)
-                if tool:
-                    tools.append(tool)
-
-        return tools
+        tool = KnowledgeSearchTool.from_knowledge_bases(doc_map, hit_callbacks=hit_callbacks)
+        return [tool] if tool else []
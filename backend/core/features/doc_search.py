@@ -1,20 +1,38 @@
+import heapq
+import itertools
 import logging
 import operator
 import os
-from typing import Any
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
+import numpy as np
 from qdrant_client import models
 
+from configs.settings import FILE_SETTINGS, RERANK_SETTINGS
+from core.features.embedding_cache import with_embedding_cache
+from core.features.keyword_index import load_keyword_index
+from core.features.reranker import RerankStage, get_rerank_stage
 from core.file.file_db import FileDB
 from core.model_providers import model_provider_manager
+from core.model_providers.constants import OLLAMA_PROVIDER
 from database.db import session_scope
-from database.vector import get_qdrant_client
+from database.vector import get_qdrant_client, is_local_client
 from models import Knowledge
+from models.knowledge import RETRIEVALMODE
+
+_search_executor = ThreadPoolExecutor(max_workers=FILE_SETTINGS["SEARCH_WORKERS"], thread_name_prefix="doc-search")
 
 
 def get_embedding_function(provider: str, embedding_model: str):
     def model_embed(query):
-        embedding = model_provider_manager.get_embedding_instance(provider, embedding_model)
+        embedding = with_embedding_cache(
+            model_provider_manager.get_embedding_instance(provider, embedding_model),
+            provider=provider,
+            model=embedding_model,
+        )
         return embedding.embed_query(str(query))
 
     def generate_multiple(query, f):
@@ -26,40 +44,134 @@ def get_embedding_function(provider: str, embedding_model: str):
     return lambda query: generate_multiple(query, model_embed)
 
 
-def get_reranking_function(model_name: str):
-    # Todo: add reranking function
-    return None
-
-
-def merge_and_sort_query_results(query_results, k, reverse=False):
-    combined_distances: list[Any] = []
-    combined_documents: list[Any] = []
-    combined_metadatas: list[Any] = []
+def get_partition_filter(partition_names: list[str]) -> Optional[models.Filter]:
+    # chunks are tagged with a `<partition_name>: "1"` payload key, a hit must belong to one of the partitions
+    if not partition_names:
+        return None
+    return models.Filter(
+        should=[models.FieldCondition(key=name, match=models.MatchValue(value="1")) for name in partition_names]
+    )
 
-    for data in query_results:
-        if data:
-            combined_distances.extend(data["distances"])
-            combined_documents.extend(data["documents"])
-            combined_metadatas.extend(data["metadatas"])
 
-    combined = list(zip(combined_distances, combined_documents, combined_metadatas))
+def search_partitions(
+    collection_name: str,
+    partition_names: list[str],
+    query_vector: list[float],
+    score_threshold: float,
+    limit: int,
+) -> list[models.ScoredPoint]:
+    client = get_qdrant_client()
+    partition_filter = get_partition_filter(partition_names)
+    if partition_filter and is_local_client():
+        # local mode checks payload filters point by point in python, while an unfiltered search is a numpy scan.
+        # an unfiltered over-fetch is exact as soon as it holds `limit` hits of the scoped partitions, so try a
+        # small and a wide one before paying for the filter. each chunk carries a single partition key, which
+        # makes the full payload cheaper than projecting every partition key
+        scope = set(partition_names)
+        small_probe = limit * FILE_SETTINGS["SEARCH_OVERFETCH"]
+        for probe_limit in (small_probe, max(small_probe, FILE_SETTINGS["SEARCH_PROBE_LIMIT"])):
+            probe = client.search(
+                collection_name,
+                query_vector=query_vector,
+                with_payload=True,
+                with_vectors=False,
+                score_threshold=score_threshold,
+                limit=probe_limit,
+            )
+            hits = [point for point in probe if scope.intersection(point.payload or {})]
+            if len(hits) >= limit or len(probe) < probe_limit:
+                for point in hits[:limit]:
+                    point.payload = {
+                        "page_content": point.payload.get("page_content", ""),
+                        "metadata": point.payload.get("metadata", {}),
+                    }
+                return hits[:limit]
+
+    return client.search(
+        collection_name,
+        query_vector=query_vector,
+        query_filter=partition_filter,
+        with_payload=models.PayloadSelectorInclude(include=["page_content", "metadata"]),
+        with_vectors=False,
+        score_threshold=score_threshold,
+        limit=limit,
+    )
 
-    combined.sort(key=operator.itemgetter(0), reverse=reverse)
 
-    if not combined:
-        sorted_distances: list[Any] = []
-        sorted_documents: list[Any] = []
-        sorted_metadatas: list[Any] = []
-    else:
-        sorted_distances, sorted_documents, sorted_metadatas = [list(x) for x in zip(*combined)]
-        sorted_distances = list(sorted_distances)[:k]
-        sorted_documents = list(sorted_documents)[:k]
-        sorted_metadatas = list(sorted_metadatas)[:k]
+def hybrid_search(
+    collection_name: str,
+    partition_names: list[str],
+    query: str,
+    query_vector: list[float],
+    score_threshold: float,
+    limit: int,
+) -> list[models.ScoredPoint]:
+    """
+    Fuse vector and BM25 candidates with reciprocal rank fusion.
+
+    The hits come back in fused order but scored with their cosine similarity to the query, so relevance
+    thresholds and the scores shown in citations keep meaning the same as in vector search.
+    """
+    candidates = limit * FILE_SETTINGS["SEARCH_OVERFETCH"]
+    vector_hits = search_partitions(collection_name, partition_names, query_vector, score_threshold, candidates)
+    try:
+        keyword_hits = load_keyword_index(collection_name).search(query, partition_names, candidates)
+    except sqlite3.Error:
+        logging.exception(f"Keyword search failed on {collection_name}")
+        keyword_hits = []
+
+    rrf_k = FILE_SETTINGS["RRF_K"]
+    fused: dict[str, float] = defaultdict(float)
+    for rank, point in enumerate(vector_hits):
+        fused[str(point.id)] += 1 / (rrf_k + rank + 1)
+    for rank, (point_id, _) in enumerate(keyword_hits):
+        fused[point_id] += 1 / (rrf_k + rank + 1)
+    top = heapq.nlargest(limit, fused.items(), key=operator.itemgetter(1))
+
+    payloads = {str(point.id): point.payload for point in vector_hits}
+    similarities = {str(point.id): point.score for point in vector_hits}
+    missing = [point_id for point_id, _ in top if point_id not in payloads]
+    if missing:
+        # keyword-only hits, their similarity is computed from the stored vector
+        for record in get_qdrant_client().retrieve(
+            collection_name, ids=missing, with_payload=["page_content", "metadata"], with_vectors=True
+        ):
+            payloads[str(record.id)] = record.payload
+            similarities[str(record.id)] = cosine_similarity(query_vector, record.vector)
+
+    return [
+        models.ScoredPoint(id=point_id, version=0, score=similarities[point_id], payload=payloads[point_id])
+        for point_id, _ in top
+        if point_id in payloads
+    ]
+
+
+def cosine_similarity(query_vector: list[float], vector) -> float:
+    if not isinstance(vector, list) or not vector:
+        return 0.0
+    query, other = np.asarray(query_vector, dtype=np.float32), np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(query) * np.linalg.norm(other))
+    return float(np.dot(query, other) / norm) if norm else 0.0
+
+
+def get_reranking_function(model_name: Optional[str]) -> Optional[RerankStage]:
+    return get_rerank_stage(model_name)
+
+
+def merge_query_results_by_rank(query_results):
+    """
+    Interleave per-collection results by rank: every collection's first hit, then every second hit, and so on.
+
+    Scores of different collections are not comparable (cosine, fused ranks, reranker probabilities), so they
+    are never sorted against each other; each collection already holds its own top_k.
+    """
+    ranked = [zip(data["distances"], data["documents"], data["metadatas"]) for data in query_results if data]
+    top = [hit for hits in itertools.zip_longest(*ranked) for hit in hits if hit is not None]
 
     result = {
-        "distances": sorted_distances,
-        "documents": sorted_documents,
-        "metadatas": sorted_metadatas,
+        "distances": [each[0] for each in top],
+        "documents": [each[1] for each in top],
+        "metadatas": [each[2] for each in top],
     }
 
     return result
@@ -75,34 +187,52 @@ def query_doc(
     k: int,
     reranking_model,
     r: float,
+    query_vector: Optional[list[float]] = None,
+    retrieval_mode: str = RETRIEVALMODE.VECTOR.value,
 ):
-    embedding_function = get_embedding_function(provider, embedding_model)
-
-    vectors = embedding_function(query)
+    if query_vector is not None:
+        vectors = query_vector
+    else:
+        vectors = get_embedding_function(provider, embedding_model)(query)
     if vectors is None:
         logging.error("query embedding error!")
         return {"distances": [], "documents": [], "metadatas": []}
 
-    payloads = partition_names + ["page_content", "metadata"]
-    result = get_qdrant_client().search(
-        collection_name,
-        query_vector=vectors,
-        with_payload=models.PayloadSelectorInclude(include=payloads),
-        with_vectors=True,
-        score_threshold=similarity_threshold,
-        limit=k,
-    )
-
+    # with a reranker the candidates are over-fetched and the reranker picks the final k
     reranking_function = get_reranking_function(reranking_model)
-    if reranking_function:
-        scores = reranking_function.predict([(query, each.payload.get("page_content", "")) for each in result])
+    limit = k * RERANK_SETTINGS["OVERFETCH"] if reranking_function else k
+    if retrieval_mode == RETRIEVALMODE.HYBRID.value:
+        result = hybrid_search(
+            collection_name=collection_name,
+            partition_names=partition_names,
+            query=query,
+            query_vector=vectors,
+            score_threshold=similarity_threshold,
+            limit=limit,
+        )
+        # the threshold already applied to the vector side, keyword-only hits are let in by their BM25 rank
+        similarity_threshold = 0.0
+    else:
+        result = search_partitions(
+            collection_name=collection_name,
+            partition_names=partition_names,
+            query_vector=vectors,
+            score_threshold=similarity_threshold,
+            limit=limit,
+        )
+
+    scores = reranking_function.rerank(query, result) if reranking_function and result else None
+    # hybrid hits are already in fused order and carry their cosine similarity, which is filtered but not resorted
+    fused_order = scores is None and retrieval_mode == RETRIEVALMODE.HYBRID.value
+    if scores is not None:
+        similarity_threshold = 0.0
     else:
         scores = [each.score for each in result]
     docs_with_scores = list(zip(result, scores))
     if r and r > 0:
         docs_with_scores = [(d, s) for d, s in docs_with_scores if s >= r]
 
-    result = sorted(docs_with_scores, key=operator.itemgetter(1), reverse=True)
+    result = docs_with_scores if fused_order else sorted(docs_with_scores, key=operator.itemgetter(1), reverse=True)
     distances = []
     documents = []
     metadatas = []
@@ -111,6 +241,7 @@ def query_doc(
             break
         metadata = doc.payload.get("metadata", {})
         metadata["score"] = doc_score
+        metadata["collection_name"] = collection_name
         distances.append(doc_score)
         documents.append(doc.payload.get("page_content", ""))
         metadatas.append(metadata)
@@ -125,10 +256,10 @@ def query_doc(
 
 
 def get_search_context(table_info, prompt, provider, embedding_model, top_k, reranking_model, r):
-    results = []
     context = ""
     content_list = []
     content_list.append("## Knowledge base information")
+    scoped_partitions: dict[str, list[str]] = {}
     for collection_name, documents in table_info.items():
         if collection_name == "temp":
             partition_names = []
@@ -142,26 +273,52 @@ def get_search_context(table_info, prompt, provider, embedding_model, top_k, rer
         else:
             partition_names = [document.partition_name for document in documents]
         if partition_names:
-            similarity_threshold = 0.0
-
-            with session_scope() as session:
-                cur_knowledge = (
-                    session.query(Knowledge).filter(Knowledge.collection_name == collection_name).one_or_none()
-                )
-
-            if cur_knowledge:
-                similarity_threshold = cur_knowledge.similarity_threshold
-            result = query_doc(
-                collection_name=collection_name,
-                partition_names=partition_names,
-                query=prompt,
-                provider=provider,
-                embedding_model=embedding_model,
-                similarity_threshold=similarity_threshold,
-                k=top_k,
-                reranking_model=reranking_model,
-                r=r,
-            )
+            scoped_partitions[collection_name] = partition_names
+
+    with session_scope() as session:
+        knowledge_map = {
+            knowledge.collection_name: knowledge
+            for knowledge in session.query(Knowledge)
+            .filter(Knowledge.collection_name.in_(list(scoped_partitions)))
+            .all()
+        }
+
+    # the prompt is embedded once per embedding model, not once per collection
+    collection_models: dict[str, tuple[str, str]] = {}
+    for collection_name in scoped_partitions:
+        knowledge = knowledge_map.get(collection_name)
+        if knowledge and knowledge.embedding_model:
+            collection_models[collection_name] = (knowledge.provider or OLLAMA_PROVIDER, knowledge.embedding_model)
+        else:
+            collection_models[collection_name] = (provider, embedding_model)
+    vector_futures = {
+        model: _search_executor.submit(get_embedding_function(*model), prompt)
+        for model in set(collection_models.values())
+    }
+
+    search_futures = {}
+    for collection_name, partition_names in scoped_partitions.items():
+        knowledge = knowledge_map.get(collection_name)
+        model_provider, model_name = collection_models[collection_name]
+        search_futures[collection_name] = _search_executor.submit(
+            query_doc,
+            collection_name=collection_name,
+            partition_names=partition_names,
+            query=prompt,
+            provider=model_provider,
+            embedding_model=model_name,
+            similarity_threshold=knowledge.similarity_threshold if knowledge else 0.0,
+            k=(knowledge.top_k if knowledge else None) or top_k,
+            reranking_model=reranking_model,
+            r=r,
+            query_vector=vector_futures[collection_models[collection_name]].result(),
+            retrieval_mode=(knowledge.retrieval_mode if knowledge else None) or RETRIEVALMODE.VECTOR.value,
+        )
+
+    results = []
+    for collection_name, documents in table_info.items():
+        if collection_name in search_futures:
+            result = search_futures[collection_name].result()
         else:
             result = {"distances": [], "documents": [], "metadatas": []}
         logging.info(
@@ -172,20 +329,21 @@ def get_search_context(table_info, prompt, provider, embedding_model, top_k, rer
     if context:
         logging.info(f"query: {prompt}, full_text_context: {context}")
 
-    milvus_context = merge_and_sort_query_results(results, k=top_k, reverse=True)
+    milvus_context = merge_query_results_by_rank(results)
     logging.info(f"query: {prompt}, top_k: {top_k}, milvus_search_context: {milvus_context}")
 
-    context_string = ""
     citations = []
     if milvus_context:
+        source_files = [metadata.get("source", "") for metadata in milvus_context["metadatas"]]
+        # if knowledge sync with folder, the source is the file path and its name is the file name
+        file_names = {
+            file.file_id: file.file_name
+            for file in FileDB.get_files_by_ids(list({os.path.basename(each) for each in source_files}))
+        }
         for i, document in enumerate(milvus_context["documents"]):
-            source_file = milvus_context["metadatas"][i].get("source", "")
-            try:
-                source_file_id = os.path.basename(source_file)
-                source_file_name = FileDB.get_file_by_id(file_id=source_file_id).file_name
-            except Exception as ex:
-                # if knowlege sync with folder, then it must except
-                source_file_name = source_file_id
+            source_file = source_files[i]
+            source_file_id = os.path.basename(source_file)
+            source_file_name = file_names.get(source_file_id, source_file_id)
 
             content_list.append(f"- **Source of information：{source_file_name}**")
             content_list.append(f"> {document}")
@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+from configs.env import ARGO_STORAGE_PATH_EMBEDDING_CACHE
+from configs.settings import EMBEDDING_SETTINGS
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by (provider, model, sha256 of the normalized chunk text).
+
+    Vectors are kept as float32 blobs in a sqlite file. Once the stored bytes exceed `max_bytes` the least
+    recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=15)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding ("
+            "provider TEXT NOT NULL, model TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (provider, model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embedding_last_access ON embedding (last_access)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, provider: str, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # sqlite limits the number of bound variables per statement
+            for start in range(0, len(unique), 500):
+                part = unique[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding WHERE provider = ? AND model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(part))})",
+                    [provider, model, *part],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding SET last_access = ? WHERE provider = ? AND model = ? AND text_hash = ?",
+                    [(now, provider, model, row_hash) for row_hash in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for each in hashes if each in found)
+            self.misses += sum(1 for each in hashes if each not in found)
+        return found
+
+    def put_many(self, provider: str, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(provider, model, row_hash, array("f", vector).tobytes(), now) for row_hash, vector in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding (provider, model, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self._bytes += sum(len(row[3]) for row in rows)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embedding").fetchone()
+        target = int(self.max_bytes * 0.9)
+        if count == 0 or total <= target:
+            self._bytes = total
+            return
+        average = total / count
+        to_delete = int((total - target) / average) + 1
+        self._conn.execute(
+            "DELETE FROM embedding WHERE rowid IN (SELECT rowid FROM embedding ORDER BY last_access LIMIT ?)",
+            (to_delete,),
+        )
+        self._conn.commit()
+        self.evictions += to_delete
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding").fetchone()[0]
+        logging.info(f"embedding cache evicted {to_delete} vectors, size: {self._bytes} bytes")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class QueryCache:
+    """In-memory LRU of query vectors keyed by (provider, model, sha256 of the normalized query)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._vectors: OrderedDict[tuple[str, str, str], list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str, str]) -> Optional[list[float]]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, key: tuple[str, str, str], vector: list[float]):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+
+_query_cache = QueryCache(EMBEDDING_SETTINGS["QUERY_CACHE_SIZE"])
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends texts missing from the cache to the underlying model.
+
+    Documents are cached on disk. Queries go through the model's own `embed_query`, which may add an
+    instruction or prefix, and are cached apart from documents in memory.
+    """
+
+    def __init__(self, embedding: Embeddings, provider: str, model: str, cache: EmbeddingCache):
+        self.embedding = embedding
+        self.provider = provider
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        try:
+            found = self.cache.get_many(self.provider, self.model, hashes)
+        except sqlite3.Error:
+            logging.exception("Failed to read embedding cache.")
+            found = {}
+
+        missing: dict[str, str] = {}
+        for each, text in zip(hashes, texts):
+            if each not in found and each not in missing:
+                missing[each] = text
+        if missing:
+            vectors = self.embedding.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            try:
+                self.cache.put_many(self.provider, self.model, computed)
+            except sqlite3.Error:
+                logging.exception("Failed to write embedding cache.")
+            found.update(computed)
+
+        return [found[each] for each in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = (self.provider, self.model, text_hash(text))
+        vector = _query_cache.get(key)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            _query_cache.put(key, vector)
+        return vector
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                path=os.path.join(ARGO_STORAGE_PATH_EMBEDDING_CACHE, "embedding.db"),
+                max_bytes=EMBEDDING_SETTINGS["CACHE_MAX_BYTES"],
+            )
+        return _cache
+
+
+def with_embedding_cache(embedding: Embeddings, provider: str, model: str) -> Embeddings:
+    return CachedEmbeddings(embedding, provider=provider, model=model, cache=get_embedding_cache())
@@ -0,0 +1,174 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Iterable
+
+from configs.env import ARGO_STORAGE_PATH_KEYWORD_INDEX
+from core.features.embedding_cache import normalize_text
+from database.vector import get_qdrant_client
+
+_WORD = re.compile(r"[a-z0-9_]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Identifiers and words are kept whole (and split on `_`), CJK runs are cut into bigrams."""
+    tokens = []
+    for word in _WORD.findall(normalize_text(text).lower()):
+        if _CJK.match(word):
+            tokens.extend([word] if len(word) == 1 else [word[i : i + 2] for i in range(len(word) - 1)])
+            continue
+        tokens.append(word)
+        parts = [part for part in word.split("_") if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class KeywordIndex:
+    """
+    BM25 index of the chunks of one collection, kept in a sqlite FTS5 table.
+
+    Chunks are added as their points are upserted and removed with their partition, so the index follows the
+    collection incrementally. Collections ingested before the index existed are backfilled from qdrant once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=15)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_meta ("
+            "id INTEGER PRIMARY KEY, point_id TEXT NOT NULL UNIQUE, partition_name TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_meta_partition ON chunk_meta (partition_name)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunk USING fts5(tokens, tokenize = \"ascii tokenchars '_'\")"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    @property
+    def complete(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = 'complete'").fetchone()
+            return row is not None
+
+    def mark_complete(self):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('complete', '1')")
+            self._conn.commit()
+
+    def add(self, partition_name: str, chunks: Iterable[tuple[str, str]]):
+        """Index (point id, text) pairs of one partition, points already indexed are skipped."""
+        with self._lock:
+            for point_id, text in chunks:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunk_meta (point_id, partition_name) VALUES (?, ?)",
+                    (str(point_id), partition_name),
+                )
+                if cursor.rowcount:
+                    self._conn.execute(
+                        "INSERT INTO chunk (rowid, tokens) VALUES (?, ?)",
+                        (cursor.lastrowid, " ".join(tokenize(text))),
+                    )
+            self._conn.commit()
+
+    def drop_partition(self, partition_name: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM chunk WHERE rowid IN (SELECT id FROM chunk_meta WHERE partition_name = ?)",
+                (partition_name,),
+            )
+            self._conn.execute("DELETE FROM chunk_meta WHERE partition_name = ?", (partition_name,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk")
+            self._conn.execute("DELETE FROM chunk_meta")
+            self._conn.execute("DELETE FROM state")
+            self._conn.commit()
+
+    def search(self, query: str, partition_names: list[str], limit: int) -> list[tuple[str, float]]:
+        """Return (point id, bm25 score) of the best matching chunks, higher scores are better."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{token}"' for token in tokens)
+        sql = (
+            "SELECT chunk_meta.point_id, bm25(chunk) FROM chunk JOIN chunk_meta ON chunk_meta.id = chunk.rowid "
+            "WHERE chunk MATCH ?"
+        )
+        params: list = [match]
+        if partition_names:
+            sql += f" AND chunk_meta.partition_name IN ({','.join('?' * len(partition_names))})"
+            params.extend(partition_names)
+        sql += " ORDER BY bm25(chunk) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # fts5 bm25() is negated so that better matches sort first
+        return [(point_id, -score) for point_id, score in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: dict[str, KeywordIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_keyword_index(collection_name: str) -> KeywordIndex:
+    with _indexes_lock:
+        if collection_name not in _indexes:
+            _indexes[collection_name] = KeywordIndex(
+                os.path.join(ARGO_STORAGE_PATH_KEYWORD_INDEX, f"{collection_name}.db")
+            )
+        return _indexes[collection_name]
+
+
+def load_keyword_index(collection_name: str) -> KeywordIndex:
+    """Return the index of a collection, backfilling it from qdrant if it predates keyword indexing."""
+    index = get_keyword_index(collection_name)
+    if index.complete:
+        return index
+
+    logging.info(f"backfill keyword index of {collection_name}")
+    offset = None
+    while True:
+        points, offset = get_qdrant_client().scroll(
+            collection_name, limit=1000, offset=offset, with_payload=True, with_vectors=False
+        )
+        partitions: dict[str, list[tuple[str, str]]] = {}
+        for point in points:
+            payload = point.payload or {}
+            for key, value in payload.items():
+                if value == "1" and key not in {"page_content", "metadata"}:
+                    partitions.setdefault(key, []).append((str(point.id), payload.get("page_content", "")))
+        for partition_name, chunks in partitions.items():
+            index.add(partition_name, chunks)
+        if offset is None:
+            break
+    index.mark_complete()
+    return index
+
+
+def drop_keyword_index(collection_name: str):
+    with _indexes_lock:
+        index = _indexes.pop(collection_name, None)
+    if index:
+        index.close()
+    for suffix in ("", "-wal", "-shm"):
+        path = os.path.join(ARGO_STORAGE_PATH_KEYWORD_INDEX, f"{collection_name}.db{suffix}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logging.exception(f"Failed to remove keyword index {path}")
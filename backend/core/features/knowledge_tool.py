@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Callable, Optional, Union
 
@@ -39,8 +40,8 @@ class KnowledgeSearchTool(BaseTool):
     name: str = "knowledge_search"
     description: str = "support local sensitive data search"
     r: float = 0
-    collection_name: str
-    partition_names: list[str]
+    # collection name to the partitions searched in it, all partitions when empty
+    collections: dict[str, list[str]]
     hit_callbacks: list[Union[AgentAsyncCallbackHandler, DatasetIndexToolCallbackHandler]]
     args_schema: type[BaseModel] = KnowledgeSearchToolInput
     # no type will consider is str not functional     handle_tool_error = _handle_knowledge_error
@@ -51,22 +52,39 @@ class KnowledgeSearchTool(BaseTool):
 
     @classmethod
     def from_knowledge(cls, collection_name: str, partition_names: list[str], **kwargs):
-        knowledge = get_collection_by_name(collection_name=collection_name)
-        if not knowledge:
+        return cls.from_knowledge_bases({collection_name: partition_names}, **kwargs)
+
+    @classmethod
+    def from_knowledge_bases(cls, doc_map: dict[str, list[str]], **kwargs):
+        """One tool searching every knowledge base of `doc_map` in a single batched query."""
+        knowledges = [
+            knowledge
+            for knowledge in (get_collection_by_name(collection_name=name) for name in doc_map)
+            if knowledge is not None
+        ]
+        if not knowledges:
             return None
 
+        if len(knowledges) == 1:
+            name = f"knowledge_search_{knowledges[0].collection_name}"
+            description = f"Support local sensitive data search. Description: {knowledges[0].description}"
+        else:
+            name = "knowledge_search"
+            description = "Support local sensitive data search. Knowledge bases: " + "; ".join(
+                f"{knowledge.knowledge_name}: {knowledge.description}" for knowledge in knowledges
+            )
+
         instance = cls(
-            collection_name=collection_name,
-            partition_names=partition_names,
-            name=f"knowledge_search_{knowledge.collection_name}",
-            description=f"Support local sensitive data search. Description: {knowledge.description}",
+            collections={knowledge.collection_name: doc_map[knowledge.collection_name] for knowledge in knowledges},
+            name=name,
+            description=description,
             **kwargs,
         )
 
         instance.metadata = {
             "tool_type": "dataset",
-            "knowledge_name": knowledge.knowledge_name,
-            "collection_name": knowledge.collection_name,
+            "knowledge_name": ", ".join(knowledge.knowledge_name for knowledge in knowledges),
+            "collection_name": ", ".join(knowledge.collection_name for knowledge in knowledges),
         }
 
         return instance
@@ -80,33 +98,30 @@ class KnowledgeSearchTool(BaseTool):
                 await hit_callback.on_query(query, self.metadata)
 
             table_info = {}
-            knowledge = get_collection_by_name(collection_name=self.collection_name)
-            if knowledge is None:
+            knowledges = {}
+            empty = []
+            for collection_name, partition_names in self.collections.items():
+                knowledge = get_collection_by_name(collection_name=collection_name)
+                if knowledge is None:
+                    continue
+                documents = self._finished_documents(collection_name, partition_names)
+                if len(documents) == 0:
+                    empty.append(knowledge.knowledge_name)
+                    continue
+                knowledges[collection_name] = knowledge
+                table_info[collection_name] = documents
+            if not table_info:
+                if empty:
+                    raise ToolException(f"knowledge: {', '.join(empty)} has no document")
                 return ""
 
-            top_k = knowledge.top_k
-            if not top_k:
-                top_k = FILE_SETTINGS["TOP_K"]
-            provider_name = knowledge.provider or OLLAMA_PROVIDER
-            embedding_model = knowledge.embedding_model
-
-            documents = []
-            if len(self.partition_names) > 0:
-                for partition_name in self.partition_names:
-                    document = get_partition_by_partition_name(partition_name=partition_name)
-                    if document and document.document_status == DOCUMENTSTATUS.FINISH.value:
-                        documents.append(document)
-                table_info[self.collection_name] = documents
-            else:
-                documents = get_documents_by_collection_name(collection_name=self.collection_name)
-                documents = [
-                    document for document in documents if document.document_status == DOCUMENTSTATUS.FINISH.value
-                ]
-            if len(documents) == 0:
-                raise ToolException(f"knowledge: {knowledge.knowledge_name} has no document")
-            table_info[self.collection_name] = documents
-            context_string, citations = get_search_context(
-                table_info, query, provider_name, embedding_model, top_k, None, self.r
+            # embedding model and top_k are resolved per collection by the search, these are the fallbacks
+            first = next(iter(knowledges.values()))
+            top_k = first.top_k or FILE_SETTINGS["TOP_K"]
+            provider_name = first.provider or OLLAMA_PROVIDER
+            embedding_model = first.embedding_model
+            context_string, citations = await asyncio.to_thread(
+                get_search_context, table_info, query, provider_name, embedding_model, top_k, None, self.r
             )
 
             if self.hit_callbacks:
@@ -114,6 +129,7 @@ class KnowledgeSearchTool(BaseTool):
                 resource_number = 1
                 for citation in citations:
                     metadata = citation.get("metadata", {})
+                    knowledge = knowledges.get(metadata.get("collection_name", ""), first)
                     source = {
                         "position": resource_number,
                         "dataset_id": knowledge.collection_name,
@@ -135,3 +151,13 @@ class KnowledgeSearchTool(BaseTool):
         except Exception as ex:
             logging.exception("Knowledge tool error")
             raise ToolException(str(ex))
+
+    @staticmethod
+    def _finished_documents(collection_name: str, partition_names: list[str]) -> list:
+        if len(partition_names) > 0:
+            documents = [get_partition_by_partition_name(partition_name=name) for name in partition_names]
+        else:
+            documents = get_documents_by_collection_name(collection_name=collection_name)
+        return [
+            document for document in documents if document and document.document_status == DOCUMENTSTATUS.FINISH.value
+        ]
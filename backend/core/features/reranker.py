@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import numpy as np
+from qdrant_client import models
+
+from configs.env import ARGO_STORAGE_PATH_RERANK_MODELS
+from configs.settings import RERANK_SETTINGS
+from core.features.embedding_cache import text_hash
+
+MODEL_FILES = ["model_quantized.onnx", "model_int8.onnx", "model.onnx"]
+
+
+class CrossEncoderReranker:
+    """CPU cross-encoder exported to ONNX, e.g. an int8 ms-marco-MiniLM or bge-reranker, scored with sigmoid."""
+
+    def __init__(self, model_dir: str):
+        # optional dependency, only needed when a rerank model is configured
+        try:
+            import onnxruntime
+        except ImportError as exc:
+            raise ImportError(
+                "onnxruntime is required for reranking, install the rerank extra: poetry install --extras rerank"
+            ) from exc
+        from tokenizers import Tokenizer
+
+        model_path = next(
+            (
+                os.path.join(model_dir, sub_dir, file_name)
+                for sub_dir in ("", "onnx")
+                for file_name in MODEL_FILES
+                if os.path.isfile(os.path.join(model_dir, sub_dir, file_name))
+            ),
+            None,
+        )
+        if model_path is None:
+            raise FileNotFoundError(f"no onnx model found in {model_dir}")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=RERANK_SETTINGS["MAX_LENGTH"])
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = RERANK_SETTINGS["THREADS"]
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {each.name for each in self.session.get_inputs()}
+
+    def predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        encodings = self.tokenizer.encode_batch(pairs)
+        inputs = {
+            "input_ids": np.array([each.ids for each in encodings], dtype=np.int64),
+            "attention_mask": np.array([each.attention_mask for each in encodings], dtype=np.int64),
+            "token_type_ids": np.array([each.type_ids for each in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        if logits.ndim == 2:
+            # single relevance logit, or (irrelevant, relevant) for two-class heads
+            logits = logits[:, -1]
+        return (1 / (1 + np.exp(-logits))).tolist()
+
+
+class RerankStage:
+    """
+    Reranks over-fetched vector hits in batches within a latency budget.
+
+    Scores are cached per (model, query, point). When the budget runs out the caller keeps the vector order;
+    the batch already running finishes in the background and fills the cache for the next identical query, the
+    batches not yet started are cancelled. A query that finds the rerank thread busy with more than
+    MAX_QUEUED_BATCHES batches skips reranking rather than queueing behind them.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+    _queued = 0
+    _queued_lock = threading.Lock()
+
+    def __init__(self, model_name: str, reranker: CrossEncoderReranker):
+        self.model_name = model_name
+        self.reranker = reranker
+        self._cache: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, points: list[models.ScoredPoint]) -> Optional[list[float]]:
+        deadline = time.monotonic() + RERANK_SETTINGS["BUDGET"]
+        query_hash = text_hash(query)
+        keys = [(self.model_name, query_hash, str(point.id)) for point in points]
+        scores = self._cached(keys)
+
+        missing = [index for index, key in enumerate(keys) if key not in scores]
+        batch_size = RERANK_SETTINGS["BATCH_SIZE"]
+        batches = [missing[start : start + batch_size] for start in range(0, len(missing), batch_size)]
+        if not self._admit(len(batches)):
+            logging.warning(f"rerank with {self.model_name} is busy, keep vector order")
+            return None
+
+        futures = []
+        for batch in batches:
+            pairs = [(query, (points[index].payload or {}).get("page_content", "")) for index in batch]
+            future = self._executor.submit(self._score, [keys[index] for index in batch], pairs)
+            future.add_done_callback(self._batch_done)
+            futures.append((batch, future))
+
+        for batch, future in futures:
+            try:
+                batch_scores = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logging.warning(f"rerank with {self.model_name} exceeded its budget, keep vector order")
+                self._cancel(futures)
+                return None
+            except Exception:
+                logging.exception(f"Failed to rerank with {self.model_name}")
+                self._cancel(futures)
+                return None
+            scores.update(zip((keys[index] for index in batch), batch_scores))
+
+        return [scores[key] for key in keys]
+
+    @classmethod
+    def _admit(cls, count: int) -> bool:
+        with cls._queued_lock:
+            # an idle thread takes a query of any size
+            if cls._queued and cls._queued + count > RERANK_SETTINGS["MAX_QUEUED_BATCHES"]:
+                return False
+            cls._queued += count
+            return True
+
+    @classmethod
+    def _batch_done(cls, future: Future):
+        with cls._queued_lock:
+            cls._queued -= 1
+
+    @staticmethod
+    def _cancel(futures: list[tuple[list[int], Future]]):
+        # only batches not yet started can be cancelled, the running one is left to fill the cache
+        for _, future in futures:
+            future.cancel()
+
+    def _score(self, keys: list[tuple[str, str, str]], pairs: list[tuple[str, str]]) -> list[float]:
+        batch_scores = self.reranker.predict(pairs)
+        with self._lock:
+            for key, score in zip(keys, batch_scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > RERANK_SETTINGS["CACHE_SIZE"]:
+                self._cache.popitem(last=False)
+        return batch_scores
+
+    def _cached(self, keys: list[tuple[str, str, str]]) -> dict[tuple[str, str, str], float]:
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._cache:
+                    found[key] = self._cache[key]
+                    self._cache.move_to_end(key)
+            return found
+
+
+_stages: dict[str, Optional[RerankStage]] = {}
+_stages_lock = threading.Lock()
+
+
+def get_rerank_stage(model_name: Optional[str]) -> Optional[RerankStage]:
+    model_name = model_name or RERANK_SETTINGS["MODEL"]
+    if not model_name:
+        return None
+    with _stages_lock:
+        if model_name not in _stages:
+            model_dir = os.path.join(ARGO_STORAGE_PATH_RERANK_MODELS, model_name)
+            try:
+                _stages[model_name] = RerankStage(model_name, CrossEncoderReranker(model_dir))
+                logging.info(f"rerank model loaded: {model_dir}")
+            except Exception:
+                # remembered as unavailable so a broken model is not reloaded on every query
+                logging.exception(f"Failed to load rerank model {model_dir}")
+                _stages[model_name] = None
+        return _stages[model_name]
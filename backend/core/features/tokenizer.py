@@ -1,12 +1,16 @@
+import hashlib
 import logging
-from threading import Lock
-from typing import Any
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from typing import Any, Optional
 
 from sentencepiece import SentencePieceProcessor
 from tokenizers import Tokenizer
 
 # Todo: simplify GPT2Tokenizer to delete transformers dependency, need to optimize later
 # from transformers import GPT2Tokenizer
+from configs.settings import TOKENIZER_SETTINGS
 from core.entities.application_entities import ModelConfigEntity
 from core.model_providers.manager import ModelMode
 from utils.path import app_path
@@ -28,70 +32,131 @@ TOKENIZER_PATHS = {
     "gpt2": app_path("resources/tokenizers/gpt2/"),
 }
 
-_lock = Lock()
-_tokenizer_cache: dict[str, Any] = {}
 
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
 
-def load_tokenizer(model_name):
-    with _lock:
-        match = next(
-            ((key, path) for key, path in TOKENIZER_PATHS.items() if model_name.find(key) != -1),
-            None,
-        )
-        if not match:
-            return None
 
-        key, path = match
+class _Encoder:
+    """A loaded tokenizer, counting one text or a batch of them; both tokenizer kinds are thread-safe."""
+
+    def __init__(self, key: str, tokenizer: Any):
+        self.key = key
+        self.tokenizer = tokenizer
+
+    def count_many(self, texts: list[str]) -> list[int]:
+        if isinstance(self.tokenizer, Tokenizer):
+            return [len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts)]
+        return [len(ids) for ids in self.tokenizer.Encode(texts)]
+
+
+class TokenizationService:
+    """
+    Token counting for prompt budgets.
+
+    Tokenizers are loaded once per model family into a registry, the first lookup of a family loads it and
+    later lookups only read the registry. Counts are kept in an LRU keyed by (family, digest of the text), so
+    a text counted again, a chat message or a world info entry of the previous prompt, costs a hash.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self._load_lock = threading.Lock()
+        self._encoders: dict[str, Optional[_Encoder]] = {}
+        self._families: dict[str, Optional[str]] = {}
+        self._cache_lock = threading.Lock()
+        self._counts: OrderedDict[tuple[str, bytes], int] = OrderedDict()
 
-        tokenizer = None
-        if key in _tokenizer_cache:
-            tokenizer = _tokenizer_cache[key]
-        else:
+    def encoder(self, model_name: str) -> Optional[_Encoder]:
+        """The tokenizer of the family of a model, None when there is none or it failed to load."""
+        model_name = model_name.lower()
+        if model_name not in self._families:
+            self._families[model_name] = next((key for key in TOKENIZER_PATHS if model_name.find(key) != -1), None)
+        key = self._families[model_name]
+        if key is None:
+            return None
+        if key not in self._encoders:
+            with self._load_lock:
+                if key not in self._encoders:
+                    self._encoders[key] = self._load(key, TOKENIZER_PATHS[key])
+        return self._encoders[key]
+
+    def count(
+        self,
+        text: str,
+        model_name: str,
+        fallback: Optional[str] = "llama",
+        estimate: Callable[[str], int] = estimate_tokens,
+    ) -> int:
+        return self.count_many([text], model_name, fallback=fallback, estimate=estimate)[0]
+
+    def count_many(
+        self,
+        texts: Sequence[str],
+        model_name: str,
+        fallback: Optional[str] = "llama",
+        estimate: Callable[[str], int] = estimate_tokens,
+    ) -> list[int]:
+        """
+        Token counts of `texts` with the tokenizer of `model_name`, else of `fallback`, else `estimate`.
+        The texts missing from the cache are encoded in one batch.
+        """
+        encoder = self.encoder(model_name) or (self.encoder(fallback) if fallback else None)
+        if encoder is None:
+            return [estimate(text) for text in texts]
+
+        keys = [(encoder.key, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()) for text in texts]
+        counts: list[Optional[int]] = [None] * len(texts)
+        with self._cache_lock:
+            for index, key in enumerate(keys):
+                count = self._counts.get(key)
+                if count is not None:
+                    self._counts.move_to_end(key)
+                    counts[index] = count
+        missing = [index for index, count in enumerate(counts) if count is None]
+        if not missing:
+            return counts  # type: ignore[return-value]
+
+        try:
+            encoded = encoder.count_many([texts[index] for index in missing])
+        except Exception as e:
+            logging.warning(f"An error occurred while counting tokens for {model_name}, {e}")
+            encoded = [estimate(texts[index]) for index in missing]
+        with self._cache_lock:
+            for index, count in zip(missing, encoded):
+                counts[index] = self._counts[keys[index]] = count
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return counts  # type: ignore[return-value]
+
+    def clear(self):
+        with self._cache_lock:
+            self._counts.clear()
+
+    @staticmethod
+    def _load(key: str, path: str) -> Optional[_Encoder]:
+        try:
             if path.endswith(".model"):
                 tokenizer = SentencePieceProcessor()
                 tokenizer.LoadFromFile(path)
-            elif path.endswith(".json"):
-                tokenizer = Tokenizer.from_file(path)
-            else:
-                # Todo: simplify GPT2Tokenizer to delete transformers dependency
-                # tokenizer = GPT2Tokenizer.from_pretrained(path)
-                pass
-
-            _tokenizer_cache[key] = tokenizer
-
-        if isinstance(tokenizer, Tokenizer):
-            return lambda text: len(tokenizer.encode(text).tokens)
-        if isinstance(tokenizer, SentencePieceProcessor):
-            return lambda text: len(tokenizer.EncodeAsPieces(text))
+                return _Encoder(key, tokenizer)
+            if path.endswith(".json"):
+                return _Encoder(key, Tokenizer.from_file(path))
+        except Exception as e:
+            logging.warning(f"Load tokenizer {key} from {path} failed: {e}")
         # Todo: simplify GPT2Tokenizer to delete transformers dependency
-        # if isinstance(tokenizer, GPT2Tokenizer):
-        #     return lambda text: len(tokenizer.encode(text))
-
+        # tokenizer = GPT2Tokenizer.from_pretrained(path)
         return None
 
 
-def get_token_count(text, model_config: ModelConfigEntity):
-    model_mode = model_config.mode
-    model_name = model_config.model.lower()
+tokenization_service = TokenizationService(TOKENIZER_SETTINGS["CACHE_SIZE"])
 
-    use_fallback_estimate = False
-    if model_mode == ModelMode.GENERATE.value:
+
+def get_token_count(text, model_config: ModelConfigEntity):
+    if model_config.mode == ModelMode.GENERATE.value:
         fallback_model = "llama"
     else:
         fallback_model = "gpt2"
-        use_fallback_estimate = True
-
-    try:
-        tokenizer_func = load_tokenizer(model_name) or load_tokenizer(fallback_model)
-        if tokenizer_func:
-            return tokenizer_func(str(text))
-        else:
-            # Todo: need to optimize
-            return len(text)
-    except Exception as e:
-        logging.warning(f"An error occurred while counting tokens for {model_name}, {e}")
-        pass
-
-    if use_fallback_estimate:
-        return len(text) + CHARS_PER_TOKEN - 1
-    return 0
+
+    # Todo: need to optimize, models without a tokenizer count a token per character
+    return tokenization_service.count(str(text), model_config.model, fallback=fallback_model, estimate=len)
@@ -29,6 +29,14 @@ class FileDB:
             file = session.query(File).filter(File.file_id == file_id).one_or_none()
             return file
 
+    @staticmethod
+    def get_files_by_ids(file_ids: list[str]) -> list[File]:
+        if not file_ids:
+            return []
+        with session_scope() as session:
+            files = session.query(File).filter(File.file_id.in_(file_ids)).all()
+            return files
+
     @staticmethod
     def delete_file(file_id: str):
         with session_scope() as session:
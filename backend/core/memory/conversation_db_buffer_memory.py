@@ -1,23 +1,12 @@
-import re
-from typing import Any, Optional, Union
+import asyncio
+from typing import Any, Optional
 
 from langchain.memory.chat_memory import BaseChatMemory
 from langchain_core.language_models import BaseLanguageModel
-from langchain_core.messages import (
-    AIMessage,
-    BaseMessage,
-    HumanMessage,
-    get_buffer_string,
-)
+from langchain_core.messages import BaseMessage, get_buffer_string
 
-from core.file.message_file_parser import MessageFileParser
-from models.conversation import filter_message
-
-
-def trim_answer(content: str) -> str:
-    # trim <think>
-    res = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL)
-    return res
+from configs.settings import MEMORY_SETTINGS
+from core.memory.conversation_memory_cache import conversation_memory_cache
 
 
 class ConversationBufferDBMemory(BaseChatMemory):
@@ -28,55 +17,32 @@ class ConversationBufferDBMemory(BaseChatMemory):
     ai_prefix: str = "Assistant"
     llm: Optional[BaseLanguageModel] = None
     memory_key: str = "chat_history"
-    max_token_limit: int = 20000
-    message_limit: int = 500
+    max_token_limit: int = MEMORY_SETTINGS["MAX_TOKENS"]
+    summarize_tail: bool = MEMORY_SETTINGS["SUMMARIZE_TAIL"]
 
     @property
     def buffer(self) -> list[BaseMessage]:
-        """String buffer of memory."""
-        # fetch limited messages desc, and return reversed
-        chat_messages: list[BaseMessage] = []
+        """Newest messages of the conversation within max_token_limit, served from the memory cache."""
         if not self.conversation_id or not self.llm:
-            return chat_messages
+            return []
 
-        messages = filter_message(
-            conversation_id=self.conversation_id,
+        return conversation_memory_cache.window(
+            self.conversation_id,
+            model_name=getattr(self.llm, "model", "") or "",
+            max_tokens=self.max_token_limit,
             before_message_id=self.regen_message_id,
-            message_limit=self.message_limit,
+            human_prefix=self.human_prefix,
+            ai_prefix=self.ai_prefix,
+            summarize=self._summarize if self.summarize_tail else None,
         )
 
-        messages = list(reversed(messages))
-        message_file_parser = MessageFileParser(bot_id=self.bot_id)
-
-        for message in messages:
-            if message.query or message.files:
-                if message.files:
-                    file_objs = message_file_parser.transform_message_files(message.files)
-                    if not file_objs:
-                        chat_messages.append(HumanMessage(name=self.human_prefix, content=message.query))
-                    else:
-                        prompt_message_contents: list[Union[str, dict]] = [{"type": "text", "text": message.query}]
-                        for file_obj in file_objs:
-                            prompt_message_contents.append(file_obj.prompt_message_content)
-
-                        chat_messages.append(HumanMessage(name=self.human_prefix, content=prompt_message_contents))
-                elif message.query:
-                    chat_messages.append(HumanMessage(name=self.human_prefix, content=message.query))
-            if message.answer:
-                chat_messages.append(AIMessage(name=self.ai_prefix, content=trim_answer(message.answer)))
-
-        if not chat_messages:
-            return []
-
-        # prune the chat message if it exceeds the max token limit
-        # curr_buffer_length = self.llm.get_num_tokens_from_messages(chat_messages)
-        # if curr_buffer_length > self.max_token_limit:
-        #     pruned_memory = []
-        #     while curr_buffer_length > self.max_token_limit and chat_messages:
-        #         pruned_memory.append(chat_messages.pop(0))
-        #         curr_buffer_length = self.llm.get_num_tokens_from_messages(chat_messages)
+    async def abuffer(self) -> list[BaseMessage]:
+        """`buffer` off the event loop, building the window may tokenize and summarize through the llm."""
+        return await asyncio.to_thread(lambda: self.buffer)
 
-        return chat_messages
+    def _summarize(self, prompt: str) -> str:
+        result = self.llm.invoke(prompt)
+        return str(result.content) if isinstance(result, BaseMessage) else str(result)
 
     @property
     def memory_variables(self) -> list[str]:
@@ -0,0 +1,241 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Union
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from configs.settings import MEMORY_SETTINGS
+from core.features.tokenizer import tokenization_service
+from core.file.message_file_parser import MessageFileParser
+from database.db import session_scope
+from models.conversation import Message, filter_message
+
+SUMMARY_PROMPT = """Summarize the conversation below in a few sentences, keep names, facts and decisions. \
+If a previous summary is given, extend it with the new turns.
+
+Previous summary:
+{summary}
+
+New turns:
+{turns}
+
+Summary:"""
+
+# turns counted at once when a window reaches turns not counted yet
+COUNT_BATCH = 32
+
+
+def trim_answer(content: str) -> str:
+    # trim <think>
+    res = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL)
+    return res
+
+
+def _text_of(content: Union[str, list]) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+@dataclass
+class _Turn:
+    """The prompt messages of one stored message, built once, copied out for every prompt."""
+
+    message_id: str
+    created_at: datetime
+    messages: list[BaseMessage]
+    # token count of the turn per model, counted the first time a window for that model is cut
+    tokens: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class _History:
+    turns: list[_Turn] = field(default_factory=list)
+    # created_at of the newest turn, the next read only loads what was saved after it
+    cursor: Optional[datetime] = None
+    loaded: bool = False
+    # (id of the newest turn the summary covers, summary)
+    summary: tuple[str, str] = ("", "")
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ConversationMemoryCache:
+    """
+    Chat history of the recent conversations, kept as prompt messages.
+
+    The first read of a conversation loads its last `message_limit` messages; later reads only load the
+    messages saved since, so assembling the history of a long chat costs the new turns instead of the whole
+    chat. Token counts are kept per turn and model, `window` returns the newest turns that fit a token budget.
+    Edits, deletes, regenerations and stops drop the conversation through `invalidate`.
+    """
+
+    def __init__(self, max_conversations: int, message_limit: int):
+        self.max_conversations = max_conversations
+        self.message_limit = message_limit
+        self._lock = threading.Lock()
+        self._histories: OrderedDict[str, _History] = OrderedDict()
+
+    def window(
+        self,
+        conversation_id: str,
+        model_name: str,
+        max_tokens: int,
+        before_message_id: Optional[str] = None,
+        human_prefix: str = "Human",
+        ai_prefix: str = "Assistant",
+        summarize: Optional[Callable[[str], str]] = None,
+    ) -> list[BaseMessage]:
+        """
+        Fresh copies of the newest messages within `max_tokens` (0 is no budget), oldest first, callers may
+        change them.
+        With `summarize`, the turns that do not fit are folded into a summary placed in front.
+        """
+        history = self._history(conversation_id)
+        with history.lock:
+            self._load(conversation_id, history)
+            turns = history.turns
+            if before_message_id:
+                turns = self._before(turns, before_message_id)
+
+            start, used = len(turns), 0
+            while start > 0:
+                if model_name not in turns[start - 1].tokens:
+                    # count ahead in batches, the budget usually stops the walk long before the first turn
+                    self._count(turns[max(0, start - COUNT_BATCH) : start], model_name)
+                tokens = turns[start - 1].tokens[model_name]
+                if max_tokens > 0 and used + tokens > max_tokens:
+                    break
+                used += tokens
+                start -= 1
+
+            summary = ""
+            if summarize is not None and start > 0:
+                summary = self._summary(history, turns[:start], summarize)
+
+        messages: list[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        for turn in turns[start:]:
+            for message in turn.messages:
+                prefix = human_prefix if isinstance(message, HumanMessage) else ai_prefix
+                messages.append(message.model_copy(update={"name": prefix}))
+        return messages
+
+    def invalidate(self, conversation_id: str, created_at: Optional[datetime] = None):
+        """
+        Drop the history of a conversation. With `created_at`, a message of that time was saved: it is picked
+        up by the next read unless it is older than what was loaded already.
+        """
+        with self._lock:
+            history = self._histories.get(conversation_id)
+            if history is None:
+                return
+            if created_at is not None and (history.cursor is None or created_at > history.cursor):
+                return
+            del self._histories[conversation_id]
+
+    def clear(self):
+        with self._lock:
+            self._histories.clear()
+
+    def _history(self, conversation_id: str) -> _History:
+        with self._lock:
+            history = self._histories.get(conversation_id)
+            if history is None:
+                history = self._histories[conversation_id] = _History()
+                while len(self._histories) > self.max_conversations:
+                    self._histories.popitem(last=False)
+            else:
+                self._histories.move_to_end(conversation_id)
+            return history
+
+    def _load(self, conversation_id: str, history: _History):
+        rows = filter_message(
+            conversation_id=conversation_id,
+            created_after=history.cursor if history.loaded else None,
+            message_limit=self.message_limit,
+        )
+        if not rows and history.loaded:
+            return
+
+        parser = MessageFileParser(bot_id="")
+        known = {turn.message_id for turn in history.turns}
+        for row in reversed(rows):
+            if row.id not in known:
+                history.turns.append(_Turn(row.id, row.created_at, self._messages(row, parser)))
+        if len(history.turns) > self.message_limit:
+            del history.turns[: len(history.turns) - self.message_limit]
+        if history.turns:
+            history.cursor = history.turns[-1].created_at
+        history.loaded = True
+
+    @staticmethod
+    def _messages(row: Message, parser: MessageFileParser) -> list[BaseMessage]:
+        messages: list[BaseMessage] = []
+        if row.files:
+            file_objs = parser.transform_message_files(row.files)
+            if file_objs:
+                contents: list[Union[str, dict]] = [{"type": "text", "text": row.query}]
+                contents.extend(file_obj.prompt_message_content for file_obj in file_objs)
+                messages.append(HumanMessage(content=contents))
+            else:
+                messages.append(HumanMessage(content=row.query or ""))
+        elif row.query:
+            messages.append(HumanMessage(content=row.query))
+        if row.answer:
+            messages.append(AIMessage(content=trim_answer(row.answer)))
+        return messages
+
+    @staticmethod
+    def _count(turns: list[_Turn], model_name: str):
+        """Count the turns not counted for the model yet, all their messages in one batch."""
+        pending = [turn for turn in turns if model_name not in turn.tokens]
+        texts = [_text_of(m.content) for turn in pending for m in turn.messages]
+        counts = iter(tokenization_service.count_many(texts, model_name))
+        for turn in pending:
+            turn.tokens[model_name] = sum(next(counts) for _ in turn.messages)
+
+    @staticmethod
+    def _before(turns: list[_Turn], message_id: str) -> list[_Turn]:
+        for index, turn in enumerate(turns):
+            if turn.message_id == message_id:
+                return turns[:index]
+        with session_scope() as session:
+            row = session.query(Message.created_at).filter(Message.id == message_id).first()
+        if row is None:
+            return turns
+        return [turn for turn in turns if turn.created_at < row.created_at]
+
+    @staticmethod
+    def _summary(history: _History, dropped: list[_Turn], summarize: Callable[[str], str]) -> str:
+        covered_id, summary = history.summary
+        if covered_id == dropped[-1].message_id:
+            return summary
+
+        # extend the summary with the turns dropped since, or start over when it covers none of them
+        start = next((index + 1 for index, turn in enumerate(dropped) if turn.message_id == covered_id), 0)
+        if start == 0:
+            summary = ""
+        turns = "\n".join(
+            f"{'Human' if isinstance(m, HumanMessage) else 'Assistant'}: {_text_of(m.content)}"
+            for turn in dropped[start:]
+            for m in turn.messages
+        )
+        try:
+            summary = summarize(SUMMARY_PROMPT.format(summary=summary or "(none)", turns=turns)).strip()
+        except Exception:
+            logging.exception("Summarize conversation history failed")
+            return history.summary[1]
+        history.summary = (dropped[-1].message_id, summary)
+        return summary
+
+
+conversation_memory_cache = ConversationMemoryCache(
+    max_conversations=MEMORY_SETTINGS["CACHE_CONVERSATIONS"],
+    message_limit=MEMORY_SETTINGS["MESSAGE_LIMIT"],
+)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import weakref
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+from configs.settings import MODEL_INSTANCE_SETTINGS
+
+
+class _LoopAsyncTransport(httpx.AsyncBaseTransport):
+    """Keeps one connection pool per event loop, async connections cannot move between loops."""
+
+    def __init__(self, transport_kwargs: dict[str, Any]):
+        self._transport_kwargs = transport_kwargs
+        self._transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        with self._lock:
+            transports = list(self._transports.values())
+        for transport in transports:
+            await transport.aclose()
+
+
+class _Host:
+    def __init__(self, settings: dict[str, Any]):
+        limits = httpx.Limits(
+            max_connections=settings["MAX_CONNECTIONS"],
+            max_keepalive_connections=settings["MAX_KEEPALIVE_CONNECTIONS"],
+            keepalive_expiry=settings["KEEPALIVE_EXPIRY"],
+        )
+        # the openai client passes its own timeout with every request
+        self.client = httpx.Client(transport=httpx.HTTPTransport(limits=limits), follow_redirects=True)
+        self.async_client = httpx.AsyncClient(transport=_LoopAsyncTransport({"limits": limits}), follow_redirects=True)
+
+
+class ProviderHttpClients:
+    """
+    Keep-alive httpx clients for model provider APIs, one connection pool per host.
+
+    Every chat and embedding client built for a host sends its requests through the same pool, so a new
+    message reuses the open TLS connections instead of dialing the provider again.
+    """
+
+    def __init__(self, settings: dict[str, Any]):
+        self.settings = settings
+        self._hosts: dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, base_url: str) -> _Host:
+        origin = _origin(base_url)
+        with self._lock:
+            host = self._hosts.get(origin)
+            if host is None:
+                host = self._hosts[origin] = _Host(self.settings)
+            return host
+
+    def client(self, base_url: str) -> httpx.Client:
+        return self._host(base_url).client
+
+    def async_client(self, base_url: str) -> httpx.AsyncClient:
+        return self._host(base_url).async_client
+
+    def close(self):
+        with self._lock:
+            hosts, self._hosts = list(self._hosts.values()), {}
+        for host in hosts:
+            host.client.close()
+
+
+def _origin(base_url: str) -> str:
+    parts = urlsplit(base_url)
+    if not parts.scheme or not parts.netloc:
+        raise ValueError(f"invalid provider base url: {base_url!r}")
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+provider_http_clients = ProviderHttpClients(MODEL_INSTANCE_SETTINGS)
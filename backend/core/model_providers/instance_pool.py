@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+
+def fingerprint(kwargs: dict[str, Any]) -> str:
+    """Digest of the constructor arguments of an instance, api keys included, so keys are not kept in clear."""
+    return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ModelInstancePool:
+    """
+    Built chat and embedding instances, least recently used first out.
+
+    Instances are keyed by (provider, mode, class, fingerprint of the arguments), so new credentials or
+    parameters build a new instance; `invalidate` drops the instances of a provider whose settings changed.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._instances: OrderedDict[tuple[str, str, str, str], Any] = OrderedDict()
+
+    def get(self, key: tuple[str, str, str, str], build: Callable[[], Any]) -> Any:
+        with self._lock:
+            instance = self._instances.get(key)
+            if instance is not None:
+                self._instances.move_to_end(key)
+                return instance
+
+        # built outside the lock, a concurrent build of the same key keeps the first one
+        instance = build()
+        if self.max_size <= 0:
+            return instance
+        with self._lock:
+            instance = self._instances.setdefault(key, instance)
+            self._instances.move_to_end(key)
+            while len(self._instances) > self.max_size:
+                self._instances.popitem(last=False)
+        return instance
+
+    def invalidate(self, provider: str):
+        with self._lock:
+            for key in [key for key in self._instances if key[0] == provider]:
+                del self._instances[key]
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._instances)
@@ -11,7 +11,10 @@ from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseLanguageModel
 from langchain_openai import OpenAIEmbeddings
 
+from configs.settings import MODEL_INSTANCE_SETTINGS
 from core.model_providers.constants import OLLAMA_PROVIDER
+from core.model_providers.http_clients import provider_http_clients
+from core.model_providers.instance_pool import ModelInstancePool, fingerprint
 from core.model_providers.loader import ProviderInfo, ProviderLoader
 from core.model_providers.parameter import resolve_parameters
 from core.model_providers.utils import extract_base_provider
@@ -52,6 +55,7 @@ class ModelProviderManager:
     def __init__(self):
         self.providers_cfg: dict[str, ProviderInfo] = {}
         self.loader = ProviderLoader(base_dir=app_path("core/model_providers"))
+        self.instances = ModelInstancePool(MODEL_INSTANCE_SETTINGS["POOL_SIZE"])
 
     def load_all(self):
         self.providers_cfg = self.loader.load_all()
@@ -99,15 +103,17 @@ class ModelProviderManager:
         if not class_path:
             raise ValueError(f"No class mapped for mode '{mode.value}' in provider '{provider}'")
 
-        provider_cls = self._import_class(class_path)
-        instance = provider_cls(**kwargs)
-
-        if not isinstance(instance, BaseLanguageModel):
-            raise TypeError(
-                f"The class '{class_path}' is not a subclass of langchain_core.language_models.BaseLanguageModel"
-            )
+        def build() -> BaseLanguageModel:
+            instance = self._build(class_path, kwargs)
+            if not isinstance(instance, BaseLanguageModel):
+                raise TypeError(
+                    f"The class '{class_path}' is not a subclass of langchain_core.language_models.BaseLanguageModel"
+                )
+            return instance
 
-        return cast(BaseLanguageModel, instance)
+        instance = self.instances.get((provider, mode.value, class_path, fingerprint(kwargs)), build)
+        # callers set callbacks on the instance, each gets its own copy sharing the built clients
+        return cast(BaseLanguageModel, instance.model_copy())
 
     def get_embedding_instance(
         self,
@@ -147,16 +153,18 @@ class ModelProviderManager:
         if not class_path:
             raise ValueError(f"No class mapped for mode '{ModelMode.EMBEDDING.value}' in provider '{provider}'")
 
-        provider_cls = self._import_class(class_path)
-        instance = provider_cls(**kwargs)
-
-        if isinstance(instance, OpenAIEmbeddings):
-            instance.check_embedding_ctx_length = False
+        def build() -> Embeddings:
+            instance = self._build(class_path, kwargs)
+            if isinstance(instance, OpenAIEmbeddings):
+                instance.check_embedding_ctx_length = False
+            if not isinstance(instance, Embeddings):
+                raise TypeError(f"The class '{class_path}' is not a subclass of langchain_core.embeddings.Embeddings")
+            return instance
 
-        if not isinstance(instance, Embeddings):
-            raise TypeError(f"The class '{class_path}' is not a subclass of langchain_core.embeddings.Embeddings")
-
-        return cast(Embeddings, instance)
+        return cast(
+            Embeddings,
+            self.instances.get((provider, ModelMode.EMBEDDING.value, class_path, fingerprint(kwargs)), build),
+        )
 
     def get_support_chat_models(self, provider_name: str) -> dict[str, list[str]]:
         base_provider = extract_base_provider(provider_name)
@@ -187,6 +195,22 @@ class ModelProviderManager:
         base_provider = extract_base_provider(provider)
         return self.providers_cfg.get(base_provider)
 
+    def _build(self, class_path: str, kwargs: dict[str, Any]):
+        provider_cls = self._import_class(class_path)
+        fields = getattr(provider_cls, "model_fields", {})
+        base_url = kwargs.get("base_url")
+        if base_url and "http_client" in fields and "http_async_client" in fields:
+            # OpenAI compatible clients, send them through the keep-alive pool of their host
+            try:
+                kwargs = {
+                    **kwargs,
+                    "http_client": provider_http_clients.client(base_url),
+                    "http_async_client": provider_http_clients.async_client(base_url),
+                }
+            except ValueError:
+                logging.warning(f"Provider base url {base_url!r} is not a url, use an unpooled client")
+        return provider_cls(**kwargs)
+
     def _import_class(self, class_path: str):
         module_path, class_name = class_path.rsplit(".", 1)
         module = importlib.import_module(module_path)
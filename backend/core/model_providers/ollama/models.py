@@ -0,0 +1,37 @@
+from typing import Self
+
+from langchain_ollama import ChatOllama as LCChatOllama
+from langchain_ollama import OllamaEmbeddings as LCOllamaEmbeddings
+from langchain_ollama import OllamaLLM as LCOllamaLLM
+from ollama import AsyncClient, Client
+from pydantic import model_validator
+
+from core.model_providers.ollama.ollama_client import client_kwargs
+
+
+def _pooled_clients(model) -> tuple[Client, AsyncClient]:
+    sync_kwargs, async_kwargs = client_kwargs(model.base_url, **(model.client_kwargs or {}))
+    return Client(host=model.base_url, **sync_kwargs), AsyncClient(host=model.base_url, **async_kwargs)
+
+
+class ChatOllama(LCChatOllama):
+    """langchain ChatOllama on the shared connection pool of its host."""
+
+    @model_validator(mode="after")
+    def _set_clients(self) -> Self:
+        self._client, self._async_client = _pooled_clients(self)
+        return self
+
+
+class OllamaLLM(LCOllamaLLM):
+    @model_validator(mode="after")
+    def _set_clients(self) -> Self:
+        self._client, self._async_client = _pooled_clients(self)
+        return self
+
+
+class OllamaEmbeddings(LCOllamaEmbeddings):
+    @model_validator(mode="after")
+    def _set_clients(self) -> Self:
+        self._client, self._async_client = _pooled_clients(self)
+        return self
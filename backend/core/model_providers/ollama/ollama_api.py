@@ -1,20 +1,23 @@
 import json
 import logging
-import telnetlib
+import threading
+import time
+from collections.abc import Callable
 from pathlib import Path
 from typing import Any, Optional
 from urllib.parse import urljoin
 
-import requests
+import httpx
 
-from configs.settings import MODEL_PROVIDER_SETTINGS
+from configs.settings import MODEL_PROVIDER_SETTINGS, OLLAMA_CLIENT_SETTINGS, OLLAMA_INVENTORY_SETTINGS
+from core.model_providers.ollama.ollama_client import ollama_clients
 from core.model_providers.ollama.types import (
     ModelInformation,
+    ModelTag,
     ModelTagList,
     ResponsePayload,
 )
 
-http_session = requests.session()
 first_detect = True
 
 ollama_api_tags = "/api/tags"
@@ -28,95 +31,53 @@ def ollama_check_addr(base_url=None) -> str:
     if base_url is None:
         base_url = MODEL_PROVIDER_SETTINGS.get("ollama", {})["base_url"]
 
+    # answered from the circuit breaker of the host while requests to it succeed, probed otherwise
     try:
-        ip_port = base_url.replace("http://", "").replace("https://", "")
-        ip_port = ip_port.rstrip("/")
-        telnetlib.Telnet(ip_port.split(":")[0], ip_port.split(":")[1], timeout=3)
-        return ""
-    except Exception as e:
-        if isinstance(e, ConnectionRefusedError):
-            error_msg = f"Ollama {base_url} is not running. Please change api url or start ollama service"
-        else:
-            error_msg = f"Ollama {base_url} is not running, error: {e}"
+        error_msg = ollama_clients.check(base_url)
+    except ValueError as e:
+        error_msg = f"Ollama {base_url} is not running, error: {e}"
 
-        global first_detect
-        if first_detect:
-            logging.warning(error_msg)
-            first_detect = False
-        return error_msg
+    global first_detect
+    if error_msg and first_detect:
+        logging.warning(error_msg)
+        first_detect = False
+    return error_msg
 
 
 def ollama_get_model_list(base_url: str) -> Optional[ModelTagList]:
-    if not base_url or ollama_check_addr(base_url=base_url):
-        logging.warning("Ollama base_url not found or not reachable")
+    """Models of the Ollama service with their /api/show details, served by the inventory."""
+    if not base_url:
+        logging.warning("Ollama base_url not found")
         return None
 
     try:
-        resp = http_session.get(urljoin(base_url, ollama_api_tags), timeout=5)
-        if resp.status_code != 200:
-            logging.error(f"Ollama API returned status code {resp.status_code}")
-            return None
-
-        model_tags = ModelTagList(**resp.json())
-
-        for model in model_tags.models:
-            try:
-                model_info = ollama_get_model_info(base_url, model.name)
-                if model_info:
-                    model.template = model_info.template
-                    model.model_info = model_info.model_info
-                    model.parameters = model_info.parameters
-            except Exception as e:
-                logging.warning(f"[{model.name}] Failed to get model info: {e}")
-
-        return model_tags
-
+        return ollama_inventory.models(base_url)
     except Exception as e:
-        logging.exception("Exception occurred while fetching model list from Ollama.")
+        logging.warning(f"Ollama {base_url} is not reachable: {e}")
         return None
 
 
-def ollama_alive(base_url) -> ModelTagList:
-    err_msg = ollama_check_addr(base_url)
-    if err_msg:
-        raise Exception(err_msg)
-
+def ollama_alive(base_url, max_age: Optional[float] = None) -> ModelTagList:
     try:
-        resp = http_session.get(urljoin(base_url, ollama_api_tags), timeout=1.5)
-        if resp.status_code == 200:
-            return ModelTagList(**resp.json())
-        else:
-            raise Exception(f"Request failed with status code {resp.status_code}")
+        return ollama_inventory.models(base_url, max_age=max_age)
     except Exception as e:
-        logging.exception("An unexpected error occurred.")
-        raise e
+        raise Exception(f"Ollama {base_url} is not running, error: {e}") from e
 
 
 def ollama_model_exist(base_url: str, model_name: str) -> bool:
-    if ollama_check_addr(base_url=base_url):
-        return False
-
     try:
-        resp = http_session.get(urljoin(base_url, ollama_api_tags), timeout=3)
-        if resp.status_code == 200:
-            models = ModelTagList(**resp.json()).models
-            for model in models:
-                if model.name == model_name:
-                    return True
+        return ollama_inventory.get(base_url, model_name) is not None
     except Exception as e:
-        logging.exception("An unexpected error occurred.")
+        logging.debug(f"Ollama {base_url} is not reachable: {e}")
     return False
 
 
 def ollama_get_model_info(base_url: str, model_name: str) -> Optional[ModelInformation]:
-    if ollama_check_addr(base_url=base_url):
-        return None
-
     try:
         data = {
             "name": model_name,
         }
-        resp = http_session.post(urljoin(base_url, ollama_api_show), json=data, timeout=5)
+        resp = ollama_clients.client(base_url).post(urljoin(base_url, ollama_api_show), json=data, timeout=5)
         if resp.status_code == 200:
             return ModelInformation(**resp.json())
         else:
@@ -128,15 +89,14 @@ def ollama_get_model_info(base_url: str, model_name: str) -> Optional[ModelInfor
 
 
 def ollama_delete_model(base_url: str, model_name: str) -> bool:
-    if ollama_check_addr(base_url=base_url):
-        return False
-
     try:
         data = {
             "name": model_name,
         }
-        resp = http_session.delete(urljoin(base_url, ollama_api_delete), json=data, timeout=5)
+        client = ollama_clients.client(base_url)
+        resp = client.request("DELETE", urljoin(base_url, ollama_api_delete), json=data, timeout=5)
         if resp.status_code == 200:
+            ollama_inventory.invalidate(base_url)
             return True
     except Exception as e:
         logging.exception("An unexpected error occurred.")
@@ -176,16 +136,23 @@ def ollama_pull_model(base_url: str, model_name: str):
     try:
         if ollama_check_addr(base_url=base_url):
             yield {"error": "ollama check fail."}
+            return
         data = {
             "name": model_name,
         }
-        resp = http_session.post(urljoin(base_url, ollama_api_pull), json=data, stream=True, timeout=30)
-        if resp.status_code == 200:
+        client = ollama_clients.client(base_url)
+        timeout = httpx.Timeout(30, connect=OLLAMA_CLIENT_SETTINGS["CONNECT_TIMEOUT"])
+        with client.stream("POST", urljoin(base_url, ollama_api_pull), json=data, timeout=timeout) as resp:
+            if resp.status_code != 200:
+                return
             for line in resp.iter_lines():
+                if not line:
+                    continue
                 line_info = ResponsePayload(**json.loads(line))
                 if line_info.error:
                     yield {"error": line_info.error}
                 if line_info.status == "success":
+                    ollama_inventory.invalidate(base_url)
                     yield {"status": "success"}
                 if isinstance(line_info.status, str) and "pulling" in line_info.status:
                     file_name = line_info.status.split(" ")[1]
@@ -200,15 +167,45 @@ def ollama_pull_model(base_url: str, model_name: str):
         yield {"error": str(e)}
 
 
-def ollama_create_blob(base_url: str, digest: str, file_path: Path):
+def ollama_blob_exists(base_url: str, digest: str) -> bool:
+    try:
+        resp = ollama_clients.client(base_url).head(f"{base_url}/api/blobs/{digest}", timeout=10)
+        return resp.status_code == 200
+    except Exception:
+        logging.exception(f"Failed to check blob {digest}")
+        return False
+
+
+def ollama_create_blob(
+    base_url: str,
+    digest: str,
+    file_path: Path,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    block_size: int = 8 * 1024 * 1024,
+):
     if ollama_check_addr(base_url=base_url):
         raise ValueError("Ollama is not running")
 
+    if ollama_blob_exists(base_url, digest):
+        logging.info(f"blob {digest} already exists, skip upload")
+        return True
+
     url = f"{base_url}/api/blobs/{digest}"
+    total = file_path.stat().st_size
+
+    def read_blocks():
+        sent = 0
+        with file_path.open("rb") as fp:
+            for block in iter(lambda: fp.read(block_size), b""):
+                yield block
+                sent += len(block)
+                if on_progress:
+                    on_progress(sent, total)
 
     try:
-        file_data = file_path.read_bytes()
-        post_resp = requests.post(url, data=file_data)
+        # a generator body is sent with chunked transfer encoding, one block in memory at a time
+        timeout = httpx.Timeout(None, connect=OLLAMA_CLIENT_SETTINGS["CONNECT_TIMEOUT"])
+        post_resp = ollama_clients.client(base_url).post(url, content=read_blocks(), timeout=timeout)
         post_resp.raise_for_status()
         return True
     except Exception as e:
@@ -253,7 +250,8 @@ def ollama_create_model(
     url = f"{base_url}/api/create"
 
     try:
-        with requests.post(url, json=payload, stream=True) as response:
+        timeout = httpx.Timeout(None, connect=OLLAMA_CLIENT_SETTINGS["CONNECT_TIMEOUT"])
+        with ollama_clients.client(base_url).stream("POST", url, json=payload, timeout=timeout) as response:
             response.raise_for_status()
 
             for line in response.iter_lines():
@@ -266,6 +264,7 @@ def ollama_create_model(
                         logging.error(f"Ollama create model error: {line_info.error}")
                         return line_info.error
                     if line_info.status == "success":
+                        ollama_inventory.invalidate(base_url)
                         return "success"
                 except Exception as e:
                     logging.warning(f"Failed to parse response line: {line}, error: {e}")
@@ -275,3 +274,92 @@ def ollama_create_model(
     except Exception as e:
         logging.exception("An unexpected error occurred while creating the model.")
         raise
+
+
+class OllamaInventory:
+    """
+    In-process view of the models of an Ollama service, keyed by digest.
+
+    `/api/tags` is fetched at most once per TTL and `/api/show` only for digests not seen before, so a steady
+    service costs one small request per TTL. Pulls, creates and deletes made through this module invalidate
+    the listing right away and set `invalidated`, which wakes up the database sync.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.invalidated = threading.Event()
+        self._lock = threading.Lock()
+        self._refresh_locks: dict[str, threading.Lock] = {}
+        self._tags: dict[str, tuple[float, ModelTagList]] = {}
+        self._details: dict[str, ModelInformation] = {}
+
+    def models(self, base_url: str, max_age: Optional[float] = None) -> ModelTagList:
+        """The model list, refreshed when older than `max_age` (the TTL by default). Raises when unreachable."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(base_url, threading.Lock())
+        # one refresh per service at a time, callers arriving meanwhile get its result
+        with refresh_lock:
+            with self._lock:
+                cached = self._tags.get(base_url)
+            if cached and time.monotonic() - cached[0] < max_age:
+                return cached[1]
+            model_tags = self._fetch(base_url)
+            with self._lock:
+                self._tags[base_url] = (time.monotonic(), model_tags)
+            return model_tags
+
+    def get(self, base_url: str, model_name: str) -> Optional[ModelTag]:
+        for model in self.models(base_url).models:
+            if model.name == model_name:
+                return model
+        return None
+
+    def invalidate(self, base_url: Optional[str] = None):
+        with self._lock:
+            if base_url is None:
+                self._tags.clear()
+            else:
+                self._tags.pop(base_url, None)
+        self.invalidated.set()
+
+    def _fetch(self, base_url: str) -> ModelTagList:
+        resp = ollama_clients.client(base_url).get(urljoin(base_url, ollama_api_tags), timeout=5)
+        if resp.status_code != 200:
+            raise ValueError(f"Ollama API returned status code {resp.status_code}")
+        model_tags = ModelTagList(**resp.json())
+
+        for model in model_tags.models:
+            with self._lock:
+                model_info = self._details.get(model.digest)
+            if model_info is None:
+                try:
+                    model_info = self._show(base_url, model.name)
+                except Exception as e:
+                    logging.warning(f"[{model.name}] Failed to get model info: {e}")
+                    continue
+                with self._lock:
+                    self._details[model.digest] = model_info
+            model.template = model_info.template
+            model.model_info = model_info.model_info
+            model.parameters = model_info.parameters
+
+        with self._lock:
+            # forget the details of digests no service lists anymore
+            listed = {model.digest for model in model_tags.models}
+            listed.update(model.digest for _, tags in self._tags.values() for model in tags.models)
+            for digest in list(self._details):
+                if digest not in listed:
+                    del self._details[digest]
+        return model_tags
+
+    @staticmethod
+    def _show(base_url: str, model_name: str) -> ModelInformation:
+        client = ollama_clients.client(base_url)
+        resp = client.post(urljoin(base_url, ollama_api_show), json={"name": model_name}, timeout=5)
+        if resp.status_code != 200:
+            raise ValueError(f"Request failed with status code {resp.status_code}")
+        return ModelInformation(**resp.json())
+
+
+ollama_inventory = OllamaInventory(ttl=OLLAMA_INVENTORY_SETTINGS["TTL"])
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from configs.settings import OLLAMA_CLIENT_SETTINGS
+
+
+class OllamaUnavailableError(httpx.ConnectError):
+    """Raised without touching the network while the circuit of a service is open."""
+
+
+class CircuitBreaker:
+    """
+    Health of one Ollama service, learned from the requests made to it.
+
+    After `failure_threshold` connection failures in a row the circuit opens and requests fail at once; after
+    `recovery_timeout` seconds a single request is let through, and its outcome closes or reopens the circuit.
+    A probe that ends without telling, a read timeout or a cancellation, reopens it through `release`; a probe
+    that never ends is replaced by another one `recovery_timeout` seconds later.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.last_error = ""
+        self._failures = 0
+        self._opened_at = 0.0
+        self._last_success = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._last_success = time.monotonic()
+
+    def failure(self, error: Exception):
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error) or type(error).__name__
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """A request let through ended with neither `success` nor `failure`."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def healthy_within(self, seconds: float) -> bool:
+        with self._lock:
+            return self.state == self.CLOSED and time.monotonic() - self._last_success < seconds
+
+
+class _BreakerTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, breaker: CircuitBreaker):
+        self._transport = transport
+        self._breaker = breaker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if not self._breaker.allow():
+            raise OllamaUnavailableError(f"Ollama is unavailable: {self._breaker.last_error}", request=request)
+        settled = False
+        try:
+            response = self._transport.handle_request(request)
+            self._breaker.success()
+            settled = True
+            return response
+        except httpx.TransportError as e:
+            if not isinstance(e, httpx.ReadTimeout):
+                # a slow generation is not a dead service
+                self._breaker.failure(e)
+                settled = True
+            raise
+        finally:
+            if not settled:
+                self._breaker.release()
+
+    def close(self):
+        self._transport.close()
+
+
+class _BreakerAsyncTransport(httpx.AsyncBaseTransport):
+    """Keeps one connection pool per event loop, async connections cannot move between loops."""
+
+    def __init__(self, transport_kwargs: dict[str, Any], breaker: CircuitBreaker):
+        self._transport_kwargs = transport_kwargs
+        self._breaker = breaker
+        self._transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self._breaker.allow():
+            raise OllamaUnavailableError(f"Ollama is unavailable: {self._breaker.last_error}", request=request)
+        settled = False
+        try:
+            response = await self._transport().handle_async_request(request)
+            self._breaker.success()
+            settled = True
+            return response
+        except httpx.TransportError as e:
+            if not isinstance(e, httpx.ReadTimeout):
+                self._breaker.failure(e)
+                settled = True
+            raise
+        finally:
+            if not settled:
+                self._breaker.release()
+
+    async def aclose(self):
+        with self._lock:
+            transports = list(self._transports.values())
+        for transport in transports:
+            await transport.aclose()
+
+
+class _Host:
+    def __init__(self, settings: dict[str, Any]):
+        limits = httpx.Limits(
+            max_connections=settings["MAX_CONNECTIONS"],
+            max_keepalive_connections=settings["MAX_KEEPALIVE_CONNECTIONS"],
+            keepalive_expiry=settings["KEEPALIVE_EXPIRY"],
+        )
+        self.timeout = httpx.Timeout(settings["TIMEOUT"], connect=settings["CONNECT_TIMEOUT"])
+        self.breaker = CircuitBreaker(settings["FAILURE_THRESHOLD"], settings["RECOVERY_TIMEOUT"])
+        self.transport = _BreakerTransport(httpx.HTTPTransport(limits=limits, retries=1), self.breaker)
+        self.async_transport = _BreakerAsyncTransport({"limits": limits, "retries": 1}, self.breaker)
+        self.client = httpx.Client(transport=self.transport, timeout=self.timeout)
+        self.async_client = httpx.AsyncClient(transport=self.async_transport, timeout=self.timeout)
+
+
+class OllamaClientPool:
+    """
+    Keep-alive HTTP clients for Ollama services, one connection pool and circuit breaker per host.
+
+    `client` and `async_client` are the sync and async facades; `transport` and `async_transport` let other
+    clients (the ollama package used by langchain) share the same pools. Pool sizes and timeouts come from
+    OLLAMA_CLIENT_SETTINGS, with per host overrides under "HOSTS".
+    """
+
+    def __init__(self, settings: dict[str, Any]):
+        self.settings = settings
+        self._hosts: dict[str, _Host] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, base_url: str) -> _Host:
+        origin = _origin(base_url)
+        with self._lock:
+            host = self._hosts.get(origin)
+            if host is None:
+                overrides = self.settings.get("HOSTS", {}).get(origin, {})
+                host = self._hosts[origin] = _Host({**self.settings, **{k.upper(): v for k, v in overrides.items()}})
+            return host
+
+    def client(self, base_url: str) -> httpx.Client:
+        return self._host(base_url).client
+
+    def async_client(self, base_url: str) -> httpx.AsyncClient:
+        return self._host(base_url).async_client
+
+    def transport(self, base_url: str) -> httpx.BaseTransport:
+        return self._host(base_url).transport
+
+    def async_transport(self, base_url: str) -> httpx.AsyncBaseTransport:
+        return self._host(base_url).async_transport
+
+    def breaker(self, base_url: str) -> CircuitBreaker:
+        return self._host(base_url).breaker
+
+    def check(self, base_url: str) -> str:
+        """Empty string when the service answers, the error message otherwise."""
+        host = self._host(base_url)
+        if host.breaker.healthy_within(self.settings["HEALTHY_WINDOW"]):
+            return ""
+        try:
+            host.client.get(base_url, timeout=self.settings["CONNECT_TIMEOUT"]).raise_for_status()
+            return ""
+        except OllamaUnavailableError as e:
+            return f"Ollama {base_url} is not running, error: {e}"
+        except httpx.ConnectError:
+            return f"Ollama {base_url} is not running. Please change api url or start ollama service"
+        except httpx.HTTPError as e:
+            return f"Ollama {base_url} is not running, error: {e}"
+
+    def close(self):
+        with self._lock:
+            hosts, self._hosts = list(self._hosts.values()), {}
+        for host in hosts:
+            host.client.close()
+
+
+def _origin(base_url: str) -> str:
+    parts = urlsplit(base_url)
+    if not parts.scheme or not parts.netloc:
+        raise ValueError(f"invalid Ollama base url: {base_url!r}")
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def client_kwargs(base_url: Optional[str], **kwargs) -> tuple[dict[str, Any], dict[str, Any]]:
+    """httpx arguments for the sync and async clients of the ollama package, sharing the pooled transports."""
+    if not base_url:
+        return dict(kwargs), dict(kwargs)
+    try:
+        host = ollama_clients._host(base_url)
+    except ValueError:
+        logging.warning(f"Ollama base url {base_url!r} is not a url, use an unpooled client")
+        return dict(kwargs), dict(kwargs)
+    kwargs.setdefault("timeout", host.timeout)
+    return {**kwargs, "transport": host.transport}, {**kwargs, "transport": host.async_transport}
+
+
+ollama_clients = OllamaClientPool(OLLAMA_CLIENT_SETTINGS)
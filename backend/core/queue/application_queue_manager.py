@@ -1,10 +1,13 @@
 import asyncio
+import weakref
 from collections.abc import AsyncGenerator
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
+from langchain_core.messages import BaseMessage
 from sqlalchemy.orm import DeclarativeMeta
 
+from configs.settings import APP_SETTINGS
 from core.entities.application_entities import InvokeFrom
 from core.errors.errcode import Errcode
 from core.queue.entities.queue_entities import (
@@ -16,12 +19,13 @@ from core.queue.entities.queue_entities import (
     QueueAgentThoughtEvent,
     QueueErrorEvent,
     QueueMessage,
+    QueueMessageDeltaEvent,
     QueueMessageEndEvent,
     QueueMessageEvent,
     QueuePingEvent,
     QueueStopEvent,
+    QueueWaitingEvent,
 )
-from database.cache import local_cache
 
 
 class PublishFrom(Enum):
@@ -30,6 +34,12 @@ class PublishFrom(Enum):
 
 
 class ApplicationQueueManager:
+    # running tasks by task id, set_stop_flag reaches the listener of a task through it
+    _tasks: "weakref.WeakValueDictionary[str, ApplicationQueueManager]" = weakref.WeakValueDictionary()
+
+    # seconds between two pings of an idle stream
+    ping_interval = 10
+
     def __init__(
         self,
         task_id: str,
@@ -47,57 +57,81 @@ class ApplicationQueueManager:
         self._app_mode = app_mode
         self._message_id = message_id
 
-        user_prefix = "user"
-        local_cache.setdefault(
-            ApplicationQueueManager._generate_task_belong_cache_key(self._task_id),
-            f"{user_prefix}-{self._user_id}",
-        )
+        ApplicationQueueManager._tasks.setdefault(self._task_id, self)
 
         q: asyncio.Queue[QueueMessage | None] = asyncio.Queue()
 
         self._q = q
+        self._stop_event = asyncio.Event()
+        self._stop_requested = False
+        # the loop of the listener, the task runs on a generation worker loop and puts messages across
+        self._loop: Optional[asyncio.AbstractEventLoop] = _running_loop()
+        self._checked_events: set[type] = set()
+        self.prompt_messages: list[BaseMessage] = []
 
     async def listen(self) -> AsyncGenerator:
         """
-        Listen to queue
+        Listen to queue, waking up only for a message, the stop event or the next ping
         :return:
         """
-        # wait for 10 minutes to stop listen
+        # wait for 100 minutes to stop listen
         listen_timeout = 6000
-        loop = asyncio.get_event_loop()
-        start_time = loop.time()
-        last_ping_time: int = 0
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        if self._stop_requested:
+            self._stop_event.set()
+        deadline = loop.time() + listen_timeout
+        next_ping = loop.time() + self.ping_interval
+        stop_published = False
 
         await self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
 
-        while True:
-            try:
-                message = await asyncio.wait_for(self._q.get(), timeout=0.05)
+        get_task: Optional[asyncio.Task] = None
+        stop_task = loop.create_task(self._stop_event.wait())
+        try:
+            while True:
+                message = _NO_MESSAGE
+                if get_task is None and not self._q.empty():
+                    message = self._q.get_nowait()
+                else:
+                    if get_task is None:
+                        get_task = loop.create_task(self._q.get())
+                    waiters = {get_task} if stop_task.done() else {get_task, stop_task}
+                    timeout = max(0.0, min(next_ping, deadline) - loop.time())
+                    done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if get_task in done:
+                        message = get_task.result()
+                        get_task = None
+
                 if message is None:
                     break
-                yield message
-            except asyncio.TimeoutError:
-                await asyncio.sleep(0)
-            finally:
-                elapsed_time = loop.time() - start_time
-                if elapsed_time >= listen_timeout or self._is_stopped():
-                    # publish two messages to make sure the client can receive the stop signal
-                    # and stop listening after the stop signal processed
+                if message is not _NO_MESSAGE:
+                    yield message
+
+                now = loop.time()
+                if not stop_published and (self._stop_event.is_set() or now >= deadline):
+                    # the stop event is followed by the end of the queue, so the client receives the stop signal
+                    # before the listening ends
+                    stop_published = True
                     await self.publish(
                         QueueStopEvent(stopped_by=QueueStopEvent.StopBy.USER_MANUAL),
                         PublishFrom.TASK_PIPELINE,
                     )
 
-                if elapsed_time // 10 > last_ping_time:
+                if now >= next_ping:
                     await self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
-                    last_ping_time = int(elapsed_time // 10)
+                    next_ping = now + self.ping_interval
+        finally:
+            for task in (get_task, stop_task):
+                if task is not None:
+                    task.cancel()
 
     async def stop_listen(self) -> None:
         """
         Stop listen to queue
         :return:
         """
-        await self._q.put(None)
+        self._put(None)
 
     async def publish_agent_thought(self, agent_thought_id: str, pub_from: PublishFrom) -> None:
         """
@@ -139,6 +173,41 @@ class ApplicationQueueManager:
         """
         await self.publish(QueueMessageEvent(chunk=chunk), pub_from)
 
+    async def publish_delta(
+        self,
+        index: int,
+        text: str,
+        pub_from: PublishFrom,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """
+        Publish one streamed token, the per token fast path of publish_chunk_message.
+        The prompt is attached once with attach_prompt_messages and with the message end.
+        :param index: token index
+        :param text: token text
+        :param pub_from: publish from
+        :param metadata: token metadata
+        :return:
+        """
+        # built without validation, the fields come straight from the runner
+        await self.publish(QueueMessageDeltaEvent.model_construct(index=index, text=text, metadata=metadata), pub_from)
+
+    def attach_prompt_messages(self, prompt_messages: list[BaseMessage]) -> None:
+        """
+        Attach the prompt of the task, saved with the message when the stream is stopped before its end
+        :param prompt_messages: prompt messages
+        :return:
+        """
+        self.prompt_messages = prompt_messages
+
+    def publish_position(self, position: int) -> None:
+        """
+        Publish the place of the task in the generation queue, callable from any thread
+        :param position: position in the queue, 0 once the task starts
+        :return:
+        """
+        self._put(self._message(QueueWaitingEvent(position=position)))
+
     async def publish_message_end(self, llm_result: LLMResult, pub_from: PublishFrom) -> None:
         """
         Publish message end
@@ -173,17 +242,12 @@ class ApplicationQueueManager:
         :param pub_from:
         :return:
         """
-        self._check_for_sqlalchemy_models(event.dict())
+        if APP_SETTINGS["debug"] and type(event) not in self._checked_events:
+            # a walk of the whole event, once per event type of the task
+            self._checked_events.add(type(event))
+            self._check_for_sqlalchemy_models(event.dict())
 
-        message = QueueMessage(
-            task_id=self._task_id,
-            message_id=self._message_id,
-            conversation_id=self._conversation_id,
-            app_mode=self._app_mode,
-            event=event,
-        )
-
-        await self._q.put(message)
+        self._put(self._message(event))
 
         if isinstance(event, (QueueStopEvent, QueueErrorEvent, QueueMessageEndEvent)):
             await self.stop_listen()
@@ -194,49 +258,55 @@ class ApplicationQueueManager:
     @classmethod
     def set_stop_flag(cls, task_id: str, invoke_from: InvokeFrom, user_id: str) -> None:
         """
-        Set task stop flag
+        Set task stop flag, the listener of the task wakes up at once
         :return:
         """
-        result = local_cache.get(cls._generate_task_belong_cache_key(task_id))
-        if result is None:
+        queue_manager = cls._tasks.get(task_id)
+        if queue_manager is None or queue_manager.user_id != user_id:
             return
 
-        user_prefix = "user"
-        if result != f"{user_prefix}-{user_id}":
-            return
+        queue_manager._request_stop()
 
-        stopped_cache_key = cls._generate_stopped_cache_key(task_id)
-        local_cache.setdefault(stopped_cache_key, 1)
+    def _message(self, event: AppQueueEvent) -> QueueMessage:
+        return QueueMessage.model_construct(
+            task_id=self._task_id,
+            message_id=self._message_id,
+            conversation_id=self._conversation_id,
+            app_mode=self._app_mode,
+            event=event,
+        )
+
+    def _put(self, message: Optional[QueueMessage]) -> None:
+        loop = self._loop
+        if loop is None or loop is _running_loop():
+            self._q.put_nowait(message)
+            return
+        try:
+            # asyncio queues are not thread safe, hand the message to the loop of the listener
+            loop.call_soon_threadsafe(self._q.put_nowait, message)
+        except RuntimeError:
+            # loop closed, the listener is gone
+            pass
+
+    def _request_stop(self) -> None:
+        self._stop_requested = True
+        loop = self._loop
+        if loop is None:
+            # not listening yet, listen sets the event when it starts
+            return
+        try:
+            # stop requests come from the request handlers, which may run outside the loop of the task
+            loop.call_soon_threadsafe(self._stop_event.set)
+        except RuntimeError:
+            # loop closed, the task is gone
+            pass
 
     def _is_stopped(self) -> bool:
         """
         Check if task is stopped
         :return:
         """
-        stopped_cache_key = ApplicationQueueManager._generate_stopped_cache_key(self._task_id)
-        result = local_cache.get(stopped_cache_key)
-        if result is not None:
-            return True
-
-        return False
-
-    @classmethod
-    def _generate_task_belong_cache_key(cls, task_id: str) -> str:
-        """
-        Generate task belong cache key
-        :param task_id: task id
-        :return:
-        """
-        return f"generate_task_belong:{task_id}"
-
-    @classmethod
-    def _generate_stopped_cache_key(cls, task_id: str) -> str:
-        """
-        Generate stopped cache key
-        :param task_id: task id
-        :return:
-        """
-        return f"generate_task_stopped:{task_id}"
+        return self._stop_requested
 
     def _check_for_sqlalchemy_models(self, data: Any):
         # from entity to dict or list
@@ -256,6 +326,20 @@ class ApplicationQueueManager:
     def user_id(self):
         return self._user_id
 
+    @property
+    def stopped(self) -> bool:
+        return self._stop_requested
+
 
 class ConversationTaskStoppedError(Exception):
     pass
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+_NO_MESSAGE = object()
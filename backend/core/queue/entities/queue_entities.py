@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
 from pydantic import BaseModel
 
@@ -20,6 +20,7 @@ class QueueEvent(Enum):
     PLAN = "plan"
     ERROR = "error"
     PING = "ping"
+    WAITING = "waiting"
     STOP = "stop"
 
 
@@ -40,6 +41,17 @@ class QueueMessageEvent(AppQueueEvent):
     chunk: LLMResultChunk
 
 
+class QueueMessageDeltaEvent(AppQueueEvent):
+    """
+    QueueMessageDeltaEvent entity, the text of one streamed token without the prompt
+    """
+
+    event: QueueEvent = QueueEvent.MESSAGE
+    index: int
+    text: str
+    metadata: Optional[dict[str, Any]] = None
+
+
 class QueueMessageReplaceEvent(AppQueueEvent):
     """
     QueueMessageReplaceEvent entity
@@ -113,6 +125,15 @@ class QueuePingEvent(AppQueueEvent):
     event: QueueEvent = QueueEvent.PING
 
 
+class QueueWaitingEvent(AppQueueEvent):
+    """
+    QueueWaitingEvent entity, the place of the task in the generation queue, 0 once it starts
+    """
+
+    event: QueueEvent = QueueEvent.WAITING
+    position: int
+
+
 class QueueStopEvent(AppQueueEvent):
     """
     QueueStopEvent entity
@@ -1,30 +1,86 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
 from threading import Lock
-from typing import Optional, Union
+from typing import Any, Optional, Union
 
 from tinydb import Query, TinyDB
+from tinydb.storages import Storage
 from tinydb.table import Document
 
 from configs.env import ARGO_STORAGE_PATH_SETTINGS
 from core.model_providers.constants import OLLAMA_PROVIDER
+from events.provider_event import provider_settings_changed
 from models.provider import ModelProviderSetting
 
-db = TinyDB(ARGO_STORAGE_PATH_SETTINGS)
+
+class AtomicJSONStorage(Storage):
+    """TinyDB JSON storage that replaces the file through a renamed temp file, a crash never leaves half of it."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> Optional[dict[str, dict[str, Any]]]:
+        try:
+            content = Path(self.path).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        return json.loads(content) if content else None
+
+    def write(self, data: dict[str, dict[str, Any]]):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump(data, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp_path, self.path)
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    version: int = 0
+    documents: tuple[dict, ...] = ()
+    # first document of every provider, what a TinyDB get returned
+    by_provider: dict[str, dict] = field(default_factory=dict)
+
+
+db = TinyDB(ARGO_STORAGE_PATH_SETTINGS, storage=AtomicJSONStorage)
 
 MODEL_PROVIDER_SETTINGS_TABLE = "model_provider_settings"
 
+# serializes writers, readers use the current snapshot without locking
 lock = Lock()
 
+_snapshot = _Snapshot()
+
+
+def _refresh():
+    """Replace the in-memory snapshot with the table just written, under the lock."""
+    global _snapshot
+    documents = tuple(dict(doc) for doc in db.table(MODEL_PROVIDER_SETTINGS_TABLE).all())
+    by_provider: dict[str, dict] = {}
+    for doc in documents:
+        by_provider.setdefault(doc.get("provider", ""), doc)
+    _snapshot = _Snapshot(_snapshot.version + 1, documents, by_provider)
+
+
+def settings_version() -> int:
+    """Bumped by every write, caches derived from the settings can compare it to know they are stale."""
+    return _snapshot.version
+
 
 def update_provider_chosen(provider_st: ModelProviderSetting):
     with lock:
         settings_table = db.table(MODEL_PROVIDER_SETTINGS_TABLE)
         cond = Query().provider == provider_st.provider
         # cond = (Query().provider == providerSt.provider) & (Query().custom_name == providerSt.custom_name)
-        settings = settings_table.get(cond)
-        if settings:
+        if provider_st.provider in _snapshot.by_provider:
             settings_table.update(provider_st.dict(), cond=cond)
         else:
             settings_table.insert(provider_st.dict())
+        _refresh()
+    provider_settings_changed.send(provider_st.provider)
 
 
 def delete_provider_chosen(provider: str):
@@ -33,15 +89,18 @@ def delete_provider_chosen(provider: str):
         # cond = (Query().provider == provider) & (Query().custom_name == custom_name)
         cond = Query().provider == provider
         settings_table.remove(cond)
+        _refresh()
+    provider_settings_changed.send(provider)
 
 
 def get_provider_settings_from_db(provider: str = ""):
-    with lock:
-        settings_table = db.table(MODEL_PROVIDER_SETTINGS_TABLE)
-        if provider:
-            return settings_table.get(Query().provider == provider)
-        else:
-            return settings_table.all()
+    # copies, callers may change what they get
+    snapshot = _snapshot
+    if provider:
+        doc = snapshot.by_provider.get(provider)
+        return dict(doc) if doc is not None else None
+    else:
+        return [dict(doc) for doc in snapshot.documents]
 
 
 def update_ollama_provider(base_url: str):
@@ -56,3 +115,9 @@ def update_ollama_provider(base_url: str):
             for d in doc:
                 d["base_url"] = base_url
                 settings_table.update(d, Query().provider == OLLAMA_PROVIDER)
+        _refresh()
+    provider_settings_changed.send(OLLAMA_PROVIDER)
+
+
+with lock:
+    _refresh()
@@ -18,3 +18,8 @@ def init():
 
 def get_qdrant_client():
     return VECTOR_CLIENT_QDRANT
+
+
+def is_local_client() -> bool:
+    options = VECTOR_CLIENT_QDRANT.init_options if VECTOR_CLIENT_QDRANT else {}
+    return bool(options.get("path")) or options.get("location") == ":memory:"
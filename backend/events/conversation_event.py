@@ -0,0 +1,4 @@
+from blinker import signal
+
+# sender: conversation_id, created_at: time of the saved message, absent when older messages changed
+conversation_messages_changed = signal("conversation-messages-changed")
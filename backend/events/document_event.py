@@ -0,0 +1,4 @@
+from blinker import signal
+
+# sender: partition_name
+document_waiting = signal("document-was-waiting")
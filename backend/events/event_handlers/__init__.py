@@ -1,2 +1,7 @@
 from .mcp_server_enable_status_handler import handle
 from .knowledge_delete_handler import handle
+from .document_waiting_handler import handle
+from .model_status_handler import handle
+from .conversation_memory_handler import handle
+from .provider_instance_handler import handle
+from .world_info_session_handler import handle
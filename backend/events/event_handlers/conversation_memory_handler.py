@@ -0,0 +1,11 @@
+from core.memory.conversation_memory_cache import conversation_memory_cache
+from events.conversation_event import conversation_messages_changed
+
+
+@conversation_messages_changed.connect
+def handle(sender, **kwargs):
+    conversation_id = sender
+    if not conversation_id:
+        return
+
+    conversation_memory_cache.invalidate(conversation_id, created_at=kwargs.get("created_at"))
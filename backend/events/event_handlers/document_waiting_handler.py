@@ -0,0 +1,13 @@
+from events.document_event import document_waiting
+from services.doc.ingest_queue import ingest_queue
+
+
+@document_waiting.connect
+def handle(sender, **kwargs):
+    partition_name = sender
+    collection_name = kwargs.get("collection_name")
+
+    if partition_name is None or collection_name is None:
+        return
+
+    ingest_queue.submit(partition_name=partition_name, collection_name=collection_name)
@@ -0,0 +1,17 @@
+from events.model_event import model_status_changed
+from models.model_manager import DownloadStatus
+from services.model import sync_ollama
+from services.model.download_scheduler import model_scheduler
+
+
+@model_status_changed.connect
+def handle(sender, **kwargs):
+    model_name = sender
+    if model_name is None:
+        return
+
+    status = kwargs.get("status")
+    if status == DownloadStatus.IMPORT_COMPLETE:
+        # the model is in ollama now, pick up its digest and details without waiting for the next pass
+        sync_ollama.request_sync()
+    model_scheduler.submit(model_name, status)
@@ -0,0 +1,11 @@
+from core.model_providers import model_provider_manager
+from events.provider_event import provider_settings_changed
+
+
+@provider_settings_changed.connect
+def handle(sender, **kwargs):
+    provider = sender
+    if not provider:
+        return
+
+    model_provider_manager.instances.invalidate(provider)
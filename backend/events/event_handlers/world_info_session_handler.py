@@ -0,0 +1,14 @@
+from core.bot_runner.roleplay_world_info import world_info_sessions
+from events.conversation_event import conversation_messages_changed
+
+
+@conversation_messages_changed.connect
+def handle(sender, **kwargs):
+    conversation_id = sender
+    if not conversation_id:
+        return
+
+    # a new message only extends the chat, the session scans it next turn
+    if kwargs.get("created_at") is not None:
+        return
+    world_info_sessions.invalidate(conversation_id)
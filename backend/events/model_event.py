@@ -0,0 +1,4 @@
+from blinker import signal
+
+# sender: model_name
+model_status_changed = signal("model-status-changed")
@@ -0,0 +1,4 @@
+from blinker import signal
+
+# sender: provider
+provider_settings_changed = signal("provider-settings-changed")
@@ -10,6 +10,7 @@ from .doc import (
     drop_collection,
     drop_partition,
     get_directory,
+    ingest_stats,
     list_collections,
     list_datasets,
     list_documents,
@@ -1,15 +1,13 @@
-import json
 import logging
 import os.path
 from collections.abc import Awaitable
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
 from typing import Optional
 
 import tornado.web
 from tornado.concurrent import run_on_executor
 
-from configs.env import FOLDER_TREE_FILE, MILVUS_DISTANCE_METHOD
+from configs.env import MILVUS_DISTANCE_METHOD
 from configs.settings import FILE_SETTINGS
 from core.errors.errcode import Errcode
 from core.i18n.translation import translation_loader
@@ -17,8 +15,9 @@ from core.model_providers.constants import OLLAMA_PROVIDER
 from core.model_providers.ollama.ollama_api import ollama_model_exist
 from handlers.base_handler import BaseProtectedHandler
 from handlers.router import api_router
+from models.knowledge import RETRIEVALMODE
 from services.common.provider_setting_service import get_provider_setting
-from services.doc import util
+from services.doc.folder_sync import folder_sync_engine
 from services.doc.milvus_op import DocCollectionOp
 
 
@@ -60,6 +59,9 @@ class CreateCollectionHandler(BaseProtectedHandler):
                   type: string
                 embedding_model:
                   type: string
+                retrieval_mode:
+                  type: string
+                  enum: [vector, hybrid]
                 index_type:
                   type: string
                 metric_type:
@@ -97,6 +99,16 @@ class CreateCollectionHandler(BaseProtectedHandler):
         provider = body.get("provider", "")
         embedding_model = body.get("embedding_model")
         similarity_threshold = body.get("similarity_threshold", 0.0)
+        retrieval_mode = body.get("retrieval_mode", RETRIEVALMODE.VECTOR.value)
+        if retrieval_mode not in {mode.value for mode in RETRIEVALMODE}:
+            self.set_status(500)
+            self.write(
+                {
+                    "errcode": Errcode.ErrCreateCollectionFail.value,
+                    "msg": f"{retrieval_mode} is not a valid retrieval mode",
+                }
+            )
+            return
 
         if not provider:
             self.set_status(500)
@@ -164,14 +176,7 @@ class CreateCollectionHandler(BaseProtectedHandler):
             return
 
         if folder:
-            local_file_map = util.get_file_list(folder)
-            file_path = Path(folder) / FOLDER_TREE_FILE
-            file_path.write_text(
-                json.dumps(local_file_map, indent=4, ensure_ascii=False),
-                encoding="utf-8",
-            )
-            file_mod_time = os.path.getmtime(f"{folder}/{FOLDER_TREE_FILE}")
-            os.utime(folder, (file_mod_time, file_mod_time + 5))
+            folder_sync_engine.scan(folder)
 
         try:
             result = DocCollectionOp.create_collection(
@@ -185,6 +190,7 @@ class CreateCollectionHandler(BaseProtectedHandler):
                 top_k=top_k,
                 folder=folder,
                 similarity_threshold=similarity_threshold,
+                retrieval_mode=retrieval_mode,
                 index_type=index_type,
                 metric_type=metric_type,
                 params=params,
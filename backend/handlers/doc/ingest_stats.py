@@ -0,0 +1,58 @@
+from collections.abc import Awaitable
+from typing import Optional
+
+from core.features.embedding_cache import get_embedding_cache
+from handlers.base_handler import BaseProtectedHandler
+from handlers.router import api_router
+from services.doc.ingest_queue import ingest_queue
+
+
+class IngestStatsHandler(BaseProtectedHandler):
+    def data_received(self, chunk: bytes) -> Optional[Awaitable[None]]:
+        pass
+
+    def get(self):
+        """
+        ---
+        tags:
+          - Doc
+        summary: Document ingest queue and embedding cache metrics
+        description: Queue depth, running documents and throughput of the document ingest workers
+        responses:
+          200:
+            description: Ingest queue metrics
+            schema:
+              type: object
+              properties:
+                workers:
+                  type: integer
+                  description: Worker pool size
+                queue_depth:
+                  type: integer
+                  description: Documents waiting for a worker
+                deferred:
+                  type: integer
+                  description: Documents waiting for a retry
+                running:
+                  type: integer
+                  description: Documents being processed
+                collections:
+                  type: object
+                  description: Queue depth per collection name
+                processed:
+                  type: integer
+                  description: Documents finished since startup
+                failed:
+                  type: integer
+                  description: Documents failed since startup
+                throughput_per_minute:
+                  type: number
+                  description: Documents finished or failed per minute over the recent window
+                embedding_cache:
+                  type: object
+                  description: Hits, misses, evictions and size of the embedding cache
+        """
+        self.write({**ingest_queue.stats(), "embedding_cache": get_embedding_cache().stats()})
+
+
+api_router.add("/api/knowledge/ingest_stats", IngestStatsHandler)
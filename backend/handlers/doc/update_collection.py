@@ -3,13 +3,11 @@ import logging
 import os
 from collections.abc import Awaitable
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
 from typing import Optional
 
 import tornado.web
 from tornado.concurrent import run_on_executor
 
-from configs.env import FOLDER_TREE_FILE
 from configs.settings import FILE_SETTINGS
 from core.errors.errcode import Errcode
 from core.i18n.translation import translation_loader
@@ -18,9 +16,10 @@ from database import db
 from handlers.base_handler import BaseProtectedHandler
 from handlers.router import api_router
 from models.bot import BotModelConfig, get_bot
+from models.knowledge import RETRIEVALMODE
 from services.common.provider_setting_service import get_provider_setting
-from services.doc import util
 from services.doc.doc_db import DocDB
+from services.doc.folder_sync import folder_sync_engine
 from services.doc.milvus_op import DocCollectionOp
 
 
@@ -76,6 +75,9 @@ class UpdateCollectionHandler(BaseProtectedHandler):
                   type: string
                 similarity_threshold:
                   type: float
+                retrieval_mode:
+                  type: string
+                  enum: [vector, hybrid]
                 chunk_size:
                   type: int
                 chunk_overlap:
@@ -112,6 +114,16 @@ class UpdateCollectionHandler(BaseProtectedHandler):
         description = body.get("description", "")
         embedding_model = body.get("embedding_model", "")
         similarity_threshold = body.get("similarity_threshold", 0.0)
+        retrieval_mode = body.get("retrieval_mode")
+        if retrieval_mode is not None and retrieval_mode not in {mode.value for mode in RETRIEVALMODE}:
+            self.set_status(500)
+            self.write(
+                {
+                    "errcode": Errcode.ErrCreateCollectionFail.value,
+                    "msg": f"{retrieval_mode} is not a valid retrieval mode",
+                }
+            )
+            return
         chunk_size = body.get("chunk_size", FILE_SETTINGS["CHUNK_SIZE"])
         chunk_overlap = body.get("chunk_overlap", FILE_SETTINGS["CHUNK_OVERLAP"])
         top_k = body.get("top_k", FILE_SETTINGS["TOP_K"])
@@ -173,14 +185,7 @@ class UpdateCollectionHandler(BaseProtectedHandler):
             return
 
         if folder:
-            local_file_map = util.get_file_list(folder)
-            file_path = Path(folder) / FOLDER_TREE_FILE
-            file_path.write_text(
-                json.dumps(local_file_map, indent=4, ensure_ascii=False),
-                encoding="utf-8",
-            )
-            file_mod_time = os.path.getmtime(f"{folder}/{FOLDER_TREE_FILE}")
-            os.utime(folder, (file_mod_time, file_mod_time + 5))
+            folder_sync_engine.scan(folder)
 
         try:
             success = DocCollectionOp.update_collection(
@@ -195,6 +200,7 @@ class UpdateCollectionHandler(BaseProtectedHandler):
                 chunk_overlap=chunk_overlap,
                 top_k=top_k,
                 folder=folder,
+                retrieval_mode=retrieval_mode,
             )
             if success:
                 datasets = DocDB.get_spaces_by_collection_name(collection_name=collection_name)
@@ -218,12 +218,8 @@ class UploadDocumentsHandler(BaseProtectedHandler):
                     )
                     if model_config and not description:
                         loader, known_type = get_loader(real_file_name, content_type, file_path)
-                        data = loader.load()
-                        file_txt = ""
-                        for each_chunk in data:
-                            file_txt += each_chunk.page_content
                         description = util.generate_file_abstract(
-                            bot_model_config=model_config, content=file_txt[:2000]
+                            bot_model_config=model_config, content=util.read_prefix(loader, 2000)
                         )
                         if description:
                             PartitionDB.update_description_name(partition_name=partition_name, desc_name=description)
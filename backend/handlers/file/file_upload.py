@@ -1,19 +1,105 @@
 import logging
+from asyncio import Future
 from collections.abc import Awaitable
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+from tornado.ioloop import IOLoop
+from tornado.web import stream_request_body
+
+from configs.settings import FILE_SETTINGS
 from core.errors.errcode import Errcode
 from core.i18n.translation import translation_loader
 from handlers.base_handler import BaseProtectedHandler
 from handlers.router import api_router
-from services.file.file_op import upload_file
+from services.file.file_op import HashedUpload, store_upload
+from utils.multipart import MultipartParser
+
+
+class StreamedUploadHandler(BaseProtectedHandler):
+    """
+    Parses the multipart body as it arrives instead of letting tornado buffer it.
+
+    Parsing, hashing and writing the temp files run on the executor, one chunk at a time per request, so the
+    IOLoop only moves bytes and memory stays flat whatever the file size.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=FILE_SETTINGS["UPLOAD_WORKERS"])
+    field_name = ""
+
+    def prepare(self):
+        self.parser: Optional[MultipartParser] = None
+        self.uploads: list[HashedUpload] = []
+        self.feeding: Optional[Future] = None
+        self.closed = False
+        super().prepare()
+        if self._finished:
+            return
 
+        self.request.connection.set_max_body_size(FILE_SETTINGS["MAX_UPLOAD_SIZE"])
+        content_type = self.request.headers.get("Content-Type", "")
+        boundary = ""
+        for field in content_type.split(";")[1:]:
+            key, _, value = field.strip().partition("=")
+            if key == "boundary":
+                boundary = value.strip('"')
+        if not content_type.startswith("multipart/form-data") or not boundary:
+            self.set_status(400)
+            self.finish({"errcode": Errcode.ErrcodeInvalidRequest.value, "msg": "multipart/form-data expected."})
+            return
+        self.parser = MultipartParser(boundary.encode(), self._on_part)
 
-class FileUploadHandler(BaseProtectedHandler):
     def data_received(self, chunk: bytes) -> Optional[Awaitable[None]]:
-        pass
+        if self.parser is None:
+            return None
+        # tornado waits for the returned future before reading the next chunk
+        self.feeding = IOLoop.current().run_in_executor(self.executor, self.parser.feed, chunk)
+        return self.feeding
+
+    def _on_part(self, name: str, filename: Optional[str], content_type: Optional[str]) -> Optional[HashedUpload]:
+        if name != self.field_name or not filename or self.closed:
+            return None
+        upload = HashedUpload(filename)
+        self.uploads.append(upload)
+        return upload
+
+    async def store_uploads(self) -> list[dict]:
+        if self.parser is None or not self.parser.complete:
+            raise ValueError("incomplete multipart body")
+        user_id = self.current_user.id
+        return [
+            await IOLoop.current().run_in_executor(self.executor, store_upload, user_id, upload)
+            for upload in self.uploads
+        ]
+
+    def discard_uploads(self):
+        # uploads that were stored have been renamed away already
+        for upload in self.uploads:
+            upload.discard()
+
+    def on_finish(self):
+        if getattr(self, "closed", True):
+            return
+        self.closed = True
+        # a client that disconnects mid-body leaves a chunk being parsed on the executor, the temp files are
+        # discarded there once it is written
+        if self.feeding is None or self.feeding.done():
+            IOLoop.current().run_in_executor(self.executor, self.discard_uploads)
+        else:
+            self.feeding.add_done_callback(
+                lambda _: IOLoop.current().run_in_executor(self.executor, self.discard_uploads)
+            )
+
+    def on_connection_close(self):
+        self.on_finish()
+        super().on_connection_close()
 
-    def post(self):
+
+@stream_request_body
+class FileUploadHandler(StreamedUploadHandler):
+    field_name = "file_path"
+
+    async def post(self):
         """
         ---
         tags:
@@ -56,12 +142,11 @@ class FileUploadHandler(BaseProtectedHandler):
                       type: string
         """
         try:
-            file_meta = self.request.files["file_path"][0]
-            file_name = file_meta["filename"]
-            file_content = file_meta["body"]
-            user_id = self.current_user.id
-
-            result = upload_file(user_id=user_id, file_name=file_name, file_content=file_content)
+            results = await self.store_uploads()
+            if not results:
+                raise ValueError("file_path is required")
+            result = results[0]
+            file_name = result["file_name"]
             result["file_url"] = f"/api/documents/{result['file_id']}"
             result["file_name"] = file_name
             self.write(result)
@@ -76,8 +161,11 @@ class FileUploadHandler(BaseProtectedHandler):
             )
 
 
-class MultiFileUploadHandler(BaseProtectedHandler):
-    def post(self):
+@stream_request_body
+class MultiFileUploadHandler(StreamedUploadHandler):
+    field_name = "files"
+
+    async def post(self):
         """
         ---
         tags:
@@ -117,8 +205,8 @@ class MultiFileUploadHandler(BaseProtectedHandler):
             description: Internal server error
         """
         try:
-            files = self.request.files.get("files", [])
-            if not files:
+            results = await self.store_uploads()
+            if not results:
                 self.set_status(400)
                 self.write(
                     {
@@ -128,21 +216,14 @@ class MultiFileUploadHandler(BaseProtectedHandler):
                 )
                 return
 
-            user_id = self.current_user.id
-            uploaded_files = []
-
-            for file_meta in files:
-                file_name = file_meta["filename"]
-                file_content = file_meta["body"]
-
-                result = upload_file(user_id=user_id, file_name=file_name, file_content=file_content)
-                uploaded_files.append(
-                    {
-                        "file_id": result["file_id"],
-                        "file_name": file_name,
-                        "file_url": f"/api/documents/{result['file_id']}",
-                    }
-                )
+            uploaded_files = [
+                {
+                    "file_id": result["file_id"],
+                    "file_name": result["file_name"],
+                    "file_url": f"/api/documents/{result['file_id']}",
+                }
+                for result in results
+            ]
 
             self.write({"files": uploaded_files})
 
@@ -61,7 +61,7 @@ class OllamaServiceCheckHandler(BaseProtectedHandler):
         base_url = self.req_dict.get("base_url", "")
 
         try:
-            _ = ollama_alive(base_url)
+            _ = ollama_alive(base_url, max_age=0)
             update_ollama_provider(base_url)
             MODEL_PROVIDER_SETTINGS["ollama"]["base_url"] = base_url
             threading.Thread(target=sync_ollama_model_info, daemon=True).start()
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 
 from utils import log  # noqa: F401  # isort: skip
 import tornado.web
@@ -84,4 +85,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # pdf pages are extracted in spawned processes, which must not start the server again when frozen
+    multiprocessing.freeze_support()
     main()
@@ -144,6 +144,7 @@ def filter_message(
     conversation_id: str,
     before_message_id: Optional[str] = None,
     message_limit: Optional[int] = None,
+    created_after: Optional[datetime] = None,
 ) -> list[Message]:
     query = session.query(Message).filter(
         Message.conversation_id == conversation_id,
@@ -156,6 +157,9 @@ def filter_message(
         if message:
             query = query.filter(Message.created_at < message.created_at)
 
+    if created_after:
+        query = query.filter(Message.created_at > created_after)
+
     query = query.order_by(Message.created_at.desc())
 
     if message_limit and message_limit > 0:
@@ -1,4 +1,5 @@
 from datetime import datetime
+from enum import Enum
 from typing import Any, Optional
 
 from sqlalchemy import (
@@ -22,6 +23,11 @@ from models.document import DOCUMENTSTATUS
 from .sqlalchemy_types import GUID
 
 
+class RETRIEVALMODE(Enum):
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+
+
 class Knowledge(db.Base):
     __tablename__ = "knowledge"
     __table_args__ = (
@@ -38,6 +44,7 @@ class Knowledge(db.Base):
     message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     provider: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     similarity_threshold: Mapped[float] = mapped_column(Float, default=0.0, nullable=True)
+    retrieval_mode: Mapped[str] = mapped_column(String(32), default=RETRIEVALMODE.VECTOR.value, nullable=True)
     knowledge_status: Mapped[int] = mapped_column(Integer, default=DOCUMENTSTATUS.WAITING.value, nullable=True)
     chunk_size: Mapped[int] = mapped_column(BIGINT, default=FILE_SETTINGS["CHUNK_SIZE"], nullable=True)
     chunk_overlap: Mapped[int] = mapped_column(BIGINT, default=FILE_SETTINGS["CHUNK_OVERLAP"], nullable=True)
@@ -44,6 +44,7 @@ from models.bot import (
 )
 from models.conversation import Conversation
 from models.document import DOCUMENTSTATUS, Document
+from models.knowledge import RETRIEVALMODE
 from models.model_manager import DownloadStatus, Model
 from models.user import User, get_user
 from services.bot.model_template import (
@@ -233,6 +234,7 @@ class BotService:
                 "embedding_model": knowledge.embedding_model,
                 "index_params": knowledge.index_params,
                 "similarity_threshold": knowledge.similarity_threshold,
+                "retrieval_mode": knowledge.retrieval_mode,
                 "file_names": [
                     {
                         "file_name": doc.file_name,
@@ -427,6 +429,7 @@ class BotService:
                             "embedding_model": knowledge.embedding_model,
                             "index_params": knowledge.index_params,
                             "similarity_threshold": knowledge.similarity_threshold,
+                            "retrieval_mode": knowledge.retrieval_mode,
                             "file_names": file_list,
                             "chunk_size": knowledge.chunk_size,
                             "chunk_overlap": knowledge.chunk_overlap,
@@ -644,6 +647,7 @@ class BotService:
                         provider=knowledge.get("provider", OLLAMA_PROVIDER),
                         embedding_model=knowledge["embedding_model"],
                         similarity_threshold=knowledge["similarity_threshold"],
+                        retrieval_mode=knowledge.get("retrieval_mode") or RETRIEVALMODE.VECTOR.value,
                         index_params=index_params,
                         chunk_size=knowledge.get("chunk_size", FILE_SETTINGS["CHUNK_SIZE"]),
                         chunk_overlap=knowledge.get("chunk_overlap", FILE_SETTINGS["CHUNK_OVERLAP"]),
@@ -15,6 +15,7 @@ from core.model_providers.ollama.ollama_api import ollama_model_exist
 from database import db
 from models.bot import Bot, BotCategory, BotModelConfig, BotStatus, Site
 from models.document import DOCUMENTSTATUS, Document
+from models.knowledge import RETRIEVALMODE
 from models.model_manager import DownloadStatus
 from models.user import get_user
 from services.bot.model_template import char_template
@@ -171,6 +172,7 @@ class ImportBotService:
                     provider=knowledge.get("provider", OLLAMA_PROVIDER),
                     embedding_model=knowledge["embedding_model"],
                     similarity_threshold=knowledge["similarity_threshold"],
+                    retrieval_mode=knowledge.get("retrieval_mode") or RETRIEVALMODE.VECTOR.value,
                     index_params=index_params,
                     chunk_size=knowledge.get("chunk_size", FILE_SETTINGS["CHUNK_SIZE"]),
                     chunk_overlap=knowledge.get("chunk_overlap", FILE_SETTINGS["CHUNK_OVERLAP"]),
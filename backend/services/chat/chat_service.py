@@ -1,6 +1,4 @@
-import asyncio
 import logging
-import threading
 import uuid
 from collections.abc import AsyncGenerator
 from datetime import datetime
@@ -37,6 +35,8 @@ from core.queue.application_queue_manager import (
 )
 from core.tracking.client import ChatTrackingPayload, argo_tracking
 from database import db
+from events.conversation_event import conversation_messages_changed
+from handlers.base_handler import AppError
 from models.bot import BotCategory, BotModelConfig, get_bot, get_model_config
 from models.conversation import (
     Conversation,
@@ -46,12 +46,24 @@ from models.conversation import (
     get_message,
 )
 from services.bot.model_config import ModelConfigService
+from services.chat.generation_executor import GenerationJob, GenerationReservation, generation_executor
 from services.chat.util import get_file_docs
 
 
 class ChatService:
     @staticmethod
     async def say(user_id: str, args: Any):
+        # hold a queue slot while the records are written, a full queue refuses before any of them exists
+        reservation = generation_executor.reserve()
+        if reservation is None:
+            ChatService._raise_too_many_generations()
+        try:
+            return await ChatService._say(user_id, args, reservation)
+        finally:
+            reservation.release()
+
+    @staticmethod
+    async def _say(user_id: str, args: Any, reservation: GenerationReservation):
         query = args["message"]
         conversation_id = args["conversation_id"]
         bot_id = args["bot_id"]
@@ -140,19 +152,21 @@ class ChatService:
             message_id=message.id,
         )
 
-        # new thread
-        def run_worker_async():
-            asyncio.run(
-                ChatService.generate_worker(
-                    application_generate_entity=application_generate_entity,
-                    queue_manager=queue_manager,
-                    conversation_id=conversation.id,
-                    message_id=message.id,
-                )
-            )
-
-        worker_thread = threading.Thread(target=run_worker_async)
-        worker_thread.start()
+        # run on a generation worker loop, or wait for one in the queue
+        job = GenerationJob(
+            task_id=application_generate_entity.task_id,
+            user_id=user_id,
+            bot_id=bot_id,
+            run=lambda: ChatService.generate_worker(
+                application_generate_entity=application_generate_entity,
+                queue_manager=queue_manager,
+                conversation_id=conversation.id,
+                message_id=message.id,
+            ),
+            on_position=queue_manager.publish_position,
+            cancelled=lambda: queue_manager.stopped,
+        )
+        generation_executor.submit(job, reservation)
 
         argo_tracking(
             ChatTrackingPayload(
@@ -173,6 +187,14 @@ class ChatService:
             stream=stream,
         )
 
+    @staticmethod
+    def _raise_too_many_generations():
+        raise AppError(
+            translation_loader.translation.t("chat.too_many_generations", queued=generation_executor.waiting()),
+            Errcode.ErrcodeTooManyGenerations.value,
+            429,
+        )
+
     @staticmethod
     def get_cleaned_inputs(user_inputs: dict, bot_model_config: BotModelConfig):
         if user_inputs is None:
@@ -448,6 +470,7 @@ class ChatService:
                 message.query = application_generate_entity.query or message.query
 
                 session.commit()
+            conversation_messages_changed.send(conversation.id)
 
         return conversation, message
 
@@ -478,6 +501,8 @@ class ChatService:
             return
 
         ApplicationQueueManager.set_stop_flag(task_id, InvokeFrom.WEB_APP, user_id)
+        # stopped before it left the queue, free its place
+        generation_executor.cancel(task_id, user_id)
 
         if message_id:
             with db.session_scope() as session:
@@ -487,6 +512,7 @@ class ChatService:
 
                 message.is_stopped = True
                 session.commit()
+                conversation_messages_changed.send(message.conversation_id)
 
 
 class ModelConfigManager:
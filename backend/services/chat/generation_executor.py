@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from configs.settings import GENERATION_SETTINGS
+
+
+class GenerationQueueFullError(Exception):
+    """Raised by `submit` when the admission queue is full, the caller should answer 429."""
+
+
+@dataclass
+class GenerationJob:
+    task_id: str
+    user_id: str
+    bot_id: str
+    run: Callable[[], Awaitable[None]]
+    # called with the position in the queue whenever it changes, from whatever thread moved the queue
+    on_position: Optional[Callable[[int], None]] = None
+    # polled before the job starts, a job stopped while waiting is dropped
+    cancelled: Callable[[], bool] = lambda: False
+    # last reported position, 0 is running or never queued
+    position: int = field(default=0)
+
+
+class GenerationReservation:
+    """A queue slot held while a generation is being prepared, see `GenerationExecutor.reserve`."""
+
+    def __init__(self, executor: "GenerationExecutor"):
+        self._executor = executor
+        self.held = True
+
+    def release(self):
+        """Give the slot back, a no-op once the job was submitted with it."""
+        self._executor._release(self)
+
+
+class _WorkerLoop:
+    def __init__(self, name: str):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.running = 0
+        self.thread = threading.Thread(target=self._serve, name=name, daemon=True)
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class GenerationExecutor:
+    """
+    Runs chat generations on a fixed pool of long-lived event loops.
+
+    Every worker loop runs up to `tasks_per_worker` generations side by side, they spend their time waiting on
+    the model. A generation that cannot start at once, because the pool is busy or its user or bot is at its
+    cap, waits in a bounded queue and is told its position; a full queue rejects it. When a generation ends,
+    the first waiting job whose user and bot are under their caps takes its place.
+
+    Callers that write records before submitting take a slot with `reserve` first: reserved slots count as
+    queued, so a job submitted with its reservation is never rejected.
+    """
+
+    def __init__(self, workers: int, tasks_per_worker: int, queue_size: int, per_user: int, per_bot: int):
+        self.workers = max(1, workers)
+        self.tasks_per_worker = max(1, tasks_per_worker)
+        self.queue_size = queue_size
+        self.per_user = per_user
+        self.per_bot = per_bot
+
+        self._lock = threading.Lock()
+        self._loops: list[_WorkerLoop] = []
+        self._pending: deque[GenerationJob] = deque()
+        self._reserved = 0
+        self._running: dict[str, GenerationJob] = {}
+        self._users: Counter[str] = Counter()
+        self._bots: Counter[str] = Counter()
+
+    def start(self):
+        with self._lock:
+            if self._loops:
+                return
+            self._loops = [_WorkerLoop(f"generation-{index}") for index in range(self.workers)]
+        for worker in self._loops:
+            worker.thread.start()
+
+    def reserve(self) -> Optional[GenerationReservation]:
+        """Hold a queue slot for a job submitted later, None when the queue is full."""
+        with self._lock:
+            if len(self._pending) + self._reserved >= self.queue_size:
+                return None
+            self._reserved += 1
+            return GenerationReservation(self)
+
+    def _release(self, reservation: GenerationReservation):
+        with self._lock:
+            if reservation.held:
+                reservation.held = False
+                self._reserved -= 1
+
+    def submit(self, job: GenerationJob, reservation: Optional[GenerationReservation] = None) -> int:
+        """
+        Start the job or queue it, return 0 when it started and its position in the queue otherwise.
+        Without a held `reservation`, a full queue raises GenerationQueueFullError.
+        """
+        self.start()
+        with self._lock:
+            reserved = reservation is not None and reservation.held
+            if reserved:
+                reservation.held = False  # type: ignore[union-attr]
+                self._reserved -= 1
+            worker = self._free_worker()
+            if worker is not None and not self._pending and self._admissible(job):
+                self._start(job, worker)
+                return 0
+            if not reserved and len(self._pending) + self._reserved >= self.queue_size:
+                raise GenerationQueueFullError(f"{len(self._pending)} generations are waiting")
+            self._pending.append(job)
+            # a cap may hold the jobs ahead while this one can go
+            started = self._dispatch()
+        self._notify(started)
+        return job.position
+
+    def full(self) -> bool:
+        with self._lock:
+            return len(self._pending) + self._reserved >= self.queue_size
+
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def cancel(self, task_id: str, user_id: str) -> bool:
+        """Drop a waiting job of the user, running jobs are stopped through their queue manager."""
+        with self._lock:
+            for job in self._pending:
+                if job.task_id == task_id and job.user_id == user_id:
+                    self._pending.remove(job)
+                    break
+            else:
+                return False
+        self._notify([])
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.workers * self.tasks_per_worker,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "reserved": self._reserved,
+                "queue_size": self.queue_size,
+                "per_loop": {worker.name: worker.running for worker in self._loops},
+            }
+
+    def _admissible(self, job: GenerationJob) -> bool:
+        return self._users[job.user_id] < self.per_user and self._bots[job.bot_id] < self.per_bot
+
+    def _free_worker(self) -> Optional[_WorkerLoop]:
+        worker = min(self._loops, key=lambda w: w.running)
+        return worker if worker.running < self.tasks_per_worker else None
+
+    def _start(self, job: GenerationJob, worker: _WorkerLoop):
+        worker.running += 1
+        self._running[job.task_id] = job
+        self._users[job.user_id] += 1
+        self._bots[job.bot_id] += 1
+        asyncio.run_coroutine_threadsafe(self._run(job, worker), worker.loop)
+
+    def _dispatch(self) -> list[GenerationJob]:
+        """Start the waiting jobs that fit, under the lock, return them."""
+        started = []
+        for job in list(self._pending):
+            if job.cancelled():
+                self._pending.remove(job)
+                continue
+            worker = self._free_worker()
+            if worker is None:
+                break
+            if self._admissible(job):
+                self._pending.remove(job)
+                self._start(job, worker)
+                started.append(job)
+        return started
+
+    def _notify(self, started: list[GenerationJob]):
+        with self._lock:
+            waiting = list(self._pending)
+        for job in started:
+            self._position(job, 0)
+        for position, job in enumerate(waiting, start=1):
+            self._position(job, position)
+
+    @staticmethod
+    def _position(job: GenerationJob, position: int):
+        if job.position == position:
+            return
+        job.position = position
+        if job.on_position is None:
+            return
+        try:
+            job.on_position(position)
+        except Exception:
+            logging.exception(f"report queue position of generation {job.task_id} failed")
+
+    async def _run(self, job: GenerationJob, worker: _WorkerLoop):
+        try:
+            await job.run()
+        except Exception:
+            logging.exception(f"generation {job.task_id} failed")
+        finally:
+            with self._lock:
+                worker.running -= 1
+                self._running.pop(job.task_id, None)
+                for counter, key in ((self._users, job.user_id), (self._bots, job.bot_id)):
+                    counter[key] -= 1
+                    if counter[key] <= 0:
+                        del counter[key]
+                started = self._dispatch()
+            self._notify(started)
+
+
+generation_executor = GenerationExecutor(
+    workers=GENERATION_SETTINGS["WORKERS"],
+    tasks_per_worker=GENERATION_SETTINGS["TASKS_PER_WORKER"],
+    queue_size=GENERATION_SETTINGS["QUEUE_SIZE"],
+    per_user=GENERATION_SETTINGS["PER_USER"],
+    per_bot=GENERATION_SETTINGS["PER_BOT"],
+)
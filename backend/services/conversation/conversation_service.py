@@ -12,6 +12,7 @@ from core.errors.notfound import NotFoundError
 from core.errors.validate import ValidateError
 from core.model_providers import model_provider_manager
 from database.db import session_scope
+from events.conversation_event import conversation_messages_changed
 from models.bot import Bot, get_model_config
 from models.conversation import (
     Conversation,
@@ -177,6 +178,7 @@ class ConversationService:
             if conversation:
                 conversation.is_deleted = True
                 session.commit()
+        conversation_messages_changed.send(conversation_id)
 
     @classmethod
     def clear_messages(cls, conversation_id: str):
@@ -193,6 +195,7 @@ class ConversationService:
                     del chat_metadata["timed_world_info"]
                     conversation.chat_metadata = chat_metadata
                     session.commit()
+        conversation_messages_changed.send(conversation_id)
 
     @classmethod
     def rename(cls, conversation_id: str, name: str, auto_generate: bool) -> Conversation:
@@ -549,6 +552,7 @@ class MessageService:
                 )
 
             session.commit()
+            conversation_messages_changed.send(message.conversation_id)
 
             return message
 
@@ -586,10 +590,13 @@ class MessageService:
                 message.answer = None
                 message.answer_deleted = True
 
+            conversation_id = message.conversation_id
             if message.query is None and message.answer is None:
                 session.delete(message)
                 session.commit()
+                conversation_messages_changed.send(conversation_id)
                 return None
 
             session.commit()
+            conversation_messages_changed.send(conversation_id)
             return message
@@ -7,12 +7,14 @@ from qdrant_client import models
 from sqlalchemy.exc import SQLAlchemyError
 
 from configs.settings import FILE_SETTINGS
+from core.features.keyword_index import get_keyword_index
 from core.tracking.client import DocumentTrackingPayload, argo_tracking
 from database.db import session_scope
 from database.vector import get_qdrant_client
+from events.document_event import document_waiting
 from models.dataset import PERMISSION, Dataset
 from models.document import DOCUMENTSTATUS, Document
-from models.knowledge import Knowledge
+from models.knowledge import RETRIEVALMODE, Knowledge
 
 
 class DocDB:
@@ -97,6 +99,7 @@ class CollectionDB:
         top_k=FILE_SETTINGS["TOP_K"],
         folder="",
         knowledge_status=DOCUMENTSTATUS.WAITING.value,
+        retrieval_mode=RETRIEVALMODE.VECTOR.value,
     ) -> str:
         collection_name = f"c_{str(uuid.uuid4()).replace('-', '')}"
         with session_scope() as session:
@@ -114,6 +117,7 @@ class CollectionDB:
                 top_k=top_k,
                 folder=folder,
                 knowledge_status=knowledge_status,
+                retrieval_mode=retrieval_mode,
             )
             session.add(info)
         return collection_name
@@ -177,6 +181,7 @@ class CollectionDB:
         chunk_overlap: int,
         top_k: int,
         folder: str,
+        retrieval_mode: str,
     ):
         with session_scope() as session:
             collection_name = collection_info.get("collection_name", "")
@@ -190,6 +195,7 @@ class CollectionDB:
                 knowledge.chunk_size = chunk_size
                 knowledge.chunk_overlap = chunk_overlap
                 knowledge.top_k = top_k
+                knowledge.retrieval_mode = retrieval_mode
                 if folder != knowledge.folder:
                     documents = session.query(Document).filter(Document.collection_name == collection_name).all()
                     for document in documents:
@@ -203,6 +209,9 @@ class CollectionDB:
                     if collection_name in [col.name for col in get_qdrant_client().get_collections().collections]:
                         get_qdrant_client().delete_collection(collection_name=collection_name)
                         logging.info(f"drop tmp collection {collection_name}")
+                    keyword_index = get_keyword_index(collection_name)
+                    keyword_index.clear()
+                    keyword_index.mark_complete()
 
                     index_params = collection_info.get("index_params", {})
 
@@ -279,6 +288,9 @@ class PartitionDB:
             session.add(doc)
 
             argo_tracking(DocumentTrackingPayload())
+
+        if status == DOCUMENTSTATUS.WAITING.value:
+            document_waiting.send(partition_name, collection_name=collection_name)
         return partition_name
 
     @staticmethod
@@ -342,12 +354,17 @@ class PartitionDB:
 
     @staticmethod
     def update_status(partition_name: str, status: int, msg: Optional[str] = ""):
+        collection_name = None
         with session_scope() as session:
             document = session.query(Document).filter(Document.partition_name == partition_name).one_or_none()
             if document:
                 document.document_status = status
                 if msg:
                     document.message = msg
+                collection_name = document.collection_name
+
+        if collection_name is not None and status == DOCUMENTSTATUS.WAITING.value:
+            document_waiting.send(partition_name, collection_name=collection_name)
 
     @staticmethod
     def update_content_info(partition_name: str, content: str, content_length: int):
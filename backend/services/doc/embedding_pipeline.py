@@ -0,0 +1,199 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import models
+
+from configs.settings import EMBEDDING_SETTINGS
+from core.features.keyword_index import get_keyword_index
+from core.model_providers.utils import extract_base_provider
+from database.vector import get_qdrant_client
+
+
+class AdaptiveBatchSize:
+    """
+    Embedding batch size per (provider, model).
+
+    Starts at the provider limit, halves when a request fails and doubles back after a run of successes.
+    The learned size is shared across documents so the next upload starts where the last one ended.
+    """
+
+    _learned: dict[tuple[str, str], int] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, provider: str, model_name: str):
+        base_provider = extract_base_provider(provider)
+        limits = EMBEDDING_SETTINGS["BATCH_SIZE"]
+        self.key = (base_provider, model_name)
+        self.max_size = limits.get(base_provider, limits["default"])
+        self._successes = 0
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._learned.get(self.key, self.max_size)
+
+    def shrink(self, failed_size: int):
+        with self._lock:
+            self._learned[self.key] = max(1, min(self._learned.get(self.key, self.max_size), failed_size // 2))
+            self._successes = 0
+
+    def grow(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes < EMBEDDING_SETTINGS["GROW_AFTER"]:
+                return
+            self._successes = 0
+            current = self._learned.get(self.key, self.max_size)
+            self._learned[self.key] = min(self.max_size, current * 2)
+
+
+class EmbeddingPipeline:
+    """
+    Embeds chunks of one partition and upserts them into qdrant.
+
+    Chunks are pulled lazily from the source, several embedding requests are kept in flight, and upserts run
+    on their own thread behind a bounded queue, which also feeds the keyword index. Progress follows how much
+    of the source has been read; progress writes and the deletion check are throttled.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        provider: str,
+        model_name: str,
+        collection_name: str,
+        partition_name: str,
+        source_progress: Callable[[], float],
+        is_alive: Callable[[], bool],
+        on_progress: Callable[[float], None],
+    ):
+        self.embedding = embedding
+        self.collection_name = collection_name
+        self.partition_name = partition_name
+        self.source_progress = source_progress
+        self.is_alive = is_alive
+        self.on_progress = on_progress
+        self.batch_size = AdaptiveBatchSize(provider, model_name)
+        self.keyword_index = get_keyword_index(collection_name)
+        self.concurrency = max(1, EMBEDDING_SETTINGS["CONCURRENCY"])
+        self.progress_interval = EMBEDDING_SETTINGS["PROGRESS_INTERVAL"]
+
+        self.count = 0
+        self._last_checkpoint = 0.0
+
+    def run(self, docs: Iterable[Document]) -> bool:
+        upsert_queue: queue.Queue[Optional[list[models.PointStruct]]] = queue.Queue(maxsize=self.concurrency * 2)
+        upserter = threading.Thread(target=self._upsert_loop, args=(upsert_queue,), daemon=True)
+        upserter.start()
+
+        alive = True
+        in_flight: set[Future] = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embedding") as executor:
+                for texts, metadatas in self._batches(docs):
+                    while len(in_flight) >= self.concurrency:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect(done, upsert_queue)
+
+                    if not self._checkpoint():
+                        alive = False
+                        break
+                    in_flight.add(executor.submit(self._embed, texts, metadatas))
+
+                if not alive:
+                    for future in in_flight:
+                        future.cancel()
+                done, _ = wait(in_flight)
+                self._collect(done, upsert_queue)
+        finally:
+            upsert_queue.put(None)
+            upserter.join()
+
+        if alive:
+            self.on_progress(1.0)
+        return alive
+
+    def _batches(self, docs: Iterable[Document]) -> Iterator[tuple[list[str], list[dict[str, Any]]]]:
+        texts: list[str] = []
+        metadatas: list[dict[str, Any]] = []
+        for doc in docs:
+            texts.append(doc.page_content.replace("\n", " "))
+            metadatas.append(doc.metadata)
+            if len(texts) >= self.batch_size.size:
+                yield texts, metadatas
+                texts, metadatas = [], []
+        if texts:
+            yield texts, metadatas
+
+    def _embed(self, texts: list[str], metadatas: list[dict[str, Any]]) -> tuple[int, list[models.PointStruct]]:
+        try:
+            vectors = self.embedding.embed_documents(texts)
+        except Exception:
+            if len(texts) == 1:
+                logging.exception(f"Failed to embed chunk of partition {self.partition_name}")
+                return 1, []
+            self.batch_size.shrink(len(texts))
+            middle = len(texts) // 2
+            left_count, left_points = self._embed(texts[:middle], metadatas[:middle])
+            right_count, right_points = self._embed(texts[middle:], metadatas[middle:])
+            return left_count + right_count, left_points + right_points
+
+        self.batch_size.grow()
+        points = [
+            models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector,
+                payload={
+                    "page_content": text,
+                    self.partition_name: "1",
+                    "metadata": metadata,
+                },
+            )
+            for text, vector, metadata in zip(texts, vectors, metadatas)
+        ]
+        return len(texts), points
+
+    def _collect(self, done: Iterable[Future], upsert_queue: queue.Queue):
+        for future in done:
+            if future.cancelled():
+                continue
+            count, points = future.result()
+            self.count += count
+            if points:
+                upsert_queue.put(points)
+
+    def _checkpoint(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_checkpoint < self.progress_interval:
+            return True
+        self._last_checkpoint = now
+        if not self.is_alive():
+            return False
+        self.on_progress(round(min(self.source_progress(), 0.99), 2))
+        return True
+
+    def _upsert_loop(self, upsert_queue: queue.Queue):
+        while True:
+            points = upsert_queue.get()
+            if points is None:
+                return
+            try:
+                get_qdrant_client().upsert(self.collection_name, points=points, wait=False)
+            except Exception:
+                logging.exception("Failed to upsert points to qdrant.")
+                continue
+            try:
+                self.keyword_index.add(
+                    self.partition_name, [(point.id, point.payload["page_content"]) for point in points]
+                )
+            except sqlite3.Error:
+                logging.exception("Failed to update keyword index.")
@@ -0,0 +1,441 @@
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from configs.env import ARGO_STORAGE_PATH_FOLDER_INDEX, FOLDER_TREE_FILE
+from core.file.file_db import FileDB
+from services.doc.doc_db import CollectionDB, PartitionDB
+from services.doc.milvus_op import DocCollectionOp
+from utils.file_hash import calculate_sha256
+
+SUPPORTED_EXTENSIONS = {
+    ".txt",
+    ".docx",
+    ".xlsx",
+    ".xls",
+    ".csv",
+    ".pptx",
+    ".ppt",
+    ".pdf",
+    ".md",
+    ".json",
+    ".html",
+}
+
+
+def is_supported_file(file_name: str) -> bool:
+    if file_name.startswith(".") or "." not in file_name:
+        return False
+    return os.path.splitext(file_name)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def write_json_atomic(path: Path, data: dict):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=4, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class DeltaType(str, Enum):
+    ADD = "add"
+    MODIFY = "modify"
+    DELETE = "delete"
+    RENAME = "rename"
+
+
+@dataclass
+class FileDelta:
+    type: DeltaType
+    file_hash: str
+    path: str
+    old_hash: str = ""
+    old_path: str = ""
+
+
+class FolderIndex:
+    """
+    Persisted (path -> size, mtime, inode, sha256) index of one knowledge folder.
+
+    `refresh` walks the folder with stat only and re-hashes just the files whose stat changed, then diffs the
+    resulting hash -> path tree against the previous one.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        folder_id = hashlib.md5(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        self.index_path = Path(ARGO_STORAGE_PATH_FOLDER_INDEX) / f"{folder_id}.json"
+        self.files: dict[str, list] = {}
+        self.tree: dict[str, str] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+            if data.get("folder") == self.folder:
+                self.files = data.get("files", {})
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.exception(f"Failed to load folder index of {self.folder}, rebuilding")
+        self.tree = {entry[3]: path for path, entry in self.files.items()}
+
+    def _walk(self) -> dict[str, os.stat_result]:
+        stats: dict[str, os.stat_result] = {}
+        stack = [self.folder]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and is_supported_file(entry.name):
+                            stats[os.sep.join([dir_path, entry.name])] = entry.stat()
+            except OSError:
+                logging.warning(f"Failed to scan folder {dir_path}")
+        return stats
+
+    def refresh(self) -> list[FileDelta]:
+        files: dict[str, list] = {}
+        for path, stat in self._walk().items():
+            entry = self.files.get(path)
+            if entry and entry[:3] == [stat.st_size, stat.st_mtime_ns, stat.st_ino]:
+                files[path] = entry
+                continue
+            try:
+                file_hash = calculate_sha256(path)
+            except OSError:
+                logging.warning(f"Failed to hash file {path}")
+                continue
+            files[path] = [stat.st_size, stat.st_mtime_ns, stat.st_ino, file_hash]
+
+        tree = {entry[3]: path for path, entry in files.items()}
+        deltas = diff_trees(self.tree, tree)
+        changed = files != self.files
+        self.files = files
+        self.tree = tree
+        if changed:
+            write_json_atomic(self.index_path, {"folder": self.folder, "files": files})
+        return deltas
+
+    def write_tree(self):
+        tree_path = Path(self.folder) / FOLDER_TREE_FILE
+        try:
+            if json.loads(tree_path.read_text(encoding="utf-8")) == self.tree:
+                return
+        except Exception:
+            pass
+        write_json_atomic(tree_path, self.tree)
+
+
+def diff_trees(old_tree: dict[str, str], new_tree: dict[str, str]) -> list[FileDelta]:
+    deltas: list[FileDelta] = []
+    old_hash_by_path = {path: file_hash for file_hash, path in old_tree.items()}
+    replaced: set[str] = set()
+    for file_hash, path in new_tree.items():
+        old_path = old_tree.get(file_hash)
+        if old_path is None:
+            old_hash = old_hash_by_path.get(path)
+            if old_hash and old_hash not in new_tree:
+                replaced.add(old_hash)
+                deltas.append(FileDelta(DeltaType.MODIFY, file_hash, path, old_hash=old_hash, old_path=path))
+            else:
+                deltas.append(FileDelta(DeltaType.ADD, file_hash, path))
+        elif old_path != path:
+            deltas.append(FileDelta(DeltaType.RENAME, file_hash, path, old_hash=file_hash, old_path=old_path))
+    for file_hash, path in old_tree.items():
+        if file_hash not in new_tree and file_hash not in replaced:
+            deltas.append(FileDelta(DeltaType.DELETE, file_hash, path))
+    return deltas
+
+
+class InotifyWatcher:
+    """Recursive inotify watches over knowledge folders, linux only."""
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = (
+        IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self._fd = fd
+        self._watches: dict[int, str] = {}
+        self._folders: set[str] = set()
+
+    @classmethod
+    def create(cls) -> Optional["InotifyWatcher"]:
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    @property
+    def folders(self) -> set[str]:
+        return set(self._folders)
+
+    def watch(self, folder: str) -> bool:
+        if not self._add_tree(folder, folder):
+            self.unwatch(folder)
+            return False
+        self._folders.add(folder)
+        return True
+
+    def unwatch(self, folder: str):
+        for wd, watched in list(self._watches.items()):
+            if watched == folder:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+        self._folders.discard(folder)
+
+    def _add_tree(self, folder: str, root: str) -> bool:
+        for dir_path, dir_names, _ in os.walk(root):
+            dir_names[:] = [name for name in dir_names if not name.startswith(".")]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), self.MASK)
+            if wd < 0:
+                logging.warning(f"inotify watch failed on {dir_path}: {os.strerror(ctypes.get_errno())}")
+                return False
+            self._watches[wd] = folder
+        return True
+
+    def wait(self, timeout: float) -> set[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        dirty: set[str] = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return dirty
+
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            start = offset + self.EVENT_HEADER.size
+            name = data[start : start + length].rstrip(b"\0").decode("utf-8", errors="ignore")
+            offset = start + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                dirty.update(self._folders)
+                continue
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if name.startswith("."):
+                continue
+            dirty.add(folder)
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # new sub folders are not covered by the existing watches
+                self.watch(folder)
+        return dirty
+
+
+class FolderSyncEngine:
+    """
+    Keeps folder-backed knowledge bases in sync with their folders.
+
+    Changes are picked up from inotify where available and by a stat walk otherwise; each folder index yields
+    add/modify/delete/rename deltas which are applied to every collection bound to the folder. A collection
+    is fully reconciled against its partitions the first time it is seen.
+    """
+
+    def __init__(self, poll_interval: float = 5, safety_interval: float = 300):
+        self.poll_interval = poll_interval
+        self.safety_interval = safety_interval
+        self._lock = threading.Lock()
+        self._indexes: dict[str, FolderIndex] = {}
+        self._folder_locks: dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._pending: dict[str, list[FileDelta]] = defaultdict(list)
+        self._reconciled: set[tuple[str, str]] = set()
+        self._last_scan: dict[str, float] = {}
+        self._watcher: Optional[InotifyWatcher] = None
+
+    def scan(self, folder: str) -> dict[str, str]:
+        """Refresh the index of `folder` and return its sha256 -> path tree; deltas are applied later."""
+        with self._lock:
+            folder_lock = self._folder_locks[folder]
+        with folder_lock:
+            index = self._get_index(folder)
+            deltas = index.refresh()
+            index.write_tree()
+            self._last_scan[folder] = time.monotonic()
+            if deltas:
+                with self._lock:
+                    self._pending[folder].extend(deltas)
+            return dict(index.tree)
+
+    def run(self):
+        self._watcher = InotifyWatcher.create()
+        if self._watcher is None:
+            logging.info("inotify unavailable, folder sync falls back to stat polling")
+
+        while True:
+            if self._watcher:
+                dirty = self._watcher.wait(timeout=self.poll_interval)
+            else:
+                time.sleep(self.poll_interval)
+                dirty = set()
+
+            try:
+                self._sync(dirty)
+            except Exception:
+                logging.exception("An unexpected error occurred.")
+
+    def _sync(self, dirty: set[str]):
+        collection_map: dict[str, list[str]] = defaultdict(list)
+        for knowledge in CollectionDB.get_all_db_collections():
+            if knowledge.folder and os.path.isdir(knowledge.folder):
+                collection_map[knowledge.folder].append(knowledge.collection_name)
+
+        if self._watcher:
+            for folder in self._watcher.folders - collection_map.keys():
+                self._watcher.unwatch(folder)
+
+        now = time.monotonic()
+        for folder, collection_names in collection_map.items():
+            watched = self._watcher is not None and (folder in self._watcher.folders or self._watcher.watch(folder))
+            interval = self.safety_interval if watched else self.poll_interval
+            unseen = [name for name in collection_names if (name, folder) not in self._reconciled]
+            with self._lock:
+                has_pending = bool(self._pending.get(folder))
+            if folder not in dirty and not unseen and not has_pending:
+                if now - self._last_scan.get(folder, 0) < interval:
+                    continue
+
+            tree = self.scan(folder)
+            with self._lock:
+                deltas = self._pending.pop(folder, [])
+            for collection_name in collection_names:
+                if (collection_name, folder) in self._reconciled:
+                    if deltas:
+                        self._apply(collection_name, deltas)
+                else:
+                    self._reconcile(collection_name, tree)
+                    self._reconciled.add((collection_name, folder))
+
+    def _get_index(self, folder: str) -> FolderIndex:
+        with self._lock:
+            if folder not in self._indexes:
+                self._indexes[folder] = FolderIndex(folder)
+            return self._indexes[folder]
+
+    @staticmethod
+    def _partitions_by_hash(collection_name: str) -> dict[str, list]:
+        partitions = defaultdict(list)
+        for document in PartitionDB.get_documents_by_collection_name(collection_name=collection_name):
+            file_hash = document.file_url.replace("/api/documents/", "").split(".")[0]
+            partitions[file_hash].append(document)
+        return partitions
+
+    def _reconcile(self, collection_name: str, tree: dict[str, str]):
+        partitions = self._partitions_by_hash(collection_name)
+        deltas = [FileDelta(DeltaType.ADD, file_hash, path) for file_hash, path in tree.items()]
+        deltas += [
+            FileDelta(DeltaType.DELETE, file_hash, "")
+            for file_hash, documents in partitions.items()
+            if file_hash not in tree
+        ]
+        deltas += [
+            FileDelta(DeltaType.RENAME, file_hash, tree[file_hash], old_hash=file_hash)
+            for file_hash, documents in partitions.items()
+            if file_hash in tree
+            and any(document.file_name != os.path.basename(tree[file_hash]) for document in documents)
+        ]
+        if deltas:
+            self._apply(collection_name, deltas, partitions)
+
+    def _apply(self, collection_name: str, deltas: list[FileDelta], partitions: Optional[dict[str, list]] = None):
+        knowledge = CollectionDB.get_collection_by_name(collection_name=collection_name)
+        if knowledge is None:
+            return
+        if partitions is None:
+            partitions = self._partitions_by_hash(collection_name)
+
+        for delta in deltas:
+            if delta.type in {DeltaType.DELETE, DeltaType.MODIFY}:
+                drop_hash = delta.old_hash if delta.type == DeltaType.MODIFY else delta.file_hash
+                for document in partitions.pop(drop_hash, []):
+                    DocCollectionOp.drop_partition(
+                        collection_name=collection_name, partition_name=document.partition_name
+                    )
+
+            if delta.type in {DeltaType.ADD, DeltaType.MODIFY} and delta.file_hash not in partitions:
+                logging.info(f"knowledge_name: {knowledge.knowledge_name} {delta.type.value}: {delta.path}")
+                partitions[delta.file_hash] = [self._create_document(knowledge, delta)]
+
+            if delta.type == DeltaType.RENAME:
+                file_name = os.path.basename(delta.path)
+                for document in partitions.get(delta.file_hash, []):
+                    if document.file_name == file_name:
+                        continue
+                    PartitionDB.update_document_name(partition_name=document.partition_name, file_name=file_name)
+                    FileDB.update_file_name(user_id=knowledge.user_id, file_id=document.file_id, file_name=file_name)
+
+    @staticmethod
+    def _create_document(knowledge, delta: FileDelta):
+        extension = os.path.splitext(delta.path)[1]
+        file_name = os.path.basename(delta.path)
+        file_id = f"{delta.file_hash}{extension}"
+        file_size = os.path.getsize(delta.path)
+        if not FileDB.get_file_by_id(file_id=file_id):
+            FileDB.create_new_file(
+                user_id=knowledge.user_id,
+                file_id=file_id,
+                file_name=file_name,
+                file_size=file_size,
+            )
+        content_type, _ = mimetypes.guess_type(delta.path)
+        if not content_type:
+            content_type = file_name.split(".")[-1]
+        partition_name = PartitionDB.create_document(
+            collection_name=knowledge.collection_name,
+            file_id=file_id,
+            file_name=file_name,
+            file_url=f"/api/documents/{file_id}",
+            file_type=content_type,
+            file_size=file_size,
+            description=file_name,
+            progress=0.0,
+        )
+        return PartitionDB.get_partition_by_partition_name(partition_name=partition_name)
+
+
+folder_sync_engine = FolderSyncEngine()
@@ -0,0 +1,189 @@
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from configs.settings import DOCUMENT_PROCESS_SETTINGS
+from models.document import DOCUMENTSTATUS
+from services.doc.doc_db import CollectionDB, PartitionDB
+from services.doc.milvus_op import DocCollectionOp
+from services.doc.url_parse import RecursiveUrlLoader
+
+
+class DocumentIngestQueue:
+    """
+    Document ingestion queue served by a fixed pool of worker threads.
+
+    WAITING rows of the document table are the persisted backlog: `recover` re-enqueues them after a restart
+    and a slow reconcile pass picks up anything that was never signalled. Pending partitions are grouped by
+    collection and served round-robin, so one large knowledge base cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        retry_delay: float,
+        max_retry_delay: float,
+        reconcile_interval: float,
+        throughput_window: float,
+    ):
+        self.workers = max(1, workers)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.reconcile_interval = reconcile_interval
+        self.throughput_window = throughput_window
+
+        self._cond = threading.Condition()
+        self._pending: OrderedDict[str, deque[str]] = OrderedDict()
+        self._deferred: list[tuple[float, str, str]] = []
+        self._queued: set[str] = set()
+        self._running: set[str] = set()
+        self._attempts: dict[str, int] = {}
+        self._finished_at: deque[float] = deque()
+        self._processed = 0
+        self._failed = 0
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f"document-ingest-{index}", daemon=True).start()
+        threading.Thread(target=self._reconcile, name="document-ingest-reconcile", daemon=True).start()
+
+    def submit(self, partition_name: str, collection_name: str):
+        with self._cond:
+            if partition_name in self._queued or partition_name in self._running:
+                return
+            self._queued.add(partition_name)
+            self._pending.setdefault(collection_name, deque()).append(partition_name)
+            self._cond.notify()
+
+    def recover(self):
+        documents = PartitionDB.get_waiting_documents() or []
+        for document in documents:
+            self.submit(partition_name=document.partition_name, collection_name=document.collection_name)
+        return len(documents)
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._trim_finished(now)
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(len(partitions) for partitions in self._pending.values()),
+                "deferred": len(self._deferred),
+                "running": len(self._running),
+                "collections": {name: len(partitions) for name, partitions in self._pending.items()},
+                "processed": self._processed,
+                "failed": self._failed,
+                "throughput_per_minute": round(len(self._finished_at) * 60 / self.throughput_window, 2),
+            }
+
+    def _next(self) -> tuple[str, str]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._deferred and self._deferred[0][0] <= now:
+                    _, collection_name, partition_name = heapq.heappop(self._deferred)
+                    self._pending.setdefault(collection_name, deque()).append(partition_name)
+
+                if self._pending:
+                    collection_name, partitions = next(iter(self._pending.items()))
+                    partition_name = partitions.popleft()
+                    if partitions:
+                        self._pending.move_to_end(collection_name)
+                    else:
+                        del self._pending[collection_name]
+                    self._queued.discard(partition_name)
+                    self._running.add(partition_name)
+                    return collection_name, partition_name
+
+                timeout = self._deferred[0][0] - now if self._deferred else None
+                self._cond.wait(timeout=timeout)
+
+    def _work(self):
+        while True:
+            collection_name, partition_name = self._next()
+            status = None
+            try:
+                status = self._process(partition_name)
+            except Exception:
+                logging.exception(f"Failed to process document {partition_name}")
+                status = DOCUMENTSTATUS.WAITING.value
+            finally:
+                self._finish(collection_name, partition_name, status)
+
+    def _process(self, partition_name: str) -> Optional[int]:
+        document = PartitionDB.get_partition_by_partition_name(partition_name=partition_name)
+        if document is None or document.document_status != DOCUMENTSTATUS.WAITING.value:
+            return None
+
+        knowledge = CollectionDB.get_collection_by_name(collection_name=document.collection_name)
+        if knowledge is None or knowledge.knowledge_status == DOCUMENTSTATUS.READY.value:
+            # not installed yet, bot install puts the documents back to WAITING
+            return None
+        if knowledge.knowledge_status != DOCUMENTSTATUS.WAITING.value:
+            CollectionDB.update_collection_status(
+                collection_name=document.collection_name,
+                status=DOCUMENTSTATUS.WAITING.value,
+            )
+
+        if document.file_type == "url":
+            url_process = RecursiveUrlLoader(document=document)
+            url_process.upload()
+        else:
+            DocCollectionOp.upload_file(document=document)
+
+        document = PartitionDB.get_partition_by_partition_name(partition_name=partition_name)
+        return document.document_status if document else None
+
+    def _finish(self, collection_name: str, partition_name: str, status: Optional[int]):
+        with self._cond:
+            self._running.discard(partition_name)
+            if status == DOCUMENTSTATUS.WAITING.value:
+                # embedding model missing or knowledge busy, try again later
+                attempts = self._attempts.get(partition_name, 0) + 1
+                self._attempts[partition_name] = attempts
+                delay = min(self.retry_delay * attempts, self.max_retry_delay)
+                self._queued.add(partition_name)
+                heapq.heappush(self._deferred, (time.monotonic() + delay, collection_name, partition_name))
+                self._cond.notify()
+                return
+
+            self._attempts.pop(partition_name, None)
+            if status == DOCUMENTSTATUS.FINISH.value:
+                self._processed += 1
+            elif status == DOCUMENTSTATUS.FAIL.value:
+                self._failed += 1
+            else:
+                return
+            now = time.monotonic()
+            self._finished_at.append(now)
+            self._trim_finished(now)
+
+    def _trim_finished(self, now: float):
+        while self._finished_at and now - self._finished_at[0] > self.throughput_window:
+            self._finished_at.popleft()
+
+    def _reconcile(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.recover()
+            except Exception:
+                logging.exception("Reconcile waiting documents failed")
+
+
+ingest_queue = DocumentIngestQueue(
+    workers=DOCUMENT_PROCESS_SETTINGS["WORKERS"],
+    retry_delay=DOCUMENT_PROCESS_SETTINGS["RETRY_DELAY"],
+    max_retry_delay=DOCUMENT_PROCESS_SETTINGS["MAX_RETRY_DELAY"],
+    reconcile_interval=DOCUMENT_PROCESS_SETTINGS["RECONCILE_INTERVAL"],
+    throughput_window=DOCUMENT_PROCESS_SETTINGS["THROUGHPUT_WINDOW"],
+)
@@ -1,12 +1,13 @@
+import itertools
 import json
 import logging
 import os
-import uuid
+import threading
 from pathlib import Path
-from typing import Any, Union
+from typing import Any, Optional, Union
 
+from langchain_core.embeddings import Embeddings
 from qdrant_client import models
-from tqdm import tqdm
 
 from configs.env import (
     ARGO_STORAGE_PATH_DOCUMENTS,
@@ -14,6 +15,8 @@ from configs.env import (
     MILVUS_DISTANCE_METHOD,
 )
 from configs.settings import FILE_SETTINGS
+from core.features.embedding_cache import with_embedding_cache
+from core.features.keyword_index import drop_keyword_index, get_keyword_index
 from core.file.file_db import FileDB
 from core.i18n.translation import translation_loader
 from core.model_providers import model_provider_manager
@@ -22,11 +25,21 @@ from core.model_providers.ollama.ollama_api import ollama_model_exist
 from core.tracking.client import KnowledgeTrackingPayload, argo_tracking
 from database.vector import get_qdrant_client
 from models.document import DOCUMENTSTATUS, Document
+from models.knowledge import RETRIEVALMODE
 from services.common.provider_setting_service import get_provider_setting
 from services.doc import util
 from services.doc.doc_db import CollectionDB, PartitionDB
+from services.doc.embedding_pipeline import EmbeddingPipeline
 from utils.path import app_path
 
+_collection_locks: dict[str, threading.Lock] = {}
+_collection_locks_lock = threading.Lock()
+
+
+def _collection_lock(collection_name: str) -> threading.Lock:
+    with _collection_locks_lock:
+        return _collection_locks.setdefault(collection_name, threading.Lock())
+
 
 class DocCollectionOp:
     @staticmethod
@@ -41,6 +54,7 @@ class DocCollectionOp:
         top_k: int = FILE_SETTINGS["TOP_K"],
         folder: str = "",
         similarity_threshold: float = 0.0,
+        retrieval_mode: str = RETRIEVALMODE.VECTOR.value,
         index_type: str = "HNSW",
         metric_type: str = MILVUS_DISTANCE_METHOD,
         params=None,
@@ -77,6 +91,7 @@ class DocCollectionOp:
             chunk_overlap=chunk_overlap,
             top_k=top_k,
             folder=folder,
+            retrieval_mode=retrieval_mode,
         )
 
         hnsw_config = models.HnswConfigDiff(
@@ -100,6 +115,7 @@ class DocCollectionOp:
             "metadata",
             field_schema="keyword",
         )
+        get_keyword_index(collection_name).mark_complete()
 
         CollectionDB.update_collection_status(collection_name=collection_name, status=DOCUMENTSTATUS.FINISH.value)
 
@@ -115,6 +131,7 @@ class DocCollectionOp:
         if collection_name in [col.name for col in get_qdrant_client().get_collections().collections]:
             get_qdrant_client().delete_collection(collection_name=collection_name)
             logging.info(f"drop collection {collection_name}")
+        drop_keyword_index(collection_name)
 
         documents = PartitionDB.get_documents_by_collection_name(collection_name=collection_name)
         knowledge = CollectionDB.get_collection_by_name(collection_name=collection_name)
@@ -136,6 +153,44 @@ class DocCollectionOp:
             if site_count == 0:
                 FileDB.delete_file(file_id=document.file_id)
 
+    @staticmethod
+    def ensure_vector_collection(collection_name: str, embedding: Embeddings, provider: str):
+        """Create the vector collection on the first upload, ingest workers uploading to it at once create it once."""
+        if get_qdrant_client().collection_exists(collection_name):
+            return
+        with _collection_lock(collection_name):
+            if get_qdrant_client().collection_exists(collection_name):
+                return
+            try:
+                vectors = embedding.embed_query("test")
+                dimension = len(vectors)
+            except Exception:
+                dimension = 768
+                logging.exception(f"Failed to create embedding instance for provider '{provider}'")
+
+            index_params: dict[str, Any] = {}
+            hnsw_config = models.HnswConfigDiff(
+                m=index_params.get("M", 64),
+                ef_construct=index_params.get("efConstruction", 512),
+            )
+            vectors_config = models.VectorParams(
+                size=dimension,
+                datatype=models.Datatype.FLOAT16,
+                distance=models.Distance.COSINE,
+                hnsw_config=hnsw_config,
+            )
+            get_qdrant_client().create_collection(collection_name, vectors_config=vectors_config)
+            get_qdrant_client().create_payload_index(
+                collection_name,
+                "page_content",
+                field_schema="keyword",
+            )
+            get_qdrant_client().create_payload_index(
+                collection_name,
+                "metadata",
+                field_schema="keyword",
+            )
+
     @staticmethod
     def upload_file(document: Document):
         if document is None:
@@ -156,38 +211,34 @@ class DocCollectionOp:
                     file_path = tree_info[document.file_url.split("/")[-1].split(".")[0]]
             if not os.path.exists(file_path):
                 raise Exception(f"file {file_path} not exist")
-            origin_data, docs, known_type = util.get_docs(
+            stream = util.stream_docs(
                 file_path=file_path,
                 file_type=document.file_type,
                 chunk_size=(knowledge.chunk_size or FILE_SETTINGS["CHUNK_SIZE"]),
                 chunk_overlap=(knowledge.chunk_overlap or FILE_SETTINGS["CHUNK_OVERLAP"]),
             )
             logging.info(f"starting process file_name: {document.file_name}, file_url: {document.file_url}")
-            if len(docs) <= 0:
+            chunks = iter(stream)
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
                 PartitionDB.update_status(
                     partition_name=document.partition_name,
                     status=DOCUMENTSTATUS.FAIL.value,
                     msg=f"document {document.file_name} is empty",
                 )
                 return
-
-            texts = [doc.page_content for doc in docs]
-            metadatas = [doc.metadata for doc in docs]
-            content = ""
-            content_length = 0
-            for doc in origin_data:
-                content += doc.page_content
-                content_length += len(doc.page_content)
-            if content_length > 1000000:
-                content = ""
-            PartitionDB.update_content_info(
-                partition_name=document.partition_name,
-                content=content,
-                content_length=content_length,
-            )
+            docs = itertools.chain([first_chunk], chunks)
 
             # 临时知识库单独处理 结束后直接返回
             if document.collection_name == "temp":
+                for _ in docs:
+                    pass
+                PartitionDB.update_content_info(
+                    partition_name=document.partition_name,
+                    content=stream.content,
+                    content_length=stream.content_length,
+                )
+                content_length = stream.content_length
                 if content_length <= 1000000:
                     PartitionDB.update_progress(partition_name=document.partition_name, progress=1.0)
                     PartitionDB.update_status(
@@ -215,43 +266,15 @@ class DocCollectionOp:
                 if not ollama_model_exist(providerSt.safe_base_url, knowledge.embedding_model):
                     return
 
-            logging.info(f"store_data_in_vector_db: {len(docs)}")
             collection_name = document.collection_name
             partition_name = document.partition_name
 
-            if not get_qdrant_client().collection_exists(collection_name):
-                try:
-                    embedding = model_provider_manager.get_embedding_instance(
-                        knowledge.provider, knowledge.embedding_model
-                    )
-                    vectors = embedding.embed_query("test")
-                    dimension = len(vectors)
-                except Exception:
-                    dimension = 768
-                    logging.exception(f"Failed to create embedding instance for provider '{knowledge.provider}'")
-
-                index_params: dict[str, Any] = {}
-                hnsw_config = models.HnswConfigDiff(
-                    m=index_params.get("M", 64),
-                    ef_construct=index_params.get("efConstruction", 512),
-                )
-                vectors_config = models.VectorParams(
-                    size=dimension,
-                    datatype=models.Datatype.FLOAT16,
-                    distance=models.Distance.COSINE,
-                    hnsw_config=hnsw_config,
-                )
-                get_qdrant_client().create_collection(collection_name, vectors_config=vectors_config)
-                get_qdrant_client().create_payload_index(
-                    collection_name,
-                    "page_content",
-                    field_schema="keyword",
-                )
-                get_qdrant_client().create_payload_index(
-                    collection_name,
-                    "metadata",
-                    field_schema="keyword",
-                )
+            embedding = with_embedding_cache(
+                model_provider_manager.get_embedding_instance(knowledge.provider, knowledge.embedding_model),
+                provider=knowledge.provider,
+                model=knowledge.embedding_model,
+            )
+            DocCollectionOp.ensure_vector_collection(collection_name, embedding, knowledge.provider)
 
             col_info = get_qdrant_client().get_collection(collection_name=collection_name)
             if col_info:
@@ -270,6 +293,7 @@ class DocCollectionOp:
                         )
                     ),
                 )
+                get_keyword_index(collection_name).drop_partition(partition_name)
 
             get_qdrant_client().create_payload_index(
                 document.collection_name,
@@ -277,104 +301,33 @@ class DocCollectionOp:
                 field_schema="keyword",
             )
 
-            embedding_texts = [x.replace("\n", " ") for x in texts]
-            batch_size = 20
-            with tqdm(
-                total=len(embedding_texts),
-                initial=0,
-                unit="B",
-                unit_scale=True,
-                desc=f"processing {document.file_name}",
-                ascii=True,
-            ) as progress_bar:
-                i = -1
-                for i in range(len(embedding_texts) // batch_size):
-                    document_count = PartitionDB.get_document_count(partition_name=document.partition_name)
-                    if document_count == 0:
-                        return
-
-                    try:
-                        embedding = model_provider_manager.get_embedding_instance(
-                            knowledge.provider, knowledge.embedding_model
-                        )
-                        embedded_vectors = embedding.embed_documents(
-                            embedding_texts[i * batch_size : (i + 1) * batch_size]
-                        )
-                    except Exception:
-                        progress_bar.update(batch_size)
-                        progress = round(progress_bar.n / progress_bar.total, 2)
-                        PartitionDB.update_progress(partition_name=document.partition_name, progress=progress)
-                        logging.exception(f"Failed to create embedding instance for provider '{knowledge.provider}'")
-                        continue
-
-                    try:
-                        points = []
-                        for j in range(batch_size):
-                            payload = {
-                                "page_content": embedding_texts[i * batch_size + j],
-                                document.partition_name: "1",
-                                "metadata": metadatas[i * batch_size + j],
-                            }
-
-                            points.append(
-                                models.PointStruct(
-                                    id=str(uuid.uuid4()),
-                                    vector=embedded_vectors[j],
-                                    payload=payload,
-                                )
-                            )
-
-                        get_qdrant_client().upsert(
-                            document.collection_name,
-                            points=points,
-                            wait=False,
-                        )
-                    except Exception as ex:
-                        logging.exception("Failed to upsert points to qdrant.")
-
-                    progress_bar.update(batch_size)
-                    progress = round(progress_bar.n / progress_bar.total, 2)
-                    PartitionDB.update_progress(partition_name=document.partition_name, progress=progress)
-                if i == -1 or (i + 1) * batch_size < len(embedding_texts):
-                    try:
-                        embedding = model_provider_manager.get_embedding_instance(
-                            knowledge.provider, knowledge.embedding_model
-                        )
-                        embedded_vectors = embedding.embed_documents(embedding_texts[(i + 1) * batch_size :])
-
-                        points = []
-                        for j in range(len(embedding_texts) - (i + 1) * batch_size):
-                            payload = {
-                                "page_content": embedding_texts[(i + 1) * batch_size + j],
-                                document.partition_name: "1",
-                                "metadata": metadatas[(i + 1) * batch_size + j],
-                            }
-
-                            points.append(
-                                models.PointStruct(
-                                    id=str(uuid.uuid4()),
-                                    vector=embedded_vectors[j] if embedded_vectors else [],
-                                    payload=payload,
-                                )
-                            )
-
-                        get_qdrant_client().upsert(
-                            document.collection_name,
-                            points=points,
-                            wait=False,
-                        )
+            pipeline = EmbeddingPipeline(
+                embedding=embedding,
+                provider=knowledge.provider,
+                model_name=knowledge.embedding_model,
+                collection_name=collection_name,
+                partition_name=partition_name,
+                source_progress=lambda: stream.progress,
+                is_alive=lambda: PartitionDB.get_document_count(partition_name=partition_name) != 0,
+                on_progress=lambda progress: PartitionDB.update_progress(
+                    partition_name=partition_name, progress=progress
+                ),
+            )
+            if not pipeline.run(docs):
+                return
+            logging.info(f"store_data_in_vector_db: {pipeline.count}")
+            PartitionDB.update_content_info(
+                partition_name=document.partition_name,
+                content=stream.content,
+                content_length=stream.content_length,
+            )
 
-                    except Exception as ex:
-                        logging.exception("Failed to upsert points to qdrant.")
-                    progress_bar.update(len(embedding_texts) - (i + 1) * batch_size)
-                    progress = round(progress_bar.n / progress_bar.total, 2)
-                    PartitionDB.update_progress(partition_name=document.partition_name, progress=progress)
-                PartitionDB.update_status(
-                    partition_name=document.partition_name,
-                    status=DOCUMENTSTATUS.FINISH.value,
-                )
-                DocCollectionOp.rebuild_index(document.collection_name)
-                CollectionDB.update_collection_field(collection_name=document.collection_name)
+            PartitionDB.update_status(
+                partition_name=document.partition_name,
+                status=DOCUMENTSTATUS.FINISH.value,
+            )
+            DocCollectionOp.rebuild_index(document.collection_name)
+            CollectionDB.update_collection_field(collection_name=document.collection_name)
         except RuntimeError as run_ex:
             logging.exception("Upload file failed.")
             if "Could not detect encoding" in str(run_ex):
@@ -416,6 +369,7 @@ class DocCollectionOp:
                         )
                     ),
                 )
+                get_keyword_index(collection_name).drop_partition(partition_name)
             except Exception as ex:
                 logging.exception("Failed to drop partition.")
                 return False
@@ -506,6 +460,7 @@ class DocCollectionOp:
             documents = PartitionDB.get_documents_by_collection_name(collection_name=collection_name)
             knowledge = CollectionDB.get_collection_by_name(collection_name=collection_name)
             CollectionDB.drop_collection_by_name(collection_name=collection_name)
+            drop_keyword_index(collection_name)
             for document in documents:
                 site_count = PartitionDB.get_document_site_count(file_id=document.file_id)
                 if knowledge and knowledge.folder:
@@ -545,6 +500,7 @@ class DocCollectionOp:
             "provider": knowledge.provider or OLLAMA_PROVIDER,
             "embedding_model": knowledge.embedding_model,
             "similarity_threshold": knowledge.similarity_threshold,
+            "retrieval_mode": knowledge.retrieval_mode or RETRIEVALMODE.VECTOR.value,
             "chunk_size": (FILE_SETTINGS["CHUNK_SIZE"] if knowledge.chunk_size is None else knowledge.chunk_size),
             "chunk_overlap": (
                 FILE_SETTINGS["CHUNK_OVERLAP"] if knowledge.chunk_overlap is None else knowledge.chunk_overlap
@@ -609,10 +565,13 @@ class DocCollectionOp:
         chunk_overlap: int,
         top_k: int,
         folder: str,
+        retrieval_mode: Optional[str] = None,
     ) -> bool:
         collection_info = DocCollectionOp.show_collection_info(collection_name=collection_name)
         if not collection_info:
             return False
+        if retrieval_mode is None:
+            retrieval_mode = collection_info.get("retrieval_mode")
         if (
             knowledge_name == collection_info.get("knowledge_name")
             and description == collection_info.get("description")
@@ -622,6 +581,7 @@ class DocCollectionOp:
             and collection_info.get("chunk_overlap") == chunk_overlap
             and collection_info.get("top_k") == top_k
             and collection_info.get("folder") == folder
+            and collection_info.get("retrieval_mode") == retrieval_mode
         ):
             return False
         else:
@@ -643,5 +603,6 @@ class DocCollectionOp:
                 chunk_overlap=chunk_overlap,
                 top_k=top_k,
                 folder=folder,
+                retrieval_mode=retrieval_mode,
             )
             return True
@@ -0,0 +1,104 @@
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import fitz
+
+from configs.settings import DOCUMENT_PROCESS_SETTINGS
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extract_pages(file_path: str, start: int, end: int) -> list[str]:
+    """Text of pages [start, end), run inside the worker processes."""
+    with fitz.open(file_path) as pdf_document:
+        return [pdf_document[index].get_text() for index in range(start, min(end, pdf_document.page_count))]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork, the server process is full of threads holding locks
+            _pool = ProcessPoolExecutor(
+                max_workers=DOCUMENT_PROCESS_SETTINGS["PDF_WORKERS"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pages(file_path: str) -> Iterator[tuple[int, int, str]]:
+    """
+    Yield (page number, page count, text) in page order.
+
+    Windows of pages are extracted in a process pool with a bounded number of windows in flight, so memory
+    follows the window rather than the document. Short documents and a broken pool fall back to extracting
+    in this process.
+    """
+    with fitz.open(file_path) as pdf_document:
+        page_count = pdf_document.page_count
+    window = DOCUMENT_PROCESS_SETTINGS["PDF_PAGE_WINDOW"]
+    workers = DOCUMENT_PROCESS_SETTINGS["PDF_WORKERS"]
+
+    if page_count <= window or workers <= 1:
+        for start in range(0, page_count, window):
+            for index, text in enumerate(extract_pages(file_path, start, start + window), start=start):
+                yield index + 1, page_count, text
+        return
+
+    pool = _get_pool()
+    pending: deque[tuple[int, Optional[Future]]] = deque()
+    starts = iter(range(0, page_count, window))
+    try:
+        while True:
+            while pool and len(pending) < workers * 2:
+                start = next(starts, None)
+                if start is None:
+                    break
+                try:
+                    pending.append((start, pool.submit(extract_pages, file_path, start, start + window)))
+                except (BrokenProcessPool, RuntimeError):
+                    logging.exception("pdf page pool unavailable, extract in process")
+                    if pool is not None:
+                        _reset_pool(pool)
+                        pool = None
+                    pending.append((start, None))
+            if not pending:
+                start = next(starts, None)
+                if start is None:
+                    return
+                pending.append((start, None))
+
+            start, future = pending.popleft()
+            texts = None
+            if future is not None:
+                try:
+                    texts = future.result()
+                except BrokenProcessPool:
+                    logging.exception("pdf page pool broken, extract in process")
+                    # the other windows in flight fail the same way, the first one resets the pool
+                    if pool is not None:
+                        _reset_pool(pool)
+                        pool = None
+            if texts is None:
+                texts = extract_pages(file_path, start, start + window)
+            for index, text in enumerate(texts, start=start):
+                yield index + 1, page_count, text
+    finally:
+        for _, future in pending:
+            if future is not None:
+                future.cancel()
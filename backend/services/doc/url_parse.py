@@ -10,6 +10,8 @@ from qdrant_client import models
 from tqdm import tqdm
 
 from configs.env import ARGO_STORAGE_PATH_DOCUMENTS
+from core.features.embedding_cache import with_embedding_cache
+from core.features.keyword_index import get_keyword_index
 from core.model_providers import model_provider_manager
 from core.model_providers.constants import OLLAMA_PROVIDER
 from database.vector import get_qdrant_client
@@ -150,7 +152,11 @@ class RecursiveUrlLoader:
         batch = []
         success = False
 
-        embedding = model_provider_manager.get_embedding_instance(self.provider, self.embedding_model)
+        embedding = with_embedding_cache(
+            model_provider_manager.get_embedding_instance(self.provider, self.embedding_model),
+            provider=self.provider,
+            model=self.embedding_model,
+        )
 
         with open(self.file_path, "a") as fp:
             with tqdm(
@@ -211,6 +217,10 @@ class RecursiveUrlLoader:
                                 points=points,
                                 wait=False,
                             )
+                            get_keyword_index(self.collection_name).add(
+                                self.partition_name,
+                                [(point.id, item.get("page_content", "")) for point, item in zip(points, batch)],
+                            )
 
                             success = True
                     except Exception as ex:
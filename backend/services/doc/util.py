@@ -1,14 +1,13 @@
-import hashlib
+import codecs
 import logging
 import os.path
 import random
 import re
 import zipfile
 from collections.abc import Iterator
-from pathlib import Path
+from typing import Optional
 
 import cchardet
-import fitz
 
 # import sentence_transformers
 import xlrd
@@ -18,7 +17,6 @@ from langchain_community.document_loaders import (
     CSVLoader,
     Docx2txtLoader,
     OutlookMessageLoader,
-    TextLoader,
     UnstructuredEPubLoader,
     UnstructuredRSTLoader,
     UnstructuredWordDocumentLoader,
@@ -31,6 +29,7 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from openpyxl import load_workbook
 from pptx import Presentation
 
+from configs.settings import DOCUMENT_PROCESS_SETTINGS
 from core.callback_handler.logging_out_callback_handler import (
     LoggingOutCallbackHandler,
 )
@@ -39,6 +38,7 @@ from core.model_providers.ollama.ollama_api import (
     ollama_model_is_generation,
 )
 from models.bot import BotModelConfig
+from services.doc import pdf_pages
 
 
 class DocxHtmlLoader(BaseLoader):
@@ -70,145 +70,168 @@ class DocxHtmlLoader(BaseLoader):
 
 
 class PdfLoader(BaseLoader):
+    """One Document per page, pages are extracted in a process pool a few windows ahead."""
+
     def __init__(self, file_path):
         self.file_path = file_path
-
-    def extract_content(self):
-        try:
-            if not os.path.exists(self.file_path):
-                raise FileNotFoundError(f"pdf file {self.file_path} not exists")
-            with fitz.open(self.file_path) as pdf_document:
-                full_text = ""
-                for page in pdf_document:
-                    full_text += page.get_text()
-                return full_text.strip()
-        except Exception as ex:
-            logging.exception("pdf extract fail")
-            return None
+        self.progress = 0.0
 
     def lazy_load(self) -> Iterator[Document]:
-        metadata = {"source": str(self.file_path)}
-        try:
-            context = self.extract_content()
-            if context:
-                yield Document(page_content=context, metadata=metadata)
-            else:
-                logging.info("no content extracted.")
-                yield Document(page_content="", metadata=metadata)
-        except Exception as ex:
-            logging.exception(f"Error extracting content from file: {self.file_path}.")
-            yield Document(page_content="", metadata=metadata)
+        # extraction errors reach the ingest job, which marks the document failed instead of half indexed
+        if not os.path.exists(self.file_path):
+            raise FileNotFoundError(f"pdf file {self.file_path} not exists")
+        for page_number, page_count, text in pdf_pages.iter_pages(self.file_path):
+            self.progress = page_number / page_count
+            text = text.strip()
+            if text:
+                yield Document(page_content=text, metadata={"source": str(self.file_path), "page": page_number})
 
 
-class MarkdownLoader(BaseLoader):
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+class TextStreamLoader(BaseLoader):
+    """
+    Reads a text file in windows cut at line ends, decoded with the encoding sniffed from its prefix.
 
-    def extract_content(self):
-        try:
-            if not os.path.exists(self.file_path):
-                raise FileNotFoundError(f"Markdown file {self.file_path} does not exist.")
-            full_text = Path(self.file_path).read_text(encoding="utf-8")
-            return full_text.strip()
-        except Exception as ex:
-            logging.exception("Markdown extraction failed")
-            return None
+    Each Document carries the character `offset` of its window so chunk start indexes stay file relative.
+    """
+
+    def __init__(self, file_path: str, encoding: Optional[str] = None):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.progress = 0.0
 
     def lazy_load(self) -> Iterator[Document]:
-        metadata = {"source": str(self.file_path)}
-        try:
-            context = self.extract_content()
-            if context:
-                yield Document(page_content=context, metadata=metadata)
-            else:
-                logging.info("No content extracted from Markdown file.")
-                yield Document(page_content="", metadata=metadata)
-        except Exception as ex:
-            logging.exception(f"Error extracting content from file: {self.file_path}.")
-            yield Document(page_content="", metadata=metadata)
+        encoding = self.encoding or fast_detect(self.file_path)
+        if not encoding:
+            raise RuntimeError(f"Could not detect encoding for {self.file_path}")
+        if codecs.lookup(encoding).name == "ascii":
+            # only the sniffed prefix is known to be ascii, utf-8 reads it the same and the rest correctly
+            encoding = "utf-8"
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        window = DOCUMENT_PROCESS_SETTINGS["STREAM_WINDOW"]
+        size = max(os.path.getsize(self.file_path), 1)
+
+        offset = 0
+        rest = ""
+        with open(self.file_path, "rb") as fp:
+            while block := fp.read(window):
+                text = rest + decoder.decode(block)
+                cut = text.rfind("\n") + 1
+                if cut == 0:
+                    # no line end yet, keep reading unless the line alone outgrows a few windows
+                    if len(text) < window * 4:
+                        rest = text
+                        continue
+                    cut = len(text)
+                rest = text[cut:]
+                self.progress = fp.tell() / size
+                yield Document(page_content=text[:cut], metadata={"source": str(self.file_path), "offset": offset})
+                offset += cut
+        text = rest + decoder.decode(b"", final=True)
+        self.progress = 1.0
+        if text:
+            yield Document(page_content=text, metadata={"source": str(self.file_path), "offset": offset})
+
+
+class MarkdownLoader(TextStreamLoader):
+    def __init__(self, file_path: str):
+        super().__init__(file_path, encoding="utf-8")
 
 
 class PPTLoader(BaseLoader):
+    """One Document per slide."""
+
     def __init__(self, file_path: str):
         self.file_path = file_path
+        self.progress = 0.0
 
-    def extract_content(self):
+    def lazy_load(self) -> Iterator[Document]:
         try:
             if not os.path.exists(self.file_path):
                 raise FileNotFoundError(f"pptx file {self.file_path} does not exist.")
 
             presentation = Presentation(self.file_path)
-            full_text = ""
-            for slide in presentation.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        full_text += shape.text.strip() + "\n"
-            return full_text.strip()
+            slide_count = len(presentation.slides)
+            for slide_number, slide in enumerate(presentation.slides, start=1):
+                self.progress = slide_number / slide_count
+                text = "\n".join(
+                    shape.text.strip() for shape in slide.shapes if hasattr(shape, "text") and shape.text.strip()
+                )
+                if text:
+                    yield Document(page_content=text, metadata={"source": str(self.file_path), "slide": slide_number})
         except Exception as ex:
             logging.exception("PPTX extraction failed.")
-            return None
-
-    def lazy_load(self) -> Iterator[Document]:
-        metadata = {"source": str(self.file_path)}
-        try:
-            context = self.extract_content()
-            if context:
-                yield Document(page_content=context, metadata=metadata)
-            else:
-                logging.info("No content extracted from PPTX file.")
-                yield Document(page_content="", metadata=metadata)
-        except Exception as ex:
-            logging.exception(f"Error extracting content from file: {self.file_path}.")
-            yield Document(page_content="", metadata=metadata)
 
 
 class ExcelLoader(BaseLoader):
+    """Rows are streamed sheet by sheet and grouped into Documents of about one stream window each."""
+
     def __init__(self, file_path: str):
         self.file_path = file_path
+        self.progress = 0.0
 
-    def extract_content(self):
+    def _sheets(self) -> Iterator[tuple[int, str, Optional[int], Iterator[str]]]:
+        file_ext = os.path.splitext(self.file_path)[-1].lower()
+        if file_ext == ".xlsx":
+            workbook = load_workbook(filename=self.file_path, read_only=True, data_only=True)
+            try:
+                for sheet in workbook.worksheets:
+                    rows = (
+                        " ".join(str(cell) for cell in row if cell is not None)
+                        for row in sheet.iter_rows(values_only=True)
+                    )
+                    yield len(workbook.worksheets), sheet.title, sheet.max_row, rows
+            finally:
+                workbook.close()
+        elif file_ext == ".xls":
+            workbook = xlrd.open_workbook(self.file_path, on_demand=True)
+            try:
+                for sheet_index in range(workbook.nsheets):
+                    sheet = workbook.sheet_by_index(sheet_index)
+                    rows = (
+                        " ".join(str(sheet.cell(row_idx, col).value) for col in range(sheet.ncols))
+                        for row_idx in range(sheet.nrows)
+                    )
+                    yield workbook.nsheets, sheet.name, sheet.nrows, rows
+                    workbook.unload_sheet(sheet_index)
+            finally:
+                workbook.release_resources()
+        else:
+            raise ValueError(f"Unsupported file format: {file_ext}")
+
+    def lazy_load(self) -> Iterator[Document]:
         try:
             if not os.path.exists(self.file_path):
                 raise FileNotFoundError(f"Excel file {self.file_path} does not exist.")
 
-            file_ext = os.path.splitext(self.file_path)[-1].lower()
-
-            full_text = ""
-
-            if file_ext == ".xlsx":
-                workbook = load_workbook(filename=self.file_path, data_only=True)
-                for sheet in workbook.worksheets:
-                    for row in sheet.iter_rows(values_only=True):
-                        row_text = " ".join(str(cell) for cell in row if cell is not None)
-                        if row_text.strip():
-                            full_text += row_text.strip() + "\n"
-            elif file_ext == ".xls":
-                workbook = xlrd.open_workbook(self.file_path)
-                for sheet in workbook.sheets():
-                    for row_idx in range(sheet.nrows):
-                        row_text = " ".join(str(sheet.cell(row_idx, col).value) for col in range(sheet.ncols))
-                        if row_text.strip():
-                            full_text += row_text.strip() + "\n"
-            else:
-                raise ValueError(f"Unsupported file format: {file_ext}")
-
-            return full_text.strip()
+            window = DOCUMENT_PROCESS_SETTINGS["STREAM_WINDOW"]
+            for sheet_index, (sheet_count, sheet_name, row_count, rows) in enumerate(self._sheets()):
+                lines: list[str] = []
+                length = 0
+                first_row = 1
+                for row_number, row_text in enumerate(rows, start=1):
+                    if row_count:
+                        self.progress = (sheet_index + min(row_number / row_count, 1.0)) / sheet_count
+                    row_text = row_text.strip()
+                    if not row_text:
+                        continue
+                    if not lines:
+                        first_row = row_number
+                    lines.append(row_text)
+                    length += len(row_text) + 1
+                    if length >= window:
+                        yield self._document(sheet_name, first_row, lines)
+                        lines, length = [], 0
+                if lines:
+                    yield self._document(sheet_name, first_row, lines)
+                self.progress = (sheet_index + 1) / sheet_count
         except Exception as ex:
             logging.exception("Excel extraction failed.")
-            return None
 
-    def lazy_load(self) -> Iterator[Document]:
-        metadata = {"source": str(self.file_path)}
-        try:
-            context = self.extract_content()
-            if context:
-                yield Document(page_content=context, metadata=metadata)
-            else:
-                logging.info("No content extracted from Excel file.")
-                yield Document(page_content="", metadata=metadata)
-        except Exception as ex:
-            logging.exception(f"Error extracting content from file: {self.file_path}")
-            yield Document(page_content="", metadata=metadata)
+    def _document(self, sheet_name: str, first_row: int, lines: list[str]) -> Document:
+        return Document(
+            page_content="\n".join(lines) + "\n",
+            metadata={"source": str(self.file_path), "sheet": sheet_name, "row": first_row},
+        )
 
 
 def get_loader(filename: str, file_content_type: str, file_path: str):
@@ -303,17 +326,9 @@ def get_loader(filename: str, file_content_type: str, file_path: str):
     elif file_ext == "msg":
         loader = OutlookMessageLoader(file_path)
     elif file_ext in known_source_ext or (file_content_type and file_content_type.find("text/") >= 0):
-        encoding = fast_detect(file_path)
-        if encoding:
-            loader = TextLoader(file_path, encoding=encoding)
-        else:
-            loader = TextLoader(file_path, autodetect_encoding=True)
+        loader = TextStreamLoader(file_path)
     else:
-        encoding = fast_detect(file_path)
-        if encoding:
-            loader = TextLoader(file_path, encoding=encoding)
-        else:
-            loader = TextLoader(file_path, autodetect_encoding=True)
+        loader = TextStreamLoader(file_path)
         known_type = False
 
     return loader, known_type
@@ -321,7 +336,8 @@ def get_loader(filename: str, file_content_type: str, file_path: str):
 
 def fast_detect(file_path: str):
     try:
-        rawdata = Path(file_path).read_bytes()
+        with open(file_path, "rb") as fp:
+            rawdata = fp.read(DOCUMENT_PROCESS_SETTINGS["ENCODING_SNIFF_BYTES"])
         res = cchardet.detect(rawdata)
         encoding = res.get("encoding", None)
         return encoding
@@ -330,19 +346,74 @@ def fast_detect(file_path: str):
         return None
 
 
-def get_docs(
-    file_path: str, file_type: str, chunk_size: int, chunk_overlap: int
-) -> tuple[list[Document], list[Document], str]:
+class DocumentStream:
+    """
+    Chunks of one file, loaded and split page by page so memory is bounded by a loader window, not the file.
+
+    The text read is kept for `content` only while it stays within `content_limit` characters, its length is
+    always counted. `progress` is the fraction of the source read so far.
+    """
+
+    def __init__(self, loader: BaseLoader, file_path: str, chunk_size: int, chunk_overlap: int, content_limit: int):
+        self.loader = loader
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True,
+        )
+        self.content_limit = content_limit
+        self.content_length = 0
+        self._content: list[str] = []
+        self._size = max(os.path.getsize(file_path), 1)
+
+    @property
+    def content(self) -> str:
+        if self.content_length > self.content_limit:
+            return ""
+        # pages and slides come stripped, text windows already end with their line end
+        last = len(self._content) - 1
+        return "".join(
+            part if index == last or part.endswith("\n") else part + "\n" for index, part in enumerate(self._content)
+        )
+
+    @property
+    def progress(self) -> float:
+        progress = getattr(self.loader, "progress", None)
+        if progress is None:
+            # loaders without page positions, estimated from the characters read against the file size
+            progress = self.content_length / self._size
+        return min(progress, 1.0)
+
+    def __iter__(self) -> Iterator[Document]:
+        for doc in self.loader.lazy_load():
+            self.content_length += len(doc.page_content)
+            if self.content_length <= self.content_limit:
+                self._content.append(doc.page_content)
+            else:
+                self._content.clear()
+            offset = doc.metadata.pop("offset", 0)
+            for chunk in self.text_splitter.split_documents([doc]):
+                if offset:
+                    chunk.metadata["start_index"] += offset
+                yield chunk
+
+
+def stream_docs(
+    file_path: str, file_type: str, chunk_size: int, chunk_overlap: int, content_limit: int = 1000000
+) -> DocumentStream:
     file_name = os.path.basename(file_path)
     loader, known_type = get_loader(file_name, file_type, file_path)
-    data = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        add_start_index=True,
-    )
-    docs = text_splitter.split_documents(data)
-    return data, docs, known_type
+    return DocumentStream(loader, file_path, chunk_size, chunk_overlap, content_limit)
+
+
+def read_prefix(loader: BaseLoader, length: int) -> str:
+    """The first `length` characters of a file, without loading the rest of it."""
+    text = ""
+    for doc in loader.lazy_load():
+        text += doc.page_content
+        if len(text) >= length:
+            break
+    return text[:length]
 
 
 def random_ua() -> str:
@@ -489,43 +560,3 @@ def generate_file_abstract(bot_model_config: BotModelConfig, content: str):
             break
 
     return text.strip()
-
-
-def get_file_list(dir_name: str) -> dict[str, str]:
-    file_dict = {}
-    for dir_path, dir_names, file_names in os.walk(dir_name):
-        for file_name in file_names:
-            if "." not in file_name:
-                continue
-            if file_name.startswith("."):
-                continue
-            ext = os.path.splitext(file_name)[1].lower()
-            if ext not in [
-                ".txt",
-                ".docx",
-                ".xlsx",
-                ".xls",
-                ".csv",
-                ".pptx",
-                ".ppt",
-                ".pdf",
-                ".md",
-                ".json",
-                ".html",
-            ]:
-                continue
-            cur_file_path = os.sep.join([dir_path, file_name])
-            sha256_hash = hashlib.sha256()
-            if os.path.isfile(cur_file_path):
-                with open(cur_file_path, "rb") as fp:
-                    for byte_block in iter(lambda: fp.read(4096), b""):
-                        sha256_hash.update(byte_block)
-            file_hash = sha256_hash.hexdigest()
-            file_dict[file_hash] = cur_file_path
-            if len(file_dict) > 1000:
-                return file_dict
-        for inner_dir_name in dir_names:
-            if len(file_dict) > 1000:
-                return file_dict
-            file_dict.update(get_file_list(os.sep.join([dir_path, inner_dir_name])))
-    return file_dict
@@ -1,11 +1,14 @@
+import hashlib
 import logging
 import mimetypes
 import os
+import tempfile
+import threading
 from pathlib import Path
 
 from configs.env import ARGO_STORAGE_PATH_DOCUMENTS
 from core.file.file_db import FileDB
-from services.doc import util
+from services.doc.folder_sync import folder_sync_engine
 from utils.file_hash import calculate_content_sha256
 
 
@@ -37,63 +40,125 @@ def delete(file_name: str) -> bool:
         return False
 
 
+class HashedUpload:
+    """An upload written to a temp file in the storage folder while its sha256 is computed."""
+
+    def __init__(self, file_name: str, folder: str = ARGO_STORAGE_PATH_DOCUMENTS):
+        self.file_name = file_name
+        self.folder = folder
+        self.file_size = 0
+        self._sha256 = hashlib.sha256()
+        fd, self.temp_path = tempfile.mkstemp(dir=folder, prefix=".upload-")
+        self._fp = os.fdopen(fd, "wb")
+        # the body is written on an executor thread while the IOLoop may discard the upload
+        self._lock = threading.Lock()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, data: bytes):
+        with self._lock:
+            # the rest of a body that arrives after the upload was discarded is dropped
+            if self._fp.closed:
+                return
+            self._sha256.update(data)
+            self._fp.write(data)
+            self.file_size += len(data)
+
+    def close(self):
+        with self._lock:
+            if not self._fp.closed:
+                self._fp.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def store_upload(user_id: str, upload: HashedUpload) -> dict:
+    """Move a finished upload into content addressed storage, content that is already stored is not kept twice."""
+    upload.close()
+    extension = os.path.splitext(upload.file_name)[1]
+    file_id = f"{upload.sha256}{extension}"
+    file_path = os.path.join(upload.folder, file_id)
+    if os.path.exists(file_path):
+        upload.discard()
+    else:
+        # same folder as the temp file, so the rename is atomic and a half written file is never visible
+        os.replace(upload.temp_path, file_path)
+
+    if FileDB.get_file_by_id(file_id=file_id) is None:
+        FileDB.create_new_file(
+            user_id=user_id,
+            file_id=file_id,
+            file_name=upload.file_name,
+            file_size=upload.file_size,
+        )
+    return {
+        "file_id": file_id,
+        "file_name": upload.file_name,
+        "file_size": upload.file_size,
+        "rename_success": False,
+    }
+
+
 def upload_file(
     user_id: str,
     file_name: str,
     file_content: bytes,
     folder: str = ARGO_STORAGE_PATH_DOCUMENTS,
 ) -> dict:
+    if folder == ARGO_STORAGE_PATH_DOCUMENTS:
+        upload = HashedUpload(file_name)
+        try:
+            upload.write(file_content)
+            return store_upload(user_id, upload)
+        finally:
+            upload.discard()
+
     file_sha256 = calculate_content_sha256(file_content)
     file_prefix, extension = os.path.splitext(file_name)
     rename_success = False
-    if folder != ARGO_STORAGE_PATH_DOCUMENTS:
-        local_file_map = util.get_file_list(folder)
-        if file_sha256 in local_file_map:
-            save_file_path = local_file_map[file_sha256]
-            file_name = os.path.basename(save_file_path)
-        else:
-            save_file_path = f"{folder}/{file_name}"
-            if os.path.exists(save_file_path):
-                for i in range(1000):
-                    save_file_path = f"{folder}/{file_prefix}_{i}{extension}"
-                    if not os.path.exists(save_file_path):
-                        rename_success = True
-                        file_name = f"{file_prefix}_{i}{extension}"
-                        break
-            else:
-                rename_success = True
-            if not rename_success:
-                save_file_path = f"{folder}/{file_sha256}{extension}"
-                file_name = f"{file_prefix}{extension}"
-
-            Path(save_file_path).write_bytes(file_content)
+    local_file_map = folder_sync_engine.scan(folder)
+    if file_sha256 in local_file_map:
+        save_file_path = local_file_map[file_sha256]
+        file_name = os.path.basename(save_file_path)
     else:
-        file_path = Path(folder) / f"{file_sha256}{extension}"
-        if not file_path.exists():
-            file_path.write_bytes(file_content)
+        save_file_path = f"{folder}/{file_name}"
+        if os.path.exists(save_file_path):
+            for i in range(1000):
+                save_file_path = f"{folder}/{file_prefix}_{i}{extension}"
+                if not os.path.exists(save_file_path):
+                    rename_success = True
+                    file_name = f"{file_prefix}_{i}{extension}"
+                    break
+        else:
+            rename_success = True
+        if not rename_success:
+            save_file_path = f"{folder}/{file_sha256}{extension}"
+            file_name = f"{file_prefix}{extension}"
+
+        Path(save_file_path).write_bytes(file_content)
+        folder_sync_engine.scan(folder)
 
     file_id = f"{file_sha256}{extension}"
-    db_file = FileDB.get_file_by_id(file_id=file_id)
-    if db_file is None:
+    if FileDB.get_file_by_id(file_id=file_id) is None:
         FileDB.create_new_file(
             user_id=user_id,
             file_id=file_id,
             file_name=file_name,
             file_size=len(file_content),
         )
-        return {
-            "file_id": file_id,
-            "file_name": file_name,
-            "file_size": len(file_content),
-            "rename_success": rename_success,
-        }
-    else:
-        return {
-            "file_id": file_id,
-            "file_name": file_name,
-            "file_size": len(file_content),
-            "rename_success": rename_success,
-        }
+    return {
+        "file_id": file_id,
+        "file_name": file_name,
+        "file_size": len(file_content),
+        "rename_success": rename_success,
+    }
 
 
 def delete_file(file_id: str) -> bool:
@@ -0,0 +1,363 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Callable
+from typing import Optional
+
+import psutil
+
+from configs.env import ARGO_STORAGE_PATH
+from configs.settings import MODEL_DOWNLOAD_SETTINGS
+from core.i18n.translation import translation_loader
+from core.model_providers.constants import OLLAMA_PROVIDER
+from database.provider_store import get_provider_settings_from_db
+from models.model_manager import DownloadStatus, Model
+from services.model.model_service import ModelService
+
+DOWNLOAD, CONVERT, IMPORT = "download", "convert", "import"
+
+STAGE_STATUSES = {
+    DOWNLOAD: (DownloadStatus.DOWNLOAD_WAITING, DownloadStatus.DOWNLOADING),
+    CONVERT: (DownloadStatus.DOWNLOAD_COMPLETE,),
+    IMPORT: (DownloadStatus.CONVERT_COMPLETE,),
+}
+
+
+def stage_of(status: Optional[DownloadStatus]) -> Optional[str]:
+    for stage, statuses in STAGE_STATUSES.items():
+        if status in statuses:
+            return stage
+    return None
+
+
+class BandwidthLimiter:
+    """
+    Global download rate cap, split evenly between the jobs downloading at the moment.
+
+    `delay(job, size)` books `size` bytes on the job's timeline and returns how long the caller has to wait
+    before reading more. A job that does not use its share leaves it unused rather than handing it over, so
+    no job can go above the cap divided by the number of jobs. A rate of 0 disables shaping.
+    """
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_at: dict[str, float] = {}
+
+    def register(self, job: str):
+        with self._lock:
+            self._next_at.setdefault(job, 0.0)
+
+    def unregister(self, job: str):
+        with self._lock:
+            self._next_at.pop(job, None)
+
+    def delay(self, job: str, size: int) -> float:
+        if self.bytes_per_second <= 0:
+            return 0.0
+        with self._lock:
+            share = self.bytes_per_second / max(1, len(self._next_at))
+            now = time.monotonic()
+            start = max(self._next_at.get(job, 0.0), now)
+            self._next_at[job] = start + size / share
+            return start - now
+
+    def throttle(self, job: str) -> Callable[[int], float]:
+        return lambda size: self.delay(job, size)
+
+
+class DiskAdmission:
+    """
+    Disk space booked by running downloads.
+
+    A download reserves the bytes it still has to write; `admit` compares a new job with the free space left
+    after the other reservations, so two large models cannot both pass the check against the same free space.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reserved: dict[str, int] = {}
+
+    def admit(self, job: str, size: int) -> tuple[bool, int]:
+        """Reserve `size` bytes for `job`, return (admitted, free bytes left for it)."""
+        with self._lock:
+            free = psutil.disk_usage(self.path).free
+            free -= sum(reserved for other, reserved in self._reserved.items() if other != job)
+            if size > free:
+                return False, free
+            self._reserved[job] = size
+            return True, free
+
+    def update(self, job: str, remaining: int):
+        with self._lock:
+            if job in self._reserved:
+                self._reserved[job] = max(0, remaining)
+
+    def release(self, job: str):
+        with self._lock:
+            self._reserved.pop(job, None)
+
+    def busy(self, job: str) -> bool:
+        with self._lock:
+            return any(other != job for other in self._reserved)
+
+
+def ollama_is_local() -> bool:
+    provider_st = get_provider_settings_from_db(provider=OLLAMA_PROVIDER)
+    base_url = provider_st["base_url"]
+    return "localhost" in base_url or "127.0.0.1" in base_url
+
+
+def needs_local_disk(model: Model) -> bool:
+    # huggingface and modelscope files are downloaded into the local temp folder whatever ollama is used
+    return ":" not in (model.source or "") or ollama_is_local()
+
+
+def fail_insufficient_disk(model_name: str, total_size: int, free: int):
+    message = translation_loader.translation.t(
+        "model.insufficient_disk",
+        total_size_gb=f"{total_size / (1024**3):.2f}",
+        free_gb=f"{max(free, 0) / (1024**3):.2f}",
+    )
+    ModelService.update_model_status(
+        model_name,
+        DownloadStatus.DOWNLOAD_FAILED,
+        download_progress=0,
+        download_speed=0,
+        process_message=message,
+    )
+    logging.error(message)
+
+
+class ModelJobScheduler:
+    """
+    Runs model downloads, conversions and imports on a bounded worker pool per stage.
+
+    Status changes are signalled by `ModelService` and turned into jobs by `submit`; a model has at most one
+    job queued or running, and when a job ends its model is looked at again so the next stage starts right
+    away. Jobs are served by priority, embedding models first, then in submission order. A download is
+    admitted only when the disk has room for the model next to the running downloads, otherwise it waits for
+    one of them to finish. A slow reconcile pass picks up anything that was never signalled.
+
+    A job that ends with its model still in the same stage, failed without recording it, is run again after
+    `retry_delay` seconds, doubled on every try up to `max_retry_delay`, instead of right away.
+    """
+
+    def __init__(
+        self,
+        workers: dict[str, int],
+        bandwidth: float,
+        reconcile_interval: float,
+        retry_delay: float = 5,
+        max_retry_delay: float = 600,
+    ):
+        self.workers = {stage: max(1, count) for stage, count in workers.items()}
+        self.reconcile_interval = reconcile_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.bandwidth = BandwidthLimiter(bandwidth)
+        self.disk = DiskAdmission(ARGO_STORAGE_PATH)
+
+        self._cond = threading.Condition()
+        self._pending: dict[str, list[tuple[int, int, str]]] = {stage: [] for stage in self.workers}
+        self._waiting_disk: list[tuple[int, int, str]] = []
+        self._queued: set[str] = set()
+        self._running: dict[str, str] = {}
+        # model -> (status it stalled in, tries in a row, monotonic time it may run again)
+        self._stalled: dict[str, tuple[DownloadStatus, int, float]] = {}
+        self._seq = itertools.count()
+        self._handlers: dict[str, Callable[[Model], None]] = {}
+        self._on_complete: Optional[Callable[[Model], None]] = None
+        self._started = False
+
+    def start(self, handlers: dict[str, Callable[[Model], None]], on_complete: Optional[Callable[[Model], None]]):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            self._handlers = handlers
+            self._on_complete = on_complete
+
+        for stage, count in self.workers.items():
+            for index in range(count):
+                threading.Thread(target=self._work, args=(stage,), name=f"model-{stage}-{index}", daemon=True).start()
+        threading.Thread(target=self._reconcile, name="model-job-reconcile", daemon=True).start()
+
+    def submit(self, model_name: str, status: Optional[DownloadStatus] = None, priority: Optional[int] = None):
+        if status is None or priority is None:
+            model = ModelService.get_model_info(model_name)
+            if model is None:
+                return
+            status = model.download_status if status is None else status
+            priority = self._priority(model) if priority is None else priority
+
+        if status == DownloadStatus.ALL_COMPLETE:
+            self._complete(model_name)
+            return
+
+        stage = stage_of(status)
+        if stage is None:
+            return
+        with self._cond:
+            if not self._started or model_name in self._queued or model_name in self._running:
+                return
+            stalled = self._stalled.get(model_name)
+            if stalled is not None and stalled[0] == status and stalled[2] > time.monotonic():
+                # backing off, the retry timer submits it again
+                return
+            self._queued.add(model_name)
+            heapq.heappush(self._pending[stage], (priority, next(self._seq), model_name))
+            self._cond.notify_all()
+
+    def recover(self) -> int:
+        count = 0
+        for model in ModelService.get_model_list():
+            if stage_of(model.download_status) or model.download_status == DownloadStatus.ALL_COMPLETE:
+                self.submit(model.model_name, model.download_status, self._priority(model))
+                count += 1
+        return count
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": dict(self.workers),
+                "queued": {stage: len(jobs) for stage, jobs in self._pending.items()},
+                "waiting_disk": len(self._waiting_disk),
+                "running": dict(self._running),
+                "backing_off": len(self._stalled),
+                "bandwidth_limit": self.bandwidth.bytes_per_second,
+            }
+
+    @staticmethod
+    def _priority(model: Model) -> int:
+        # embedding models are small and block knowledge base indexing
+        return 0 if model.is_embeddings else 1
+
+    def _next(self, stage: str) -> str:
+        with self._cond:
+            while True:
+                if self._pending[stage]:
+                    _, _, model_name = heapq.heappop(self._pending[stage])
+                    self._queued.discard(model_name)
+                    self._running[model_name] = stage
+                    return model_name
+                self._cond.wait()
+
+    def _work(self, stage: str):
+        while True:
+            model_name = self._next(stage)
+            deferred = None
+            try:
+                deferred = self._run(stage, model_name)
+            except Exception:
+                logging.exception(f"model {stage} job of {model_name} failed")
+            finally:
+                self._finish(stage, model_name, deferred)
+
+    def _run(self, stage: str, model_name: str) -> Optional[tuple[int, int, str]]:
+        """Run the job, return it back when it has to wait for disk space."""
+        model = ModelService.get_model_info(model_name)
+        if model is None or stage_of(model.download_status) != stage:
+            # paused, deleted or handled since it was queued
+            return None
+        if stage == DOWNLOAD and model.size and needs_local_disk(model):
+            admitted, free = self.disk.admit(model_name, model.size)
+            if not admitted:
+                if self.disk.busy(model_name):
+                    logging.info(f"download of {model_name} waits for disk space held by running downloads")
+                    return self._priority(model), next(self._seq), model_name
+                fail_insufficient_disk(model_name, model.size, free)
+                return None
+
+        logging.info(f"model {stage} start: {model_name}")
+        self._handlers[stage](model)
+        logging.info(f"model {stage} finish: {model_name}")
+        return None
+
+    def _finish(self, stage: str, model_name: str, deferred: Optional[tuple[int, int, str]]):
+        self.disk.release(model_name)
+        self.bandwidth.unregister(model_name)
+        with self._cond:
+            self._running.pop(model_name, None)
+            if deferred is not None:
+                self._queued.add(model_name)
+                self._waiting_disk.append(deferred)
+                if not self.disk.busy(model_name):
+                    # the downloads it waited for finished while it was being turned away
+                    self._retry_waiting_disk()
+                return
+            if stage == DOWNLOAD:
+                # the finished download frees its reservation, let the jobs waiting for disk space try again
+                self._retry_waiting_disk()
+
+        model = ModelService.get_model_info(model_name)
+        if model is None:
+            with self._cond:
+                self._stalled.pop(model_name, None)
+            return
+        if stage_of(model.download_status) == stage:
+            self._back_off(model_name, model.download_status)
+            return
+        with self._cond:
+            self._stalled.pop(model_name, None)
+        # the job has moved the model on, queue whatever stage it is in now
+        self.submit(model_name, model.download_status, self._priority(model))
+
+    def _retry_waiting_disk(self):
+        for job in self._waiting_disk:
+            heapq.heappush(self._pending[DOWNLOAD], job)
+        self._waiting_disk = []
+        self._cond.notify_all()
+
+    def _back_off(self, model_name: str, status: DownloadStatus):
+        with self._cond:
+            previous = self._stalled.get(model_name)
+            tries = previous[1] + 1 if previous is not None and previous[0] == status else 1
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (tries - 1))
+            self._stalled[model_name] = (status, tries, time.monotonic() + delay)
+        logging.warning(f"model job of {model_name} ended still {status.value}, try {tries} again in {delay:.0f}s")
+        timer = threading.Timer(delay, self._retry, args=(model_name,))
+        timer.daemon = True
+        timer.start()
+
+    def _retry(self, model_name: str):
+        with self._cond:
+            stalled = self._stalled.get(model_name)
+            if stalled is not None:
+                self._stalled[model_name] = (stalled[0], stalled[1], 0.0)
+        self.submit(model_name)
+
+    def _complete(self, model_name: str):
+        if self._on_complete is None:
+            return
+        model = ModelService.get_model_info(model_name)
+        if model is None:
+            return
+        try:
+            self._on_complete(model)
+        except Exception:
+            logging.exception(f"clean up of {model_name} failed")
+
+    def _reconcile(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.recover()
+            except Exception:
+                logging.exception("Reconcile model jobs failed")
+
+
+model_scheduler = ModelJobScheduler(
+    workers={
+        DOWNLOAD: MODEL_DOWNLOAD_SETTINGS["DOWNLOAD_WORKERS"],
+        CONVERT: MODEL_DOWNLOAD_SETTINGS["CONVERT_WORKERS"],
+        IMPORT: MODEL_DOWNLOAD_SETTINGS["IMPORT_WORKERS"],
+    },
+    bandwidth=MODEL_DOWNLOAD_SETTINGS["BANDWIDTH_LIMIT"],
+    reconcile_interval=MODEL_DOWNLOAD_SETTINGS["RECONCILE_INTERVAL"],
+    retry_delay=MODEL_DOWNLOAD_SETTINGS["RETRY_DELAY"],
+    max_retry_delay=MODEL_DOWNLOAD_SETTINGS["MAX_RETRY_DELAY"],
+)
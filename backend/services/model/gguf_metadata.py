@@ -0,0 +1,172 @@
+import mmap
+import os
+import struct
+from functools import cached_property, lru_cache
+from typing import Any, Optional, Union
+
+GGUF_MAGIC = b"GGUF"
+SUPPORTED_VERSIONS = (2, 3)
+
+# GGUFValueType -> struct format, STRING (8) and ARRAY (9) are variable length
+_SCALAR_FORMATS = {0: "B", 1: "b", 2: "H", 3: "h", 4: "I", 5: "i", 6: "f", 7: "?", 10: "Q", 11: "q", 12: "d"}
+_STRING = 8
+_ARRAY = 9
+
+# arrays up to this length are decoded with the header, longer ones (the vocab, merges, scores) on demand
+EAGER_ARRAY_LENGTH = 64
+
+
+class _Cursor:
+    def __init__(self, buffer, byte_order: str, offset: int = 0):
+        self.buffer = buffer
+        self.byte_order = byte_order
+        self.offset = offset
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(self.byte_order + fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(self.byte_order + fmt)
+        return values
+
+    def string(self) -> str:
+        (length,) = self.unpack("Q")
+        if self.offset + length > len(self.buffer):
+            raise ValueError("gguf string runs past the end of the file")
+        value = self.buffer[self.offset : self.offset + length].decode("utf-8", errors="replace")
+        self.offset += length
+        return value
+
+    def value(self, value_type: int) -> Any:
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            raise ValueError("nested arrays are read through GGUFArray")
+        if value_type not in _SCALAR_FORMATS:
+            raise ValueError(f"unknown gguf value type {value_type}")
+        return self.unpack(_SCALAR_FORMATS[value_type])[0]
+
+    def skip(self, value_type: int, count: int = 1):
+        if value_type in _SCALAR_FORMATS:
+            self.offset += struct.calcsize(self.byte_order + _SCALAR_FORMATS[value_type]) * count
+        elif value_type == _STRING:
+            # hot loop over vocabularies of 100k+ tokens
+            unpack_length = struct.Struct(self.byte_order + "Q").unpack_from
+            buffer, offset = self.buffer, self.offset
+            for _ in range(count):
+                offset += 8 + unpack_length(buffer, offset)[0]
+            self.offset = offset
+        elif value_type == _ARRAY:
+            for _ in range(count):
+                item_type, item_count = self.unpack("IQ")
+                self.skip(item_type, item_count)
+        else:
+            raise ValueError(f"unknown gguf value type {value_type}")
+
+
+class GGUFArray:
+    """An array left in the file, items are read when asked for."""
+
+    def __init__(self, path: str, byte_order: str, item_type: int, count: int, offset: int):
+        self.path = path
+        self.byte_order = byte_order
+        self.item_type = item_type
+        self.count = count
+        self.offset = offset
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> Any:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        with open(self.path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            cursor = _Cursor(buffer, self.byte_order, self.offset)
+            # strings are variable length, so reaching one means walking the lengths before it
+            cursor.skip(self.item_type, index)
+            if self.item_type == _ARRAY:
+                item_type, item_count = cursor.unpack("IQ")
+                return [cursor.value(item_type) for _ in range(item_count)]
+            return cursor.value(self.item_type)
+
+
+class GGUFMetadata:
+    """
+    Key/value header of a GGUF file, parsed without touching the tensor infos or the tensor data.
+
+    Scalars, strings and short arrays are decoded up front; long arrays such as the vocab stay in the file as
+    `GGUFArray` and token ids are resolved to strings on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fields: dict[str, Union[Any, GGUFArray]] = {}
+        with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:4] != GGUF_MAGIC:
+                raise ValueError(f"{path} is not a gguf file")
+            if len(buffer) < 8:
+                raise ValueError(f"{path} has a truncated or corrupt gguf header")
+            (version,) = struct.unpack_from("<I", buffer, 4)
+            # a version with an empty low half was written with the opposite byte order
+            self.byte_order = ">" if version & 0xFFFF == 0 else "<"
+            cursor = _Cursor(buffer, self.byte_order, 4)
+            (self.version,) = cursor.unpack("I")
+            if self.version not in SUPPORTED_VERSIONS:
+                raise ValueError(f"gguf version {self.version} is not supported")
+            try:
+                self._read_fields(cursor)
+            except (struct.error, ValueError) as e:
+                # a partial download or copy, reported like any other unreadable file
+                raise ValueError(f"{path} has a truncated or corrupt gguf header: {e}") from e
+
+    def _read_fields(self, cursor: _Cursor):
+        self.tensor_count, kv_count = cursor.unpack("QQ")
+        for _ in range(kv_count):
+            key = cursor.string()
+            (value_type,) = cursor.unpack("I")
+            if value_type != _ARRAY:
+                self.fields[key] = cursor.value(value_type)
+                continue
+            item_type, count = cursor.unpack("IQ")
+            if count <= EAGER_ARRAY_LENGTH and item_type != _ARRAY:
+                self.fields[key] = [cursor.value(item_type) for _ in range(count)]
+            else:
+                self.fields[key] = GGUFArray(self.path, self.byte_order, item_type, count, cursor.offset)
+                cursor.skip(item_type, count)
+                if cursor.offset > len(cursor.buffer):
+                    raise ValueError(f"array {key} runs past the end of the file")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.fields.get(key, default)
+
+    @property
+    def architecture(self) -> str:
+        return self.get("general.architecture", "")
+
+    @property
+    def chat_template(self) -> str:
+        return self.get("tokenizer.chat_template", "")
+
+    def token(self, token_id: Optional[int]) -> str:
+        tokens = self.get("tokenizer.ggml.tokens")
+        if token_id is None or token_id < 0 or tokens is None or token_id >= len(tokens):
+            return ""
+        return tokens[token_id]
+
+    @cached_property
+    def bos_token(self) -> str:
+        return self.token(self.get("tokenizer.ggml.bos_token_id"))
+
+    @cached_property
+    def eos_token(self) -> str:
+        return self.token(self.get("tokenizer.ggml.eos_token_id"))
+
+
+@lru_cache(maxsize=64)
+def _read_gguf_metadata(path: str, size: int, mtime_ns: int) -> GGUFMetadata:
+    return GGUFMetadata(path)
+
+
+def read_gguf_metadata(path: Union[str, os.PathLike]) -> GGUFMetadata:
+    """Header of a GGUF file, cached by (path, size, mtime) so a file is parsed again only when it changes."""
+    path = os.path.abspath(os.fspath(path))
+    stat = os.stat(path)
+    return _read_gguf_metadata(path, stat.st_size, stat.st_mtime_ns)
@@ -1,5 +1,3 @@
-import hashlib
-import io
 import logging
 import operator
 import os
@@ -9,21 +7,19 @@ import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable, Optional, cast
+from typing import Optional, cast
 
 import huggingface_hub
 import psutil
 import requests
 from huggingface_hub import HfApi
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 
 from configs.env import (
-    ARGO_STORAGE_PATH,
     ARGO_STORAGE_PATH_TEMP_MODEL,
     EXTERNAL_ARGO_PATH,
     USE_ARGO_OLLAMA,
 )
+from configs.settings import MODEL_DOWNLOAD_SETTINGS
 from core.i18n.translation import translation_loader
 from core.model_providers.constants import OLLAMA_PROVIDER
 from core.model_providers.ollama.ollama_api import (
@@ -32,46 +28,30 @@ from core.model_providers.ollama.ollama_api import (
     ollama_create_model,
     ollama_pull_model,
 )
-from core.third_party.llama_cpp.llama import Llama
 from core.third_party.ollama_utils.chat_template import convert_gguf_template_to_ollama
-from database.provider_store import get_provider_settings_from_db
 from models.model_manager import DownloadStatus, Model
 from services.common.provider_setting_service import get_provider_setting
 from services.doc.util import random_ua
+from services.model.download_scheduler import (
+    CONVERT,
+    DOWNLOAD,
+    IMPORT,
+    fail_insufficient_disk,
+    model_scheduler,
+    needs_local_disk,
+    ollama_is_local,
+)
+from services.model.gguf_metadata import read_gguf_metadata
 
 # from services.model.convert import convert
 from services.model.model_service import ModelService
+from services.model.segmented_download import MirrorRanking, SegmentedDownload, probe_file
+from utils.file_hash import cached_file_sha256, remove_file_digest
 from utils.gputil import get_gpus
 
-
-class ThreadSafeDict:
-    def __init__(self):
-        self.dict = {}
-        self.lock = threading.Lock()
-
-    def set(self, key, value):
-        with self.lock:
-            self.dict[key] = value
-
-    def get(self, key):
-        with self.lock:
-            return self.dict.get(key)
-
-    def delete(self, key):
-        with self.lock:
-            if key in self.dict:
-                del self.dict[key]
-
-    def has(self, key):
-        with self.lock:
-            if key in self.dict:
-                return True
-            return False
-
-
-shared_dict = ThreadSafeDict()
-lock = threading.Lock()
 latency_lock = threading.Lock()
+probe_lock = threading.Lock()
+site_latency_checked_at: Optional[float] = None
 
 site_info = {
     "https://huggingface.co/models": 999,
@@ -81,94 +61,52 @@ site_info = {
 
 
 def init():
-    threading.Thread(target=process_model_download, daemon=True).start()
-
-
-def process_model_download():
-    while True:
-        time.sleep(5)
-        try:
-            all_model_list = ModelService.get_model_list()
-            for model in all_model_list:
-                if model.download_status == DownloadStatus.ALL_COMPLETE and ":" not in model.source:
-                    source_split = model.source.split("/")
-                    repo_id = "/".join(source_split[0:2])
-                    if len(source_split) == 3:
-                        gguf_file = source_split[2]
-                        if os.path.exists(os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, gguf_file)):
-                            os.remove(os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, gguf_file))
-                    else:
-                        if os.path.exists(os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id)):
-                            shutil.rmtree(os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id))
-
-                if shared_dict.has(model.id):
-                    time.sleep(1)
-                    continue
-
-                if model.download_status == DownloadStatus.CONVERT_COMPLETE:
-                    threading.Thread(target=process_import_model, args=(model,), daemon=True).start()
-
-                elif model.download_status == DownloadStatus.DOWNLOAD_COMPLETE:
-                    threading.Thread(target=process_convert_model, args=(model,), daemon=True).start()
-
-                elif model.download_status in [
-                    DownloadStatus.DOWNLOAD_WAITING,
-                    DownloadStatus.DOWNLOADING,
-                ]:
-                    threading.Thread(target=process_downloading_model, args=(model,), daemon=True).start()
-
-        except Exception as e:
-            logging.exception("Error occurred in process_model_download")
-            continue
-
-
-def register_id(func: Callable[[Model], None]):
-    def wrapper(model: Model):
-        with lock:
-            shared_dict.set(model.id, True)
-
-        logging.info(f"try process model: {func.__name__}, {model.model_name}")
-        try:
-            func(model)
-        except Exception as e:
-            logging.exception("An unexpected error occurred.")
-        logging.info(f"process model finish: {func.__name__}, {model.model_name}")
-
-        with lock:
-            shared_dict.delete(model.id)
-
-    return wrapper
-
-
-def check_local_device(model: Model, total_size: int) -> bool:
+    model_scheduler.start(
+        {
+            DOWNLOAD: process_downloading_model,
+            CONVERT: process_convert_model,
+            IMPORT: process_import_model,
+        },
+        on_complete=remove_temp_model_files,
+    )
+    pending_num = model_scheduler.recover()
+    logging.info(f"model job scheduler started, workers: {model_scheduler.workers}, pending: {pending_num}")
+
+
+def remove_temp_model_files(model: Model):
+    if ":" in model.source:
+        return
+    source_split = model.source.split("/")
+    repo_id = "/".join(source_split[0:2])
+    repo_path = os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id)
+    if len(source_split) == 3:
+        gguf_path = os.path.join(repo_path, source_split[2])
+        remove_file_digest(gguf_path)
+        if os.path.exists(gguf_path):
+            os.remove(gguf_path)
+    else:
+        if os.path.exists(repo_path):
+            for dir_path, _, file_names in os.walk(repo_path):
+                for file_name in file_names:
+                    remove_file_digest(os.path.join(dir_path, file_name))
+            shutil.rmtree(repo_path)
+
+
+def check_local_device(model: Model, total_size: int, downloaded: int = 0) -> bool:
+    """Reserve disk space for the rest of the download and check the model fits in memory."""
     if total_size <= 0:
         return True
 
-    provider_st = get_provider_settings_from_db(provider=OLLAMA_PROVIDER)
-    base_url = provider_st["base_url"]
-    if not ("localhost" in base_url or "127.0.0.1" in base_url):
+    if needs_local_disk(model):
+        admitted, free_b = model_scheduler.disk.admit(model.model_name, total_size - downloaded)
+        if not admitted:
+            fail_insufficient_disk(model.model_name, total_size - downloaded, free_b)
+            return False
+
+    if not ollama_is_local():
         return True
 
-    _, _, free_b, _ = psutil.disk_usage(ARGO_STORAGE_PATH)
-    free_gb = free_b / (1024**3)
-    # _, _, free_gb = ps.get_disk_usage(ARGO_STORAGE_PATH)
     total_size_gb = total_size / (1024**3)
-    if total_size_gb > free_gb:
-        message = translation_loader.translation.t(
-            "model.insufficient_disk",
-            total_size_gb=f"{total_size_gb:.2f}",
-            free_gb=f"{free_gb:.2f}",
-        )
-        ModelService.update_model_status(
-            model.model_name,
-            DownloadStatus.DOWNLOAD_FAILED,
-            download_progress=0,
-            download_speed=0,
-            process_message=message,
-        )
-        logging.error(message)
-        return False
-
     total_gpu_memory_gb = sum(gpu_info.memory_total for gpu_info in get_gpus()) / 1024
     total_memory_b = psutil.virtual_memory().total
     total_memory_gb = total_memory_b / (1024**3)
@@ -203,7 +141,7 @@ def process_downloading_model_ollama(model: Model):
     provider_st = get_provider_setting(OLLAMA_PROVIDER)
     base_url = provider_st.base_url or "" if provider_st else ""
 
-    start_time, start_size = time.time(), 0
+    start_time, start_size, checked_size = time.time(), 0, 0
     for status in ollama_pull_model(base_url, model.source):
         if err := status.get("error"):
             if ollama_check_addr():
@@ -237,8 +175,13 @@ def process_downloading_model_ollama(model: Model):
                 status.get("total", 0),
             )
 
-            if not check_local_device(model, total_size):
-                return
+            # ollama reports a layer at a time, the weights layer comes first
+            if total_size > checked_size:
+                checked_size = total_size
+                if not check_local_device(model, total_size, download_size):
+                    return
+            else:
+                model_scheduler.disk.update(model.model_name, total_size - download_size)
 
             sub_time, start_time = (time.time() - start_time), time.time()
             sub_size, start_size = download_size - start_size, download_size
@@ -291,25 +234,28 @@ def process_downloading_model_huggingface(model: Model):
 
     big_file_list = [file for file in file_list if file.split(".")[-1] in ["safetensors", "gguf", "bin", "onnx"]]
     other_file_list = [file for file in file_list if file not in big_file_list]
-    big_file_size_list, big_file_local_size_list = (
-        [0] * len(big_file_list),
-        [0] * len(big_file_list),
-    )
-
-    for i, file in enumerate(big_file_list):
-        file_url = huggingface_hub.hf_hub_url(repo_id, file)
-        local_file_path = os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, file)
 
-        response = requests.get(file_url, stream=True)
-        big_file_size_list[i] = int(response.headers.get("content-length", 0))
-        if os.path.exists(local_file_path):
-            big_file_local_size_list[i] = os.path.getsize(local_file_path)
+    scope_flag = False
+    model_scope_key = f"https://modelscope.cn/api/v1/models/{repo_id}/revisions"
+    res = requests.get(model_scope_key, headers={"User-Agent": random_ua()})
+    if res.status_code == 200:
+        scope_flag = True
 
-    download_size = sum(big_file_local_size_list)
-    total_size = sum(big_file_size_list)
+    session = requests.Session()
+    model_scheduler.bandwidth.register(model.model_name)
+    throttle = model_scheduler.bandwidth.throttle(model.model_name)
+    downloads = []
+    for file in big_file_list:
+        ranking = MirrorRanking(get_mirror_urls(huggingface_hub.hf_hub_url(repo_id, file), scope_flag))
+        size, ranges = probe_file(ranking, session)
+        file_path = os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, file)
+        downloads.append(SegmentedDownload(file_path, size, ranking, ranges=ranges, throttle=throttle))
+
+    download_size = sum(download.done for download in downloads)
+    total_size = sum(download.size for download in downloads)
     download_progress = 100 * download_size // total_size if total_size != 0 else None
 
-    if not check_local_device(model, total_size):
+    if not check_local_device(model, total_size, download_size):
         return
 
     ok = ModelService.update_model_status(
@@ -329,12 +275,6 @@ def process_downloading_model_huggingface(model: Model):
         logging.info("Model download interrupted.")
         return
 
-    scope_flag = False
-    model_scope_key = f"https://modelscope.cn/api/v1/models/{repo_id}/revisions"
-    res = requests.get(model_scope_key, headers={"User-Agent": random_ua()})
-    if res.status_code == 200:
-        scope_flag = True
-
     for file in other_file_list:
         file_url = huggingface_hub.hf_hub_url(repo_id, file)
         file_url = get_file_url(file_url, scope_flag)
@@ -343,110 +283,33 @@ def process_downloading_model_huggingface(model: Model):
         other_file_path = Path(os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, file))
         other_file_path.write_bytes(response.content)
 
-    retry_strategy = Retry(
-        total=5,
-        backoff_factor=1,
-        status_forcelist=[443, 500, 502, 503, 504],
-        allowed_methods=["GET", "POST"],
-    )
-    session = requests.Session()
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-
-    file_buffer = io.BytesIO()
-    for i, file in enumerate(big_file_list):
-        origin_file_url = huggingface_hub.hf_hub_url(repo_id, file)
-        local_file_path = os.path.join(ARGO_STORAGE_PATH_TEMP_MODEL, repo_id, file)
-
-        max_retries = 5
-        with open(local_file_path, "ab") as fp:
-            big_file_local_size_list[i] = fp.tell()
-            for retry_num in range(max_retries):
-                get_site_latency()
-                file_url = get_file_url(origin_file_url, scope_flag)
-                logging.info(f"process_downloading_model_huggingface file_url: {file_url}")
-                try:
-                    file_buffer.seek(0)
-                    file_buffer.truncate(0)
-                    with session.get(
-                        file_url,
-                        stream=True,
-                        timeout=(10, 120),
-                        headers={"Range": f"bytes={big_file_local_size_list[i]}-"},
-                    ) as response:
-                        if response.status_code == 404:
-                            logging.info(f"Download complete: {file_url}")
-                            break
-                        if response.status_code not in [200, 206]:
-                            logging.warning(f"Error: HTTP {response.status_code}, retrying...")
-                            time.sleep(2**retry_num)
-                            continue
-                        start_time = time.time()
-                        for n, chunk in enumerate(response.iter_content(chunk_size=1024)):
-                            if chunk:
-                                file_buffer.write(chunk)
-                            if file_buffer.tell() >= 1024 * 1024:
-                                sub_time = time.time() - start_time
-                                speed = file_buffer.tell() // (sub_time + 1e-7)
-                                fp.write(file_buffer.getvalue())
-                                file_buffer.seek(0)
-                                file_buffer.truncate(0)
-
-                                big_file_local_size_list[i] = fp.tell()
-                                download_size = sum(big_file_local_size_list)
-                                total_size = sum(big_file_size_list)
-                                download_progress = 100 * download_size // total_size if total_size > 0 else 0
-
-                                ok = ModelService.update_model_status(
-                                    model.model_name,
-                                    DownloadStatus.DOWNLOADING,
-                                    reset=True,
-                                    download_progress=download_progress,
-                                    download_speed=speed,
-                                    process_message=translation_loader.translation.t(
-                                        "model.download_info.download_size",
-                                        cur_size=download_size // (1024 * 1024),
-                                        total_size=total_size // (1024 * 1024),
-                                    ),
-                                )
-                                logging.info(
-                                    f"downloading {model.model_name}: {download_size}/{total_size}, speed: {speed}"
-                                )
-                                start_time = time.time()
-
-                                if not ok:
-                                    logging.info("Model download interrupted.")
-                                    return
-
-                        if file_buffer.tell() > 0:
-                            fp.write(file_buffer.getvalue())
-                            file_buffer.seek(0)
-                            file_buffer.truncate(0)
-                            big_file_local_size_list[i] = fp.tell()
-                            download_size = sum(big_file_local_size_list)
-                            total_size = sum(big_file_size_list)
-                            ok = ModelService.update_model_status(
-                                model.model_name,
-                                DownloadStatus.DOWNLOADING,
-                                reset=True,
-                                download_progress=download_progress,
-                                download_speed=speed,
-                                process_message=translation_loader.translation.t(
-                                    "model.download_info.download_size",
-                                    cur_size=download_size // (1024 * 1024),
-                                    total_size=total_size // (1024 * 1024),
-                                ),
-                            )
-                            if not ok:
-                                logging.info("Model download interrupted.")
-                                return
-                        logging.info(f"Download complete: {file_url}")
-                        return
-                except Exception as ex:
-                    logging.warning(f"Retry {retry_num + 1}/{max_retries}, error: {ex}")
-                    time.sleep(2**retry_num)
-                    continue
+    completed_size = 0
+    for download in downloads:
+
+        def on_progress(done: int, speed: float, base: int = completed_size) -> bool:
+            download_size = base + done
+            model_scheduler.disk.update(model.model_name, total_size - download_size)
+            if random.random() < 0.2:
+                logging.info(f"downloading {model.model_name}: {download_size}/{total_size}, speed: {speed:.0f}")
+            return ModelService.update_model_status(
+                model.model_name,
+                DownloadStatus.DOWNLOADING,
+                reset=True,
+                download_progress=100 * download_size // total_size if total_size > 0 else 0,
+                download_speed=int(speed),
+                process_message=translation_loader.translation.t(
+                    "model.download_info.download_size",
+                    cur_size=download_size // (1024 * 1024),
+                    total_size=total_size // (1024 * 1024),
+                ),
+            )
+
+        download.on_progress = on_progress
+        logging.info(f"process_downloading_model_huggingface file_url: {download.ranking.best()}")
+        if not download.run():
+            logging.info("Model download interrupted.")
+            return
+        completed_size += download.size
 
     ModelService.update_model_status(
         model.model_name,
@@ -458,11 +321,10 @@ def process_downloading_model_huggingface(model: Model):
     logging.info(f"download {model.model_name} all success")
 
 
-@register_id
 def process_downloading_model(model: Model):
     try:
-        get_site_latency()
         if ":" not in model.source:
+            refresh_site_latency()
             process_downloading_model_huggingface(model)
         elif ":" in model.source:
             process_downloading_model_ollama(model)
@@ -475,7 +337,6 @@ def process_downloading_model(model: Model):
         )
 
 
-@register_id
 def process_convert_model(model: Model):
     model_name = model.model_name
     source_split = model.source.split("/")
@@ -514,36 +375,36 @@ def import_ollama_model(model: Model):
         logging.info(f"replace external argo path: {EXTERNAL_ARGO_PATH}")
         model_file = os.path.join(EXTERNAL_ARGO_PATH, "tmp_models", repo_id, gguf_file)
 
-    llm = Llama(model_path=model_file, vocab_only=True, verbose=False)
-    chat_template = llm.get_chat_template()
-    if not chat_template:
-        logging.warning(f"No chat_template found for model: {model.ollama_model_name}")
-
-    result = None
-    if chat_template:
-        result = convert_gguf_template_to_ollama(
-            {
-                "chat_template": chat_template,
-                "eos_token": llm.get_eos_token(),
-                "bos_token": llm.get_bos_token(),
-            }
-        )
-        if result is None:
-            logging.warning(f"Failed to convert chat_template for model: {model.ollama_model_name}")
+    try:
+        gguf_metadata = read_gguf_metadata(model_file)
+        chat_template = gguf_metadata.chat_template
+        if not chat_template:
+            logging.warning(f"No chat_template found for model: {model.ollama_model_name}")
+
+        result = None
+        if chat_template:
+            result = convert_gguf_template_to_ollama(
+                {
+                    "chat_template": chat_template,
+                    "eos_token": gguf_metadata.eos_token,
+                    "bos_token": gguf_metadata.bos_token,
+                }
+            )
+            if result is None:
+                logging.warning(f"Failed to convert chat_template for model: {model.ollama_model_name}")
 
-    ollama_template = None
-    ollama_parameters = None
-    if result:
-        ollama_template = cast(Optional[str], result.ollama.get("template"))
-        ollama_parameters = cast(Optional[dict], result.ollama.get("params"))
+        ollama_template = None
+        ollama_parameters = None
+        if result:
+            ollama_template = cast(Optional[str], result.ollama.get("template"))
+            ollama_parameters = cast(Optional[dict], result.ollama.get("params"))
 
-    try:
         provider_st = get_provider_setting(OLLAMA_PROVIDER)
         if not provider_st:
             raise ValueError(f"Provider '{OLLAMA_PROVIDER}' is not initialized")
 
         model_path = Path(model_file).expanduser()
-        blob_digest = upload_model_blob(provider_st.safe_base_url, model_path)
+        blob_digest = upload_model_blob(provider_st.safe_base_url, model_path, model.model_name)
         if not blob_digest:
             raise ValueError(f"Failed to upload blob for model file: {model_path}")
 
@@ -562,16 +423,43 @@ def import_ollama_model(model: Model):
         return msg
 
 
-def upload_model_blob(base_url: str, file_path: Path) -> Optional[str]:
+class ImportProgress:
+    """Reports hashing as the first half and uploading as the second half of an import, at most once a second."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._last_report = 0.0
+        self._last_done = 0
+
+    def stage(self, offset: int):
+        def report(done: int, total: int):
+            now = time.monotonic()
+            if now - self._last_report < 1 and done < total:
+                return
+            elapsed = now - self._last_report if self._last_report else 0
+            speed = (done - self._last_done) / elapsed if elapsed and done >= self._last_done else 0
+            self._last_report, self._last_done = now, done
+            ModelService.update_model_status(
+                self.model_name,
+                DownloadStatus.CONVERT_COMPLETE,
+                download_progress=offset + int(50 * done / max(total, 1)),
+                download_speed=int(speed),
+            )
+
+        return report
+
+
+def upload_model_blob(base_url: str, file_path: Path, model_name: Optional[str] = None) -> Optional[str]:
     try:
         if not file_path.exists():
             raise FileNotFoundError(f"Model file not found: {file_path}")
 
-        file_bytes = file_path.read_bytes()
-        blob_digest = hashlib.sha256(file_bytes).hexdigest()
+        progress = ImportProgress(model_name) if model_name else None
+        blob_digest = cached_file_sha256(file_path, on_progress=progress.stage(0) if progress else None)
         blob_ref = f"sha256:{blob_digest}"
 
-        ollama_create_blob(base_url, blob_ref, file_path)
+        if not ollama_create_blob(base_url, blob_ref, file_path, on_progress=progress.stage(50) if progress else None):
+            return None
         return blob_ref
 
     except Exception as e:
@@ -579,7 +467,6 @@ def upload_model_blob(base_url: str, file_path: Path) -> Optional[str]:
         return None
 
 
-@register_id
 def process_import_model(model: Model):
     msg = import_ollama_model(model)
     if msg == "success":
@@ -627,6 +514,38 @@ def get_site_latency():
     logging.info("\n".join(msg_list))
 
 
+def refresh_site_latency():
+    """Probe the sites again only once the last probe is older than SITE_LATENCY_TTL, so retries and resumes
+    of a download reuse it."""
+    global site_latency_checked_at
+    with probe_lock:
+        if (
+            site_latency_checked_at is not None
+            and time.monotonic() - site_latency_checked_at < MODEL_DOWNLOAD_SETTINGS["SITE_LATENCY_TTL"]
+        ):
+            return
+        get_site_latency()
+        site_latency_checked_at = time.monotonic()
+
+
+def get_mirror_urls(file_url, scope_flag) -> list[str]:
+    """The file on every reachable site, fastest site first."""
+    urls = []
+    for site in list(site_info):
+        if site == "https://modelscope.cn/models":
+            if scope_flag:
+                urls.append(
+                    file_url.replace("hf-mirror.com", "modelscope.cn/models")
+                    .replace("huggingface.co", "modelscope.cn/models")
+                    .replace("/main/", "/master/")
+                )
+        elif site == "https://hf-mirror.com/models":
+            urls.append(file_url.replace("huggingface.co", "hf-mirror.com"))
+        else:
+            urls.append(file_url.replace("hf-mirror.com", "huggingface.co"))
+    return [str(url) for url in urls]
+
+
 def get_file_url(file_url, scope_flag) -> str:
     site_list = list(site_info.items())
     if site_list[0][0] == "https://modelscope.cn/models":
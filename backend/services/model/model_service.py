@@ -8,6 +8,7 @@ from core.model_providers.constants import OLLAMA_PROVIDER
 from core.model_providers.ollama.ollama_api import ollama_create_model
 from core.tracking.client import ModelTrackingPayload, argo_tracking
 from database.db import session_scope
+from events.model_event import model_status_changed
 from models.model_manager import DownloadStatus, Model
 from services.common.provider_setting_service import get_provider_setting
 from services.model.modelfile_parser import parse_modelfile
@@ -80,6 +81,9 @@ class ModelService:
                 model.use_xunlei = use_xunlei
             session.add(model)
 
+        if status:
+            model_status_changed.send(model_name, status=status)
+
         argo_tracking(
             ModelTrackingPayload(
                 model_name=source or "",
@@ -137,6 +141,7 @@ class ModelService:
     ):
         with session_scope() as session:
             if model := session.query(Model).filter(Model.model_name == model_name).one_or_none():
+                changed = not reset and model.download_status != download_status
                 if not reset:
                     model.download_status = download_status
                 if is_embeddings is not None:
@@ -179,8 +184,12 @@ class ModelService:
                 ]:
                     model.download_speed = 0
                     return False
-                return True
-        return False
+            else:
+                return False
+
+        if changed:
+            model_status_changed.send(model_name, status=download_status)
+        return True
 
     @staticmethod
     def update_ollama_modelfile_and_reload_model(model_name: str, modelfile_content: str):
@@ -265,8 +274,12 @@ class ModelService:
                 if status:
                     model.download_status = status
                 model.updated_by = user_id
-                return True
-        return False
+            else:
+                return False
+
+        if status:
+            model_status_changed.send(new_model_name or model_name, status=status)
+        return True
 
     @staticmethod
     def sync_model_info(
@@ -301,11 +314,16 @@ class ModelService:
                 model.ollama_template = ollama_template
                 model.ollama_architecture = ollama_architecture
                 model.ollama_parameters = ollama_parameters
+                changed = status is not None and model.download_status != status
                 if status:
                     model.download_status = status
                 model.created_at = created_at
-                return True
-        return False
+            else:
+                return False
+
+        if changed:
+            model_status_changed.send(model_name, status=status)
+        return True
 
     @staticmethod
     def update_model_info(
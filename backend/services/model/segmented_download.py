@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable
+from itertools import starmap
+from typing import Optional
+
+import requests
+
+from configs.settings import MODEL_DOWNLOAD_SETTINGS
+
+SEGMENT_MAP_SUFFIX = ".segments"
+
+
+class Segment:
+    def __init__(self, start: int, end: int, done: int = 0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def finished(self) -> bool:
+        return self.start + self.done >= self.end
+
+
+class MirrorRanking:
+    """
+    Candidate URLs of one file, ranked by recent failures and by the throughput segments got from them.
+
+    Every segment asks for the best mirror when it starts, so a slow or failing mirror loses traffic within a
+    few segments instead of for the whole file. Mirrors not measured yet keep their latency order.
+    """
+
+    def __init__(self, urls: list[str]):
+        self.urls = list(dict.fromkeys(urls))
+        self._speed: dict[str, Optional[float]] = dict.fromkeys(self.urls)
+        self._failures = dict.fromkeys(self.urls, 0)
+        self._lock = threading.Lock()
+
+    def _key(self, url: str) -> tuple:
+        speed = self._speed[url]
+        return self._failures[url], speed is None, -(speed or 0.0), self.urls.index(url)
+
+    def ordered(self) -> list[str]:
+        with self._lock:
+            return sorted(self.urls, key=self._key)
+
+    def best(self) -> str:
+        return self.ordered()[0]
+
+    def record(self, url: str, size: int, seconds: float):
+        if size <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            speed, previous = size / seconds, self._speed[url]
+            self._speed[url] = speed if previous is None else previous * 0.7 + speed * 0.3
+            self._failures[url] = max(0, self._failures[url] - 1)
+
+    def fail(self, url: str):
+        with self._lock:
+            self._failures[url] += 1
+
+
+def probe_file(ranking: MirrorRanking, session: requests.Session) -> tuple[int, bool]:
+    """Return (size, ranges supported) of a file, asking the mirrors in ranked order."""
+    last_error: Optional[Exception] = None
+    for url in ranking.ordered():
+        try:
+            with session.get(url, stream=True, timeout=(10, 30), headers={"Range": "bytes=0-0"}) as response:
+                if response.status_code == 206:
+                    content_range = response.headers.get("Content-Range", "")
+                    return int(content_range.rsplit("/", 1)[-1]), True
+                if response.status_code == 200:
+                    return int(response.headers.get("Content-Length", 0)), False
+                last_error = ValueError(f"HTTP {response.status_code} from {url}")
+        except (requests.RequestException, ValueError) as ex:
+            last_error = ex
+        ranking.fail(url)
+    raise ValueError(f"no mirror could serve the file: {last_error}")
+
+
+class SegmentedDownload:
+    """
+    Downloads one file over parallel HTTP range requests.
+
+    The file is preallocated as a sparse file and every worker writes its segment in place with pwrite. The
+    segment map is persisted next to the file at the progress cadence, so an interrupted download resumes at
+    the exact bytes it has. Progress is aggregated in memory; `on_progress(done, speed)` is called at a fixed
+    interval and stops the download when it returns False. `throttle(size)` is asked after every chunk for the
+    seconds to wait before reading on, which is how the scheduler shapes bandwidth.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        ranking: MirrorRanking,
+        ranges: bool = True,
+        on_progress: Optional[Callable[[int, float], bool]] = None,
+        throttle: Optional[Callable[[int], float]] = None,
+    ):
+        self.path = path
+        self.size = size
+        self.ranking = ranking
+        self.ranges = ranges and size > 0
+        self.on_progress = on_progress
+        self.throttle = throttle
+        self.map_path = f"{path}{SEGMENT_MAP_SUFFIX}"
+        self.connections = MODEL_DOWNLOAD_SETTINGS["CONNECTIONS"] if self.ranges else 1
+        self.segments = self._load_segments()
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._finished = threading.Event()
+        self._active = 0
+        self._errors: list[Exception] = []
+
+    @property
+    def done(self) -> int:
+        with self._lock:
+            return sum(segment.done for segment in self.segments)
+
+    def run(self) -> bool:
+        """Return True when the file is complete, False when it was stopped. Raises when segments keep failing."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != self.size:
+            with open(self.path, "ab") as fp:
+                fp.truncate(self.size)
+
+        pending: queue.Queue[Segment] = queue.Queue()
+        for segment in self.segments:
+            if not segment.finished:
+                pending.put(segment)
+        self._active = min(self.connections, pending.qsize())
+        if self._active == 0:
+            self._finished.set()
+        for index in range(self._active):
+            threading.Thread(target=self._worker, args=(pending,), daemon=True, name=f"download-{index}").start()
+
+        interval = MODEL_DOWNLOAD_SETTINGS["PROGRESS_INTERVAL"]
+        last_done, last_time = self.done, time.monotonic()
+        while not self._finished.is_set():
+            self._finished.wait(interval)
+            now = time.monotonic()
+            done = self.done
+            speed = (done - last_done) / (now - last_time) if now > last_time else 0.0
+            last_done, last_time = done, now
+            self._save_segments()
+            if self.on_progress and not self._stopped.is_set() and not self.on_progress(done, speed):
+                self._stopped.set()
+
+        self._save_segments()
+        if self._stopped.is_set() and not self._errors:
+            return False
+        if not all(segment.finished for segment in self.segments):
+            raise self._errors[0] if self._errors else ValueError(f"download of {self.path} incomplete")
+
+        try:
+            os.remove(self.map_path)
+        except FileNotFoundError:
+            pass
+        if self.on_progress:
+            self.on_progress(self.size, 0.0)
+        return True
+
+    def _worker(self, pending: queue.Queue[Segment]):
+        try:
+            self._download_segments(pending)
+        except Exception as ex:
+            logging.exception(f"download worker of {self.path} failed")
+            self._errors.append(ex)
+            self._stopped.set()
+        finally:
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    self._finished.set()
+
+    def _download_segments(self, pending: queue.Queue[Segment]):
+        session = requests.Session()
+        with open(self.path, "r+b") as fp:
+            while not self._stopped.is_set():
+                try:
+                    segment = pending.get_nowait()
+                except queue.Empty:
+                    return
+                for attempt in range(MODEL_DOWNLOAD_SETTINGS["MAX_RETRIES"]):
+                    url = self.ranking.best()
+                    try:
+                        self._fetch(session, fp, url, segment)
+                        break
+                    except (requests.RequestException, OSError, ValueError) as ex:
+                        if self._stopped.is_set():
+                            return
+                        logging.warning(f"segment {segment.start}-{segment.end} from {url} failed: {ex}")
+                        self.ranking.fail(url)
+                        time.sleep(min(2**attempt, 30))
+                else:
+                    self._errors.append(ValueError(f"segment {segment.start}-{segment.end} of {self.path} failed"))
+                    self._stopped.set()
+                    return
+
+    def _fetch(self, session: requests.Session, fp, url: str, segment: Segment):
+        if not self.ranges:
+            # without range support a retry starts over
+            with self._lock:
+                segment.done = 0
+        offset = segment.start + segment.done
+        headers = {"Range": f"bytes={offset}-{segment.end - 1}"} if self.ranges else {}
+        started, received = time.monotonic(), 0
+        with session.get(url, stream=True, timeout=(10, 120), headers=headers) as response:
+            if response.status_code != (206 if self.ranges else 200):
+                raise ValueError(f"HTTP {response.status_code}")
+            for chunk in response.iter_content(chunk_size=MODEL_DOWNLOAD_SETTINGS["CHUNK_SIZE"]):
+                if self._stopped.is_set():
+                    return
+                chunk = chunk[: segment.end - offset]
+                _write_at(fp, chunk, offset)
+                offset += len(chunk)
+                received += len(chunk)
+                with self._lock:
+                    segment.done += len(chunk)
+                if self.throttle and (wait := self.throttle(len(chunk))) > 0:
+                    self._stopped.wait(wait)
+                if offset >= segment.end:
+                    break
+        self.ranking.record(url, received, time.monotonic() - started)
+        if not segment.finished:
+            raise ValueError("connection closed before the end of the segment")
+
+    def _load_segments(self) -> list[Segment]:
+        try:
+            with open(self.map_path, encoding="utf-8") as fp:
+                saved = json.load(fp)
+            if saved.get("size") == self.size and os.path.exists(self.path):
+                return list(starmap(Segment, saved["segments"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        if not self.ranges:
+            return [Segment(0, self.size)]
+        # a file without a map was written sequentially (by an older version), its bytes so far are a prefix
+        existing = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        existing = existing if existing < self.size else 0
+        segment_size = MODEL_DOWNLOAD_SETTINGS["SEGMENT_SIZE"]
+        return [
+            Segment(start, min(start + segment_size, self.size), max(0, min(existing - start, segment_size)))
+            for start in range(0, self.size, segment_size)
+        ]
+
+    def _save_segments(self):
+        with self._lock:
+            data = {"size": self.size, "segments": [[each.start, each.end, each.done] for each in self.segments]}
+        temp_path = f"{self.map_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as fp:
+                json.dump(data, fp)
+            os.replace(temp_path, self.map_path)
+        except OSError:
+            logging.exception(f"Failed to save segment map {self.map_path}")
+
+
+def _write_at(fp, data: bytes, offset: int):
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fp.fileno(), view, offset)
+            view, offset = view[written:], offset + written
+    else:
+        # each worker has its own file object, so seek and write do not race
+        fp.seek(offset)
+        fp.write(data)
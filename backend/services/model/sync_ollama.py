@@ -1,6 +1,5 @@
 import logging
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Union, cast
@@ -12,6 +11,7 @@ from dateutil import parser
 from core.model_providers.constants import OLLAMA_PROVIDER
 from core.model_providers.ollama.ollama_api import (
     ollama_get_model_list,
+    ollama_inventory,
     ollama_model_is_embeddings,
     ollama_model_is_generation,
 )
@@ -27,9 +27,16 @@ def init():
 
 
 def period_sync_ollama():
+    sync_ollama_model_info()
     while True:
+        # woken early by pulls, creates and deletes, otherwise once per inventory TTL to notice outside changes
+        ollama_inventory.invalidated.wait(ollama_inventory.ttl)
+        ollama_inventory.invalidated.clear()
         sync_ollama_model_info()
-        time.sleep(20)
+
+
+def request_sync():
+    ollama_inventory.invalidated.set()
 
 
 def sync_ollama_model_info():
@@ -68,7 +75,11 @@ def sync_ollama_model_info():
             general_architecture = ollama_model.model_info.general_architecture if ollama_model.model_info else None
 
             if model_info := all_model_ollama_map.get(ollama_model.name):
-                if model_info.download_status == DownloadStatus.ALL_COMPLETE:
+                if model_info.download_status == DownloadStatus.ALL_COMPLETE and (
+                    model_info.ollama_template != ollama_template
+                    or model_info.ollama_architecture != general_architecture
+                    or model_info.ollama_parameters != ollama_parameters
+                ):
                     # logging.info(
                     #     f"Syncing missing architecture/template for model '{model_info.model_name}' "
                     #     f"with architecture='{ollama_model.model_info.general_architecture}' "
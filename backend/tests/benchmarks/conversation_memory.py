@@ -0,0 +1,97 @@
+"""
+Compare the cost of reading the chat history of a growing conversation before and after the memory cache.
+
+    cd backend && DATABASE_URL=sqlite:////tmp/memory_benchmark.db python -m tests.benchmarks.conversation_memory
+
+A conversation gets --turns messages one by one; after each message the history is read the way a new message
+reads it. "before" is the old ConversationBufferDBMemory.buffer: up to 500 rows loaded and turned into prompt
+messages on every read, then deep-copied as the roleplay runner did. "after" is the memory cache window, which
+loads the new rows only and hands out copies. The conversation is deleted at the end.
+"""
+
+import argparse
+import datetime
+import re
+import statistics
+import time
+from copy import deepcopy
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from core.memory.conversation_memory_cache import conversation_memory_cache
+from database import db
+from database.db import session_scope
+from events import event_handlers  # noqa: F401
+from events.conversation_event import conversation_messages_changed
+from models.conversation import Conversation, Message, filter_message
+
+
+def buffer_before(conversation_id: str) -> list[BaseMessage]:
+    messages = list(reversed(filter_message(conversation_id=conversation_id, message_limit=500)))
+    chat_messages: list[BaseMessage] = []
+    for message in messages:
+        if message.query:
+            chat_messages.append(HumanMessage(name="Human", content=message.query))
+        if message.answer:
+            answer = re.sub(r"<think>.*?</think>", "", message.answer, flags=re.DOTALL)
+            chat_messages.append(AIMessage(name="Assistant", content=answer))
+    return deepcopy(chat_messages)
+
+
+def buffer_after(conversation_id: str) -> list[BaseMessage]:
+    # no budget, the same messages as before
+    return conversation_memory_cache.window(conversation_id, model_name="benchmark", max_tokens=0)
+
+
+def run(label: str, read, turns: int, words: int) -> list[float]:
+    with session_scope() as session:
+        conversation = Conversation(name=f"memory benchmark {label}")
+        session.add(conversation)
+        session.commit()
+        conversation_id = conversation.id
+
+    started_at = datetime.datetime.now()
+    timings = []
+    try:
+        for turn in range(turns):
+            with session_scope() as session:
+                message = Message(
+                    conversation_id=conversation_id,
+                    query=" ".join(f"question{turn}" for _ in range(words)),
+                    answer="<think>reasoning</think>" + " ".join(f"answer{turn}" for _ in range(words * 3)),
+                    created_at=started_at + datetime.timedelta(milliseconds=turn),
+                )
+                session.add(message)
+                session.commit()
+                conversation_messages_changed.send(conversation_id, created_at=message.created_at)
+
+            read_started = time.perf_counter()
+            history = read(conversation_id)
+            timings.append(time.perf_counter() - read_started)
+            assert len(history) == 2 * min(turn + 1, 500), f"{label}: {len(history)} messages at turn {turn}"
+    finally:
+        with session_scope() as session:
+            session.query(Message).filter_by(conversation_id=conversation_id).delete()
+            session.query(Conversation).filter_by(id=conversation_id).delete()
+        conversation_messages_changed.send(conversation_id)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--words", type=int, default=60, help="words per question, answers are 3 times longer")
+    args = parser.parse_args()
+    db.init()
+
+    for label, read in (("before", buffer_before), ("after", buffer_after)):
+        timings = run(label, read, args.turns, args.words)
+        last = timings[-50:]
+        print(
+            f"{label}: history read at turn {args.turns} {statistics.median(last) * 1000:.2f} ms "
+            f"(median of the last 50), all {args.turns} reads {sum(timings):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
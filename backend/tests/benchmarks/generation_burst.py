@@ -0,0 +1,170 @@
+"""
+Compare a burst of agent chat messages on a thread per message with the generation executor.
+
+    cd backend && python -m tests.benchmarks.generation_burst --messages 200 --tokens 50 --token-ms 20
+
+Every message is a fake agent: it streams --tokens tokens, --token-ms apart, through a token channel to a
+consumer that publishes them to an ApplicationQueueManager listened to on the main loop. "before" is the old
+shape: ChatService.say starts a thread running asyncio.run, and the agent runner starts a second thread with
+its own loop that polls a queue.Queue every 100 ms. "after" submits the same agent to GenerationExecutor, where
+the agent and the consumer share a worker loop. The report shows the peak thread count, the time to the first
+token and to the end of the message, as seen by the listener.
+"""
+
+import argparse
+import asyncio
+import queue
+import statistics
+import threading
+import time
+import uuid
+
+from langchain_core.messages import AIMessage
+
+from core.queue.application_queue_manager import ApplicationQueueManager, PublishFrom
+from core.queue.entities.llm_entities import LLMResult
+from core.queue.entities.queue_entities import QueueMessageDeltaEvent, QueueMessageEndEvent
+from services.chat.generation_executor import GenerationExecutor, GenerationJob
+
+
+async def fake_agent(tokens: int, token_delay: float, put, done):
+    for index in range(tokens):
+        await asyncio.sleep(token_delay)
+        put(index)
+    done()
+
+
+async def publish_end(queue_manager: ApplicationQueueManager):
+    await queue_manager.publish_message_end(
+        LLMResult(model="benchmark", prompt_messages=[], message=AIMessage(content="")),
+        PublishFrom.APPLICATION_MANAGER,
+    )
+
+
+def run_before(queue_manager: ApplicationQueueManager, tokens: int, token_delay: float):
+    channel: queue.Queue = queue.Queue()
+    finished = threading.Event()
+
+    async def stream():
+        index = 0
+        while not channel.empty() or not finished.is_set():
+            try:
+                channel.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            await queue_manager.publish_delta(index, " token", PublishFrom.APPLICATION_MANAGER)
+            index += 1
+
+    async def generate():
+        def run_stream():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(stream())
+            loop.close()
+
+        inner = threading.Thread(target=run_stream)
+        inner.start()
+        await fake_agent(tokens, token_delay, channel.put_nowait, finished.set)
+        await asyncio.get_running_loop().run_in_executor(None, inner.join)
+        await publish_end(queue_manager)
+
+    threading.Thread(target=lambda: asyncio.run(generate())).start()
+
+
+def run_after(executor: GenerationExecutor, queue_manager: ApplicationQueueManager, tokens: int, token_delay: float):
+    async def generate():
+        channel: asyncio.Queue = asyncio.Queue()
+        agent = asyncio.create_task(
+            fake_agent(tokens, token_delay, channel.put_nowait, lambda: channel.put_nowait(None))
+        )
+        index = 0
+        while await channel.get() is not None:
+            await queue_manager.publish_delta(index, " token", PublishFrom.APPLICATION_MANAGER)
+            index += 1
+        await agent
+        await publish_end(queue_manager)
+
+    executor.submit(
+        GenerationJob(
+            task_id=queue_manager._task_id,
+            user_id=queue_manager.user_id,
+            bot_id="benchmark",
+            run=generate,
+            on_position=queue_manager.publish_position,
+        )
+    )
+
+
+async def listen(queue_manager: ApplicationQueueManager, started: float) -> tuple[float, float]:
+    first = end = 0.0
+    async for message in queue_manager.listen():
+        if isinstance(message.event, QueueMessageDeltaEvent) and not first:
+            first = time.perf_counter() - started
+        elif isinstance(message.event, QueueMessageEndEvent):
+            end = time.perf_counter() - started
+    return first, end
+
+
+async def burst(label: str, start, messages: int):
+    peak = threading.active_count()
+    stop_sampling = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak
+        while not stop_sampling.is_set():
+            peak = max(peak, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample_threads())
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    listeners = []
+    for index in range(messages):
+        # one user per message, the per user cap is not what is measured here
+        queue_manager = ApplicationQueueManager(str(uuid.uuid4()), f"user-{index}", "c", "chat", str(uuid.uuid4()))
+        listeners.append(asyncio.create_task(listen(queue_manager, started)))
+        start(queue_manager)
+    results = await asyncio.gather(*listeners)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    stop_sampling.set()
+    await sampler
+
+    firsts = sorted(first for first, _ in results)
+    ends = sorted(end for _, end in results)
+    p99 = max(0, int(len(ends) * 0.99) - 1)
+    print(
+        f"{label}: peak {peak} threads, first token p50 {statistics.median(firsts) * 1000:.0f} ms "
+        f"p99 {firsts[p99] * 1000:.0f} ms, message end p50 {statistics.median(ends) * 1000:.0f} ms "
+        f"p99 {ends[p99] * 1000:.0f} ms, burst done in {elapsed:.2f}s using {cpu:.2f}s CPU"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--tasks-per-worker", type=int, default=100)
+    args = parser.parse_args()
+    token_delay = args.token_ms / 1000
+
+    await burst("before", lambda qm: run_before(qm, args.tokens, token_delay), args.messages)
+
+    executor = GenerationExecutor(
+        workers=args.workers,
+        tasks_per_worker=args.tasks_per_worker,
+        queue_size=args.messages,
+        per_user=1,
+        per_bot=args.messages,
+    )
+    executor.start()
+    await burst(
+        f"after ({args.workers}x{args.tasks_per_worker} slots)",
+        lambda qm: run_after(executor, qm, args.tokens, token_delay),
+        args.messages,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
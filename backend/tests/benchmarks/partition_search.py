@@ -0,0 +1,119 @@
+"""
+Compare partition-scoped qdrant searches before and after pushing the partition filter into the query.
+
+    cd backend && python -m tests.benchmarks.partition_search --points 100000 --partitions 500
+
+"before" is the old query_doc call: partition names only used as payload include keys and vectors returned.
+"after" is search_partitions: scoped to the partitions, no vectors returned and the payload projected.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from core.features.doc_search import search_partitions
+from database import vector
+
+COLLECTION = "benchmark"
+
+
+def build(client: QdrantClient, points: int, partitions: int, dimension: int) -> list[str]:
+    partition_names = [f"d_{uuid.uuid4().hex}" for _ in range(partitions)]
+    client.create_collection(
+        COLLECTION,
+        vectors_config=models.VectorParams(
+            size=dimension,
+            distance=models.Distance.COSINE,
+            datatype=models.Datatype.FLOAT16,
+        ),
+    )
+    rng = np.random.default_rng(0)
+    for start in range(0, points, 1000):
+        count = min(1000, points - start)
+        vectors = rng.random((count, dimension), dtype=np.float32)
+        client.upsert(
+            COLLECTION,
+            points=[
+                models.PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=embedding.tolist(),
+                    payload={
+                        "page_content": f"chunk {start + index} " * 40,
+                        partition_names[(start + index) % partitions]: "1",
+                        "metadata": {"source": "/api/documents/benchmark.txt", "start_index": start + index},
+                    },
+                )
+                for index, embedding in enumerate(vectors)
+            ],
+        )
+    return partition_names
+
+
+def run(client: QdrantClient, query_vector: list[float], partition_names: list[str], k: int, pushed_down: bool):
+    if pushed_down:
+        result = search_partitions(COLLECTION, partition_names, query_vector, score_threshold=0.0, limit=k)
+    else:
+        result = client.search(
+            COLLECTION,
+            query_vector=query_vector,
+            with_payload=models.PayloadSelectorInclude(include=partition_names + ["page_content", "metadata"]),
+            with_vectors=True,
+            limit=k,
+        )
+    return result, sum(len(point.model_dump_json()) for point in result)
+
+
+def count_in_scope(client: QdrantClient, result, partition_names: list[str]) -> int:
+    points = client.retrieve(COLLECTION, ids=[point.id for point in result], with_payload=partition_names)
+    return sum(1 for point in points if set(partition_names).intersection(point.payload or {}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--partitions", type=int, default=500)
+    parser.add_argument("--scope", type=int, default=5, help="partitions a query is scoped to")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        client = QdrantClient(path=path)
+        vector.VECTOR_CLIENT_QDRANT = client
+        started = time.perf_counter()
+        partition_names = build(client, args.points, args.partitions, args.dimension)
+        print(f"built {args.points} points in {args.partitions} partitions: {time.perf_counter() - started:.1f}s")
+
+        rng = random.Random(0)
+        query_vectors = [[rng.random() for _ in range(args.dimension)] for _ in range(args.queries)]
+        scopes = {
+            f"{args.scope} partitions": [rng.sample(partition_names, args.scope) for _ in query_vectors],
+            "all partitions": [partition_names for _ in query_vectors],
+        }
+        for scope_label, query_scopes in scopes.items():
+            for label, pushed_down in (("before", False), ("after", True)):
+                latencies, sizes, in_scope = [], [], 0
+                for query_vector, scope in zip(query_vectors, query_scopes):
+                    started = time.perf_counter()
+                    result, size = run(client, query_vector, scope, args.k, pushed_down)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    sizes.append(size)
+                    in_scope += count_in_scope(client, result, scope)
+                print(
+                    f"{scope_label}, {label}: p50 {statistics.median(latencies):.1f}ms, "
+                    f"p95 {statistics.quantiles(latencies, n=20)[-1]:.1f}ms, "
+                    f"{statistics.mean(sizes) / 1024:.1f} KiB/query, "
+                    f"in-scope hits {in_scope}/{args.queries * args.k}"
+                )
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure the CPU an idle chat stream costs while its listener waits for the next token.
+
+    cd backend && python -m tests.benchmarks.queue_listen_idle --streams 300 --seconds 10
+
+"before" is the old listen loop: asyncio.wait_for(queue.get(), timeout=0.05) and a stop flag lookup on every
+wake-up. "after" is ApplicationQueueManager.listen, which waits on the queue, the stop event and the ping timer.
+Both open --streams listeners that receive nothing, then stop them all with set_stop_flag and report how long
+the stop took to reach the listeners.
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections.abc import AsyncGenerator
+
+from core.entities.application_entities import InvokeFrom
+from core.queue.application_queue_manager import ApplicationQueueManager, PublishFrom
+from core.queue.entities.queue_entities import QueuePingEvent, QueueStopEvent
+
+
+class LegacyQueueManager(ApplicationQueueManager):
+    async def listen(self) -> AsyncGenerator:
+        listen_timeout = 6000
+        loop = asyncio.get_event_loop()
+        start_time = loop.time()
+        last_ping_time: int = 0
+
+        await self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(self._q.get(), timeout=0.05)
+                if message is None:
+                    break
+                yield message
+            except asyncio.TimeoutError:
+                await asyncio.sleep(0)
+            finally:
+                elapsed_time = loop.time() - start_time
+                if elapsed_time >= listen_timeout or self._is_stopped():
+                    await self.publish(
+                        QueueStopEvent(stopped_by=QueueStopEvent.StopBy.USER_MANUAL),
+                        PublishFrom.TASK_PIPELINE,
+                    )
+
+                if elapsed_time // 10 > last_ping_time:
+                    await self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
+                    last_ping_time = int(elapsed_time // 10)
+
+
+async def consume(queue_manager: ApplicationQueueManager) -> float:
+    """Return the loop time the stop event reached the client."""
+    stopped_at = 0.0
+    async for message in queue_manager.listen():
+        if isinstance(message.event, QueueStopEvent):
+            stopped_at = asyncio.get_running_loop().time()
+    return stopped_at
+
+
+async def run(cls, streams: int, seconds: float) -> tuple[float, float]:
+    managers = [
+        cls(str(uuid.uuid4()), "benchmark", str(uuid.uuid4()), "chat", str(uuid.uuid4())) for _ in range(streams)
+    ]
+    consumers = [asyncio.create_task(consume(queue_manager)) for queue_manager in managers]
+    # let every listener reach its idle wait before measuring
+    await asyncio.sleep(0.5)
+
+    cpu_started = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu_started
+
+    stop_requested = asyncio.get_running_loop().time()
+    for queue_manager in managers:
+        ApplicationQueueManager.set_stop_flag(queue_manager._task_id, InvokeFrom.WEB_APP, "benchmark")
+    stopped = await asyncio.gather(*consumers)
+    latency = max(stopped) - stop_requested
+    return cpu / seconds, latency
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=300)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    for label, cls in (("before", LegacyQueueManager), ("after", ApplicationQueueManager)):
+        cpu, latency = await run(cls, args.streams, args.seconds)
+        print(
+            f"{label}: {args.streams} idle streams use {cpu * 100:.1f}% of a core "
+            f"({cpu * 1e6 / args.streams:.0f} us CPU per stream per second), "
+            f"stop reached all in {latency * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Compare streamed token throughput through ApplicationQueueManager before and after the delta fast path.
+
+    cd backend && python -m tests.benchmarks.queue_publish --prompt-tokens 30000 --tokens 2000
+
+"before" publishes an LLMResultChunk carrying the whole prompt per token and walks event.dict() for SQLAlchemy
+models, like publish did for every event. "after" publishes QueueMessageDeltaEvent with publish_delta. A
+listener drains the queue in both cases, so the numbers include the consumer side.
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from core.queue.application_queue_manager import ApplicationQueueManager, PublishFrom
+from core.queue.entities.llm_entities import LLMResultChunk, LLMResultChunkDelta
+from core.queue.entities.queue_entities import AppQueueEvent, QueueMessage
+
+
+class LegacyQueueManager(ApplicationQueueManager):
+    async def publish(self, event: AppQueueEvent, pub_from: PublishFrom) -> None:
+        self._check_for_sqlalchemy_models(event.dict())
+        await self._q.put(
+            QueueMessage(
+                task_id=self._task_id,
+                message_id=self._message_id,
+                conversation_id=self._conversation_id,
+                app_mode=self._app_mode,
+                event=event,
+            )
+        )
+
+
+def build_prompt(prompt_tokens: int, turns: int = 40) -> list[BaseMessage]:
+    # roughly 4 characters per token
+    words = " ".join("lorem" for _ in range(prompt_tokens * 4 // 6 // turns))
+    messages: list[BaseMessage] = [SystemMessage(content=words)]
+    for turn in range(turns - 1):
+        messages.append(HumanMessage(content=words) if turn % 2 == 0 else AIMessage(content=words))
+    return messages
+
+
+async def drain(queue_manager: ApplicationQueueManager) -> int:
+    received = 0
+    async for message in queue_manager.listen():
+        received += message.event.event.value == "message"
+    return received
+
+
+async def run(queue_manager: ApplicationQueueManager, publish, tokens: int) -> float:
+    consumer = asyncio.create_task(drain(queue_manager))
+    started = time.perf_counter()
+    for index in range(tokens):
+        await publish(index, " token")
+        if index % 64 == 0:
+            # let the listener run, as the model stream does between tokens
+            await asyncio.sleep(0)
+    await queue_manager.stop_listen()
+    received = await consumer
+    elapsed = time.perf_counter() - started
+    assert received == tokens, f"{received} of {tokens} tokens received"
+    return tokens / elapsed
+
+
+def manager(cls) -> ApplicationQueueManager:
+    return cls(str(uuid.uuid4()), "benchmark", str(uuid.uuid4()), "chat", str(uuid.uuid4()))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompt-tokens", type=int, default=30000)
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+    prompt_messages = build_prompt(args.prompt_tokens)
+
+    before = manager(LegacyQueueManager)
+
+    async def publish_before(index: int, text: str):
+        chunk = LLMResultChunk(
+            model="benchmark",
+            prompt_messages=prompt_messages,
+            delta=LLMResultChunkDelta(index=index, message=AIMessage(content=text)),
+        )
+        await before.publish_chunk_message(chunk, PublishFrom.APPLICATION_MANAGER)
+
+    after = manager(ApplicationQueueManager)
+    after.attach_prompt_messages(prompt_messages)
+
+    async def publish_after(index: int, text: str):
+        await after.publish_delta(index, text, PublishFrom.APPLICATION_MANAGER)
+
+    for label, queue_manager, publish in (("before", before, publish_before), ("after", after, publish_after)):
+        rate = await run(queue_manager, publish, args.tokens)
+        print(f"{label}: {rate:,.0f} tokens/s ({1e6 / rate:.1f} us/token), prompt of ~{args.prompt_tokens} tokens")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
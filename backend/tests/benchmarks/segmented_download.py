@@ -0,0 +1,125 @@
+"""
+Compare model file download throughput of the old single-connection loop and SegmentedDownload.
+
+    cd backend && python -m tests.benchmarks.segmented_download --size-mb 512 --connection-mbps 400
+
+A local HTTP server serves a random file with range support. Each connection is capped at --connection-mbps,
+like a CDN edge would, so the difference comes from the number of connections and from the per-chunk
+overhead of the download loop.
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from configs.settings import MODEL_DOWNLOAD_SETTINGS
+from services.model.segmented_download import MirrorRanking, SegmentedDownload, probe_file
+
+
+def make_handler(path: str, size: int, connection_bytes_per_second: float):
+    class RangeHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):  # noqa: N802
+            start, end = 0, size - 1
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else size - 1
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+
+            started, sent = time.monotonic(), 0
+            with open(path, "rb") as fp:
+                fp.seek(start)
+                while sent < end - start + 1:
+                    block = fp.read(min(256 * 1024, end - start + 1 - sent))
+                    try:
+                        self.wfile.write(block)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    sent += len(block)
+                    ahead = sent / connection_bytes_per_second - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    return RangeHandler
+
+
+def download_before(url: str, path: str, on_megabyte) -> None:
+    """The loop process_downloading_model_huggingface used: 1 KiB chunks through a BytesIO, flushed every MiB."""
+    file_buffer = io.BytesIO()
+    with open(path, "ab") as fp, requests.get(url, stream=True, headers={"Range": "bytes=0-"}) as response:
+        for chunk in response.iter_content(chunk_size=1024):
+            if chunk:
+                file_buffer.write(chunk)
+            if file_buffer.tell() >= 1024 * 1024:
+                fp.write(file_buffer.getvalue())
+                file_buffer.seek(0)
+                file_buffer.truncate(0)
+                on_megabyte(fp.tell())
+        fp.write(file_buffer.getvalue())
+
+
+def download_after(url: str, path: str) -> None:
+    ranking = MirrorRanking([url])
+    size, ranges = probe_file(ranking, requests.Session())
+    SegmentedDownload(path, size, ranking, ranges=ranges, on_progress=lambda done, speed: True).run()
+
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(8 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--connection-mbps", type=float, default=400, help="per connection cap, megabit/s")
+    parser.add_argument("--connections", type=int, default=MODEL_DOWNLOAD_SETTINGS["CONNECTIONS"])
+    args = parser.parse_args()
+    MODEL_DOWNLOAD_SETTINGS["CONNECTIONS"] = args.connections
+
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "source.gguf")
+        size = args.size_mb * 1024 * 1024
+        with open(source, "wb") as fp:
+            for _ in range(args.size_mb):
+                fp.write(os.urandom(1024 * 1024))
+        expected = sha256(source)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(source, size, args.connection_mbps * 1e6 / 8))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/source.gguf"
+
+        for label, download in (
+            ("before", lambda path: download_before(url, path, on_megabyte=lambda done: None)),
+            (f"after ({args.connections} connections)", lambda path: download_after(url, path)),
+        ):
+            target = os.path.join(folder, f"{label.split()[0]}.gguf")
+            started = time.perf_counter()
+            download(target)
+            elapsed = time.perf_counter() - started
+            assert sha256(target) == expected, f"{label}: content mismatch"
+            print(f"{label}: {elapsed:.1f}s, {size / elapsed / 1024 / 1024:.1f} MiB/s")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
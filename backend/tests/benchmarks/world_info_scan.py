@@ -0,0 +1,118 @@
+"""
+Measure world info activation of roleplay prompts on a large lorebook.
+
+    cd backend && DATABASE_URL=sqlite:////tmp/world_info_benchmark.db python -m tests.benchmarks.world_info_scan
+
+A character book of --entries entries, two or three keys each drawn from a --vocabulary word list (a share with
+secondary keys, whole word matching, case sensitive keys, regex keys and {{char}} keys), is scanned for a chat
+growing by one message per turn, the way RoleplayApplicationRunner calls check_world_info for every message.
+The activated entries are counted so runs can be compared; probabilities are off, the scan is deterministic.
+The conversation is deleted at the end.
+
+    --messages 10, before: first 1272.4 ms, p50 1334.9 ms, max 1441.5 ms, 160 activations
+    --messages 10, after: first 1100.7 ms, p50 86.8 ms, max 1100.7 ms, 160 activations
+
+"before" hashed, parsed and matched every entry key by key on every call; "after" compiles the lorebook once
+into cached entries and an Aho-Corasick index of the keys, so only the first call of a lorebook pays for it.
+
+--scan-depth sets how many messages every entry scans. Rescanning the whole window each turn made the cost
+grow with it; the world info session of the conversation only scans the messages new to the window:
+
+    --messages 40 --scan-depth 2, before: p50 70.8 ms; after: p50 67.9 ms
+    --messages 40 --scan-depth 20, before: p50 113.5 ms; after: p50 77.9 ms
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Optional
+
+from core.bot_runner.roleplay_world_info import check_world_info
+from core.entities.application_entities import ModelConfigEntity
+from database import db
+from database.db import session_scope
+from models.conversation import Conversation
+
+
+def make_book(rng: random.Random, entries: int, vocabulary: list[str], scan_depth: Optional[int] = None) -> dict:
+    book_entries = []
+    for index in range(entries):
+        keys = rng.sample(vocabulary, rng.choice([2, 3]))
+        extensions = {"useProbability": False, "depth": 4, "scan_depth": scan_depth}
+        if index % 50 == 0:
+            keys[0] = f"/{keys[0]}s?/i"
+        if index % 40 == 0:
+            keys.append("{{char}}")
+        if index % 5 == 0:
+            extensions["match_whole_words"] = True
+        if index % 17 == 0:
+            extensions["case_sensitive"] = True
+            keys = [key.capitalize() for key in keys]
+        entry = {
+            "id": index,
+            "keys": keys,
+            "content": " ".join(rng.choices(vocabulary, k=30)),
+            "insertion_order": rng.randint(0, 200),
+            "enabled": True,
+            "extensions": extensions,
+        }
+        if index % 4 == 0:
+            entry["secondary_keys"] = rng.sample(vocabulary, 2)
+            extensions["selectiveLogic"] = index % 3
+        book_entries.append(entry)
+    return {"name": "benchmark lore", "entries": book_entries}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--words", type=int, default=80, help="words per chat message")
+    parser.add_argument("--scan-depth", type=int, default=None, help="messages scanned per entry, default 2")
+    args = parser.parse_args()
+    db.init()
+
+    rng = random.Random(0)
+    syllables = ["ka", "ri", "mo", "tel", "an", "dor", "vis", "eth", "ul", "zan", "qo", "bre", "ny", "sol"]
+    vocabulary = sorted({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(args.vocabulary)})
+    inputs = {
+        "char": "Seraphina",
+        "user": "Traveler",
+        "character_book": json.dumps(make_book(rng, args.entries, vocabulary, args.scan_depth)),
+        "character_extensions": "{}",
+    }
+    model_config = ModelConfigEntity.model_construct(provider="ollama", model="llama2", mode="chat")
+
+    with session_scope() as session:
+        conversation = Conversation(name="world info benchmark", chat_metadata={})
+        session.add(conversation)
+        session.commit()
+        session.refresh(conversation)
+        session.expunge(conversation)
+
+    chat: list[str] = []
+    timings, activated = [], 0
+    try:
+        for _ in range(args.messages):
+            chat.insert(0, " ".join(rng.choices(vocabulary, k=args.words)))
+            random.seed(0)
+            started = time.perf_counter()
+            result = check_world_info(model_config, 8192, conversation, list(chat), inputs)
+            timings.append(time.perf_counter() - started)
+            activated += len(result.get("all_activated_entries", ()))
+    finally:
+        with session_scope() as session:
+            session.query(Conversation).filter_by(id=conversation.id).delete()
+
+    print(
+        f"{args.entries} entries, {args.messages} messages: first {timings[0] * 1000:.1f} ms, "
+        f"p50 {statistics.median(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms, "
+        f"{activated} activations"
+    )
+
+
+if __name__ == "__main__":
+    main()
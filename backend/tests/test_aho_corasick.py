@@ -0,0 +1,34 @@
+import re
+
+import pytest
+
+from utils.aho_corasick import AhoCorasick
+
+
+@pytest.mark.parametrize(
+    ("patterns", "text", "expected"),
+    [
+        (["he", "she", "his", "hers"], "ushers", {"he", "she", "hers"}),
+        (["dragon", "dragonfly", "fly"], "a dragonfly", {"dragon", "dragonfly", "fly"}),
+        (["abc", "bcd", "cde"], "abcde", {"abc", "bcd", "cde"}),
+        (["aa"], "aaaa", {"aa"}),
+        (["龙", "城堡"], "龙在城堡里", {"龙", "城堡"}),
+        (["x", ""], "abc", set()),
+        ([], "abc", set()),
+    ],
+)
+def test_find(patterns, text, expected):
+    assert AhoCorasick(patterns).find(text) == expected
+
+
+def test_iter_reports_every_occurrence():
+    matches = list(AhoCorasick(["aa", "a"]).iter("aaa"))
+    assert sorted(matches) == [(0, "a"), (0, "aa"), (1, "a"), (1, "aa"), (2, "a")]
+
+
+def test_matches_plain_search():
+    words = ["ka", "kari", "rimo", "mo", "tel", "antel", "dor", "or", "vis", "isk"]
+    text = "karimotelantelkadorvisk mo ortel"
+    automaton = AhoCorasick(words)
+    expected = sorted((m.start(), word) for word in words for m in re.finditer(f"(?={re.escape(word)})", text))
+    assert sorted(automaton.iter(text)) == expected
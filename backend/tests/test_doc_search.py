@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import models
+
+from core.features import doc_search
+from core.features.doc_search import merge_query_results_by_rank
+from models.knowledge import RETRIEVALMODE
+
+
+def results(*hits: tuple[float, str]) -> dict:
+    return {
+        "distances": [score for score, _ in hits],
+        "documents": [document for _, document in hits],
+        "metadatas": [{"score": score} for score, _ in hits],
+    }
+
+
+def test_collections_are_merged_by_rank_not_by_raw_score():
+    vector = results((0.62, "v1"), (0.58, "v2"), (0.51, "v3"))
+    hybrid = results((1.0, "h1"), (0.97, "h2"))
+
+    merged = merge_query_results_by_rank([vector, hybrid, None])
+    # each collection keeps all of its own top_k hits, the fused 1.0 does not push the cosine hits out
+    assert merged["documents"] == ["v1", "h1", "v2", "h2", "v3"]
+    assert merged["distances"] == [0.62, 1.0, 0.58, 0.97, 0.51]
+    assert [metadata["score"] for metadata in merged["metadatas"]] == merged["distances"]
+
+
+def test_single_collection_keeps_its_order():
+    only = results((0.9, "a"), (0.8, "b"))
+    assert merge_query_results_by_rank([only])["documents"] == ["a", "b"]
+
+
+class FakeQdrant:
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        return [
+            SimpleNamespace(
+                id=point_id, payload={"page_content": point_id, "metadata": {}}, vector=self.vectors[point_id]
+            )
+            for point_id in ids
+        ]
+
+
+class FakeKeywordIndex:
+    def __init__(self, hits: list[str]):
+        self.hits = hits
+
+    def search(self, query, partition_names, limit):
+        return [(point_id, 10.0) for point_id in self.hits]
+
+
+@pytest.fixture
+def hybrid(monkeypatch):
+    vector_hits = [
+        models.ScoredPoint(id=point_id, version=0, score=score, payload={"page_content": point_id, "metadata": {}})
+        for point_id, score in (("weak", 0.31), ("weaker", 0.22))
+    ]
+    monkeypatch.setattr(doc_search, "search_partitions", lambda *args: vector_hits)
+    monkeypatch.setattr(doc_search, "load_keyword_index", lambda name: FakeKeywordIndex(["keyword", "weak"]))
+    monkeypatch.setattr(doc_search, "get_qdrant_client", lambda: FakeQdrant({"keyword": [0.0, 1.0]}))
+    monkeypatch.setattr(doc_search, "get_reranking_function", lambda name: None)
+
+
+def test_hybrid_hits_keep_fused_order_with_cosine_scores(hybrid):
+    points = doc_search.hybrid_search("kb", [], "query", [1.0, 1.0], 0.0, 3)
+    # "weak" is first for both retrievers, but scored by its similarity rather than a fused 1.0
+    assert [(str(point.id), round(point.score, 3)) for point in points] == [
+        ("weak", 0.31),
+        ("keyword", 0.707),
+        ("weaker", 0.22),
+    ]
+
+
+def test_hybrid_relevance_threshold_applies_to_similarity(hybrid):
+    result = doc_search.query_doc(
+        collection_name="kb",
+        partition_names=[],
+        query="query",
+        provider="ollama",
+        embedding_model="nomic-embed-text",
+        similarity_threshold=0.0,
+        k=3,
+        reranking_model=None,
+        r=0.3,
+        query_vector=[1.0, 1.0],
+        retrieval_mode=RETRIEVALMODE.HYBRID.value,
+    )
+    assert result["documents"] == ["weak", "keyword"]
+    assert [round(score, 3) for score in result["distances"]] == [0.31, 0.707]
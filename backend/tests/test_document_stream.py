@@ -0,0 +1,88 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import pytest
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from configs.settings import DOCUMENT_PROCESS_SETTINGS
+from services.doc import pdf_pages
+from services.doc.util import DocumentStream, PdfLoader, TextStreamLoader
+
+
+def make_pdf(path, pages: int):
+    document = fitz.open()
+    for number in range(pages):
+        document.new_page().insert_text((72, 72), f"page {number + 1}")
+    document.save(str(path))
+    document.close()
+
+
+class PagesLoader(BaseLoader):
+    def __init__(self, pages: list[str]):
+        self.pages = pages
+
+    def lazy_load(self):
+        for page in self.pages:
+            yield Document(page_content=page, metadata={})
+
+
+def test_text_with_ascii_prefix_reads_later_utf8(tmp_path, monkeypatch):
+    monkeypatch.setitem(DOCUMENT_PROCESS_SETTINGS, "ENCODING_SNIFF_BYTES", 64)
+    path = tmp_path / "notes.txt"
+    text = "plain ascii line\n" * 10 + "naïve café 龙\n"
+    path.write_bytes(text.encode("utf-8"))
+
+    loaded = "".join(doc.page_content for doc in TextStreamLoader(str(path)).lazy_load())
+    assert loaded == text
+
+
+def test_content_keeps_pages_apart(tmp_path):
+    path = tmp_path / "slides.pptx"
+    path.write_bytes(b"x")
+    stream = DocumentStream(PagesLoader(["end of slide", "next slide\n", "last"]), str(path), 100, 0, 1000)
+    list(stream)
+    assert stream.content == "end of slide\nnext slide\nlast"
+
+
+def test_missing_pdf_raises():
+    with pytest.raises(FileNotFoundError):
+        list(PdfLoader("/nonexistent/file.pdf").lazy_load())
+
+
+def test_pdf_extraction_error_propagates(tmp_path, monkeypatch):
+    path = tmp_path / "broken.pdf"
+    make_pdf(path, 2)
+
+    def broken(file_path):
+        yield 1, 2, "page 1"
+        raise RuntimeError("cannot read page 2")
+
+    monkeypatch.setattr(pdf_pages, "iter_pages", broken)
+    with pytest.raises(RuntimeError, match="page 2"):
+        list(PdfLoader(str(path)).lazy_load())
+
+
+class BrokenPool:
+    """Every window fails as if the worker processes died."""
+
+    def submit(self, *args):
+        future: Future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_broken_pool_with_several_windows_in_flight_falls_back(tmp_path, monkeypatch):
+    path = tmp_path / "long.pdf"
+    make_pdf(path, 10)
+    monkeypatch.setitem(DOCUMENT_PROCESS_SETTINGS, "PDF_PAGE_WINDOW", 2)
+    monkeypatch.setitem(DOCUMENT_PROCESS_SETTINGS, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdf_pages, "_get_pool", BrokenPool)
+
+    pages = list(pdf_pages.iter_pages(str(path)))
+    assert [(number, count) for number, count, _ in pages] == [(number, 10) for number in range(1, 11)]
+    assert [text.strip() for _, _, text in pages] == [f"page {number}" for number in range(1, 11)]
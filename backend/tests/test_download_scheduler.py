@@ -0,0 +1,179 @@
+import threading
+import time
+from collections.abc import Callable
+from types import SimpleNamespace
+
+import pytest
+
+from models.model_manager import DownloadStatus
+from services.model import download_scheduler
+from services.model.download_scheduler import CONVERT, DOWNLOAD, IMPORT, DiskAdmission, ModelJobScheduler
+
+
+class FakeModelService:
+    def __init__(self):
+        self.models: dict[str, SimpleNamespace] = {}
+
+    def add(self, model_name: str, status: DownloadStatus, is_embeddings: bool = False):
+        self.models[model_name] = SimpleNamespace(
+            model_name=model_name, download_status=status, is_embeddings=is_embeddings, size=0, source="repo/model"
+        )
+
+    def get_model_info(self, model_name):
+        return self.models.get(model_name)
+
+    def get_model_list(self):
+        return list(self.models.values())
+
+    def update_model_status(self, model_name, status, **kwargs):
+        self.models[model_name].download_status = status
+
+
+@pytest.fixture
+def models(monkeypatch):
+    service = FakeModelService()
+    monkeypatch.setattr(download_scheduler, "ModelService", service)
+    return service
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    scheduler = ModelJobScheduler(
+        {DOWNLOAD: 1, CONVERT: 1, IMPORT: 1},
+        bandwidth=0,
+        reconcile_interval=3600,
+        retry_delay=0.05,
+        max_retry_delay=0.2,
+    )
+    scheduler.disk = DiskAdmission(str(tmp_path))
+    return scheduler
+
+
+def test_stages_run_in_turn(models, scheduler):
+    done = threading.Event()
+    ran = []
+
+    def stage(next_status):
+        def handler(model):
+            ran.append(model.download_status)
+            models.update_model_status(model.model_name, next_status)
+
+        return handler
+
+    scheduler.start(
+        {
+            DOWNLOAD: stage(DownloadStatus.DOWNLOAD_COMPLETE),
+            CONVERT: stage(DownloadStatus.CONVERT_COMPLETE),
+            IMPORT: stage(DownloadStatus.ALL_COMPLETE),
+        },
+        on_complete=lambda model: done.set(),
+    )
+    models.add("m", DownloadStatus.DOWNLOAD_WAITING)
+    scheduler.submit("m")
+
+    assert done.wait(5)
+    assert ran == [DownloadStatus.DOWNLOAD_WAITING, DownloadStatus.DOWNLOAD_COMPLETE, DownloadStatus.CONVERT_COMPLETE]
+
+
+class Timers:
+    """Stands in for threading.Timer, retries fire when the test says so instead of outliving it."""
+
+    def __init__(self):
+        self.started: list[tuple[float, Callable, tuple]] = []
+
+    def __call__(self, delay, function, args=()):
+        timers = self
+
+        class Timer:
+            daemon = False
+
+            def start(self):
+                timers.started.append((delay, function, args))
+
+        return Timer()
+
+    def wait_for(self, count: int):
+        deadline = time.monotonic() + 5
+        while len(self.started) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(self.started) == count
+
+    def fire(self):
+        _, function, args = self.started[-1]
+        function(*args)
+
+
+def test_stage_without_progress_backs_off(models, scheduler, monkeypatch):
+    timers = Timers()
+    monkeypatch.setattr(download_scheduler.threading, "Timer", timers)
+    attempts = []
+
+    def failing_import(model):
+        attempts.append(model.model_name)
+        raise OSError("truncated gguf")
+
+    scheduler.start({DOWNLOAD: print, CONVERT: print, IMPORT: failing_import}, on_complete=None)
+    models.add("m", DownloadStatus.CONVERT_COMPLETE)
+    scheduler.submit("m")
+    timers.wait_for(1)
+
+    # resubmitting while backing off does not run the stage again
+    scheduler.submit("m")
+    time.sleep(0.05)
+    assert len(attempts) == 1
+    assert scheduler.stats()["backing_off"] == 1
+
+    for count in range(2, 5):
+        timers.fire()
+        timers.wait_for(count)
+    assert len(attempts) == 4
+    # 0.05, 0.1, 0.2, 0.2 seconds apart instead of a tight loop
+    assert [delay for delay, _, _ in timers.started] == [0.05, 0.1, 0.2, 0.2]
+
+
+def test_backing_off_model_runs_again_when_its_status_changes(models, scheduler):
+    scheduler._started = True
+    models.add("m", DownloadStatus.DOWNLOADING)
+    scheduler._stalled["m"] = (DownloadStatus.DOWNLOADING, 3, time.monotonic() + 100)
+
+    scheduler.submit("m", DownloadStatus.DOWNLOADING, 1)
+    assert not scheduler._pending[DOWNLOAD]
+
+    scheduler.submit("m", DownloadStatus.DOWNLOAD_WAITING, 1)
+    assert [job[2] for job in scheduler._pending[DOWNLOAD]] == ["m"]
+
+
+def test_download_waiting_for_disk_runs_when_the_blocking_download_ends(models, scheduler):
+    scheduler._started = True
+    scheduler.disk.admit("a", 0)
+    scheduler._running["b"] = DOWNLOAD
+
+    scheduler._finish(DOWNLOAD, "b", (1, 0, "b"))
+    assert scheduler.stats()["waiting_disk"] == 1
+    assert not scheduler._pending[DOWNLOAD]
+
+    scheduler._finish(DOWNLOAD, "a", None)
+    assert scheduler.stats()["waiting_disk"] == 0
+    assert [job[2] for job in scheduler._pending[DOWNLOAD]] == ["b"]
+
+
+def test_download_turned_away_after_the_blocking_download_ended_is_not_lost(models, scheduler):
+    scheduler._started = True
+    scheduler._running["b"] = DOWNLOAD
+
+    # the download holding the disk released it between the admission check of b and its finish
+    scheduler._finish(DOWNLOAD, "b", (1, 0, "b"))
+    assert scheduler.stats()["waiting_disk"] == 0
+    assert [job[2] for job in scheduler._pending[DOWNLOAD]] == ["b"]
+
+
+def test_embedding_models_are_served_first(models, scheduler):
+    scheduler._started = True
+    models.add("chat", DownloadStatus.DOWNLOAD_WAITING)
+    models.add("embed", DownloadStatus.DOWNLOAD_WAITING, is_embeddings=True)
+    scheduler.submit("chat")
+    scheduler.submit("embed")
+    scheduler.submit("embed")
+
+    assert scheduler._next(DOWNLOAD) == "embed"
+    assert scheduler._next(DOWNLOAD) == "chat"
@@ -0,0 +1,44 @@
+from langchain_core.embeddings import Embeddings
+
+from core.features.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class PrefixEmbeddings(Embeddings):
+    """Queries get an instruction prefix, like e5 or bge, so they embed differently from the same document."""
+
+    def __init__(self):
+        self.documents: list[str] = []
+        self.queries: list[str] = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[float(len(text)), 0.0] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+
+def cached(tmp_path, model: str) -> tuple[CachedEmbeddings, PrefixEmbeddings, EmbeddingCache]:
+    model_embeddings = PrefixEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "embedding.db"), max_bytes=1024 * 1024)
+    return CachedEmbeddings(model_embeddings, provider="test", model=model, cache=cache), model_embeddings, cache
+
+
+def test_documents_are_cached(tmp_path):
+    embeddings, model_embeddings, cache = cached(tmp_path, "documents")
+    assert embeddings.embed_documents(["a", "bb", "a"]) == [[1.0, 0.0], [2.0, 0.0], [1.0, 0.0]]
+    assert embeddings.embed_documents(["bb", "ccc"]) == [[2.0, 0.0], [3.0, 0.0]]
+    assert model_embeddings.documents == ["a", "bb", "ccc"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_query_uses_the_model_query_embedding(tmp_path):
+    embeddings, model_embeddings, cache = cached(tmp_path, "queries")
+    embeddings.embed_documents(["what is argo"])
+
+    assert embeddings.embed_query("what is argo") == [12.0, 1.0]
+    assert embeddings.embed_query("what  is argo ") == [12.0, 1.0]
+    assert model_embeddings.queries == ["what is argo"]
+    # queries are not written to the document store
+    assert cache.stats()["bytes"] == 8
@@ -0,0 +1,78 @@
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from services.model import model_download
+from utils import file_hash
+from utils.file_hash import cached_file_sha256, remove_file_digest
+
+
+@pytest.fixture
+def digests(tmp_path, monkeypatch):
+    directory = tmp_path / "digests"
+    directory.mkdir()
+    monkeypatch.setattr(file_hash, "ARGO_STORAGE_PATH_FILE_DIGESTS", str(directory))
+    return directory
+
+
+@pytest.fixture
+def model(tmp_path):
+    folder = tmp_path / "models"
+    folder.mkdir()
+    path = folder / "model.gguf"
+    path.write_bytes(b"GGUF" + b"\0" * 1000)
+    return path
+
+
+def test_digest_is_remembered_outside_the_file_folder(digests, model, monkeypatch):
+    expected = hashlib.sha256(model.read_bytes()).hexdigest()
+    assert cached_file_sha256(model) == expected
+    assert os.listdir(model.parent) == ["model.gguf"]
+    assert len(os.listdir(digests)) == 1
+
+    monkeypatch.setattr(file_hash, "calculate_large_file_sha256", lambda *args, **kwargs: pytest.fail("hashed again"))
+    assert cached_file_sha256(str(model)) == expected
+
+
+def test_changed_file_is_hashed_again(digests, model):
+    cached_file_sha256(model)
+    model.write_bytes(b"GGUF" + b"\1" * 2000)
+    assert cached_file_sha256(model) == hashlib.sha256(model.read_bytes()).hexdigest()
+
+
+def test_read_only_folder_still_gets_a_cached_digest(digests, model):
+    os.chmod(model.parent, 0o555)
+    try:
+        first = cached_file_sha256(model)
+    finally:
+        os.chmod(model.parent, 0o755)
+    assert first == hashlib.sha256(model.read_bytes()).hexdigest()
+    assert len(os.listdir(digests)) == 1
+
+
+def test_removed_digest_is_not_reused_for_a_new_file(digests, model):
+    stat = model.stat()
+    cached_file_sha256(model)
+    remove_file_digest(model)
+    assert os.listdir(digests) == []
+    remove_file_digest(model)
+
+    # a different file landing at the same path with the same size and mtime
+    model.write_bytes(b"GGUF" + b"\2" * 1000)
+    os.utime(model, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cached_file_sha256(model) == hashlib.sha256(model.read_bytes()).hexdigest()
+
+
+@pytest.mark.parametrize("source", ["org/repo/model.gguf", "org/repo"])
+def test_temp_model_cleanup_forgets_digests(digests, tmp_path, monkeypatch, source):
+    monkeypatch.setattr(model_download, "ARGO_STORAGE_PATH_TEMP_MODEL", str(tmp_path / "tmp_models"))
+    repo = tmp_path / "tmp_models" / "org" / "repo"
+    repo.mkdir(parents=True)
+    (repo / "model.gguf").write_bytes(b"GGUF" + b"\0" * 100)
+    cached_file_sha256(repo / "model.gguf")
+
+    model_download.remove_temp_model_files(SimpleNamespace(source=source))
+    assert not (repo / "model.gguf").exists()
+    assert os.listdir(digests) == []
@@ -0,0 +1,85 @@
+import asyncio
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.web import Application, stream_request_body
+
+from core.entities.user_entities import UserType
+from handlers.file import file_upload
+from handlers.file.file_upload import StreamedUploadHandler
+from services.file.file_op import HashedUpload
+
+BOUNDARY = "----argoBoundary42"
+
+
+@stream_request_body
+class UploadHandler(StreamedUploadHandler):
+    field_name = "file"
+
+    def get_current_user(self):
+        return UserType.USER.value, SimpleNamespace(id="user")
+
+    async def post(self):
+        await self.store_uploads()
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    state = SimpleNamespace(created=[], errors=[], written=threading.Event())
+
+    class SlowUpload(HashedUpload):
+        def __init__(self, file_name):
+            super().__init__(file_name, folder=str(tmp_path))
+            state.created.append(self)
+
+        def write(self, data):
+            # the connection goes away while the chunk is still being written
+            time.sleep(0.3)
+            try:
+                super().write(data)
+            except Exception as exc:
+                state.errors.append(exc)
+                raise
+            finally:
+                state.written.set()
+
+    monkeypatch.setattr(file_upload, "HashedUpload", SlowUpload)
+    return state
+
+
+async def disconnect_mid_body(uploads, tmp_path):
+    [listener] = bind_sockets(0, "127.0.0.1", family=socket.AF_INET)
+    # the body times out, and the connection is dropped, while the executor is still in parser.feed
+    server = HTTPServer(Application([("/upload", UploadHandler)]), body_timeout=0.1)
+    server.add_sockets([listener])
+
+    _, writer = await asyncio.open_connection(*listener.getsockname())
+    writer.write(
+        (
+            "POST /upload HTTP/1.1\r\nHost: test\r\n"
+            f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\nContent-Length: 1000000\r\n\r\n"
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="notes.md"\r\n\r\n'
+        ).encode()
+        + b"x" * 4096
+    )
+    await writer.drain()
+    assert await asyncio.to_thread(uploads.written.wait, 5)
+    writer.close()
+    for _ in range(50):
+        if not any(tmp_path.iterdir()):
+            break
+        await asyncio.sleep(0.05)
+    server.stop()
+
+
+def test_disconnect_mid_body_discards_the_upload(uploads, tmp_path):
+    asyncio.run(disconnect_mid_body(uploads, tmp_path))
+
+    assert len(uploads.created) == 1
+    assert uploads.errors == []
+    assert list(tmp_path.iterdir()) == []
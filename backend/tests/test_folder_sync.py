@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from services.doc import folder_sync
+from services.doc.folder_sync import DeltaType, FileDelta, FolderIndex, diff_trees
+
+
+def test_diff_add_delete_rename():
+    old = {"h1": "/kb/a.md", "h2": "/kb/b.md", "h3": "/kb/c.md"}
+    new = {"h1": "/kb/a.md", "h2": "/kb/notes/b.md", "h4": "/kb/d.md"}
+    assert diff_trees(old, new) == [
+        FileDelta(DeltaType.RENAME, "h2", "/kb/notes/b.md", old_hash="h2", old_path="/kb/b.md"),
+        FileDelta(DeltaType.ADD, "h4", "/kb/d.md"),
+        FileDelta(DeltaType.DELETE, "h3", "/kb/c.md"),
+    ]
+
+
+def test_diff_modified_in_place_is_not_a_delete():
+    old = {"h1": "/kb/a.md", "h2": "/kb/b.md"}
+    new = {"h1b": "/kb/a.md", "h2": "/kb/b.md"}
+    assert diff_trees(old, new) == [
+        FileDelta(DeltaType.MODIFY, "h1b", "/kb/a.md", old_hash="h1", old_path="/kb/a.md"),
+    ]
+
+
+def test_diff_renamed_onto_a_deleted_path():
+    # b.md was deleted and a.md renamed to b.md: the old content of b.md is gone, a.md's content moved
+    old = {"h1": "/kb/a.md", "h2": "/kb/b.md"}
+    new = {"h1": "/kb/b.md"}
+    assert diff_trees(old, new) == [
+        FileDelta(DeltaType.RENAME, "h1", "/kb/b.md", old_hash="h1", old_path="/kb/a.md"),
+        FileDelta(DeltaType.DELETE, "h2", "/kb/b.md"),
+    ]
+
+
+def test_diff_swapped_files_are_two_renames():
+    old = {"h1": "/kb/a.md", "h2": "/kb/b.md"}
+    new = {"h1": "/kb/b.md", "h2": "/kb/a.md"}
+    assert [(delta.type, delta.file_hash, delta.path) for delta in diff_trees(old, new)] == [
+        (DeltaType.RENAME, "h1", "/kb/b.md"),
+        (DeltaType.RENAME, "h2", "/kb/a.md"),
+    ]
+
+
+def test_diff_unchanged_tree():
+    tree = {"h1": "/kb/a.md"}
+    assert diff_trees(tree, dict(tree)) == []
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    index_dir = tmp_path / "folder_index"
+    index_dir.mkdir()
+    monkeypatch.setattr(folder_sync, "ARGO_STORAGE_PATH_FOLDER_INDEX", str(index_dir))
+    knowledge = tmp_path / "kb"
+    knowledge.mkdir()
+    return knowledge
+
+
+def kinds(deltas: list[FileDelta]) -> list[tuple[DeltaType, str]]:
+    return sorted((delta.type, os.path.basename(delta.path)) for delta in deltas)
+
+
+def test_refresh_reports_changes_on_disk(folder):
+    (folder / "a.md").write_text("alpha")
+    (folder / "b.txt").write_text("beta")
+    (folder / "sub").mkdir()
+    (folder / "sub" / "c.pdf").write_bytes(b"%PDF gamma")
+    (folder / ".hidden.md").write_text("hidden")
+    (folder / "image.png").write_bytes(b"png")
+
+    index = FolderIndex(str(folder))
+    assert kinds(index.refresh()) == [(DeltaType.ADD, "a.md"), (DeltaType.ADD, "b.txt"), (DeltaType.ADD, "c.pdf")]
+
+    (folder / "b.txt").rename(folder / "sub" / "renamed.txt")
+    (folder / "sub" / "c.pdf").unlink()
+    (folder / "a.md").write_text("alpha, edited")
+    assert kinds(index.refresh()) == [
+        (DeltaType.DELETE, "c.pdf"),
+        (DeltaType.MODIFY, "a.md"),
+        (DeltaType.RENAME, "renamed.txt"),
+    ]
+    assert index.refresh() == []
+
+
+def test_unchanged_files_are_not_hashed_again(folder, monkeypatch):
+    (folder / "a.md").write_text("alpha")
+    (folder / "b.md").write_text("beta")
+    FolderIndex(str(folder)).refresh()
+
+    hashed = []
+    calculate = folder_sync.calculate_sha256
+    monkeypatch.setattr(folder_sync, "calculate_sha256", lambda path: hashed.append(path) or calculate(path))
+    (folder / "b.md").write_text("beta, longer now")
+
+    # a fresh index starts from the persisted stats, as after a restart
+    index = FolderIndex(str(folder))
+    assert kinds(index.refresh()) == [(DeltaType.MODIFY, "b.md")]
+    assert hashed == [str(folder / "b.md")]
+
+
+def test_write_tree(folder):
+    (folder / "a.md").write_text("alpha")
+    index = FolderIndex(str(folder))
+    index.refresh()
+    index.write_tree()
+
+    tree_file = folder / folder_sync.FOLDER_TREE_FILE
+    assert tree_file.exists()
+    mtime = tree_file.stat().st_mtime_ns
+    index.write_tree()
+    assert tree_file.stat().st_mtime_ns == mtime
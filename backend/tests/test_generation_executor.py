@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+import pytest
+
+from services.chat.generation_executor import GenerationExecutor, GenerationJob, GenerationQueueFullError
+
+
+@pytest.fixture
+def executor():
+    return GenerationExecutor(workers=1, tasks_per_worker=1, queue_size=1, per_user=2, per_bot=2)
+
+
+def blocking_job(task_id: str, release: threading.Event) -> GenerationJob:
+    async def run():
+        await asyncio.to_thread(release.wait, 5)
+
+    return GenerationJob(task_id=task_id, user_id="u", bot_id="b", run=run)
+
+
+def test_reservation_counts_as_queued(executor):
+    release = threading.Event()
+    try:
+        assert executor.submit(blocking_job("running", release)) == 0
+        reservation = executor.reserve()
+        assert reservation is not None
+        assert executor.full()
+        assert executor.reserve() is None
+        with pytest.raises(GenerationQueueFullError):
+            executor.submit(blocking_job("unreserved", release))
+
+        assert executor.submit(blocking_job("reserved", release), reservation) == 1
+        assert executor.stats()["reserved"] == 0
+    finally:
+        release.set()
+
+
+def test_released_reservation_frees_its_slot(executor):
+    reservation = executor.reserve()
+    assert executor.full()
+
+    reservation.release()
+    reservation.release()
+    assert not executor.full()
+    assert executor.stats()["reserved"] == 0
@@ -0,0 +1,115 @@
+import struct
+
+import pytest
+
+from services.model.gguf_metadata import EAGER_ARRAY_LENGTH, GGUFArray, GGUFMetadata, read_gguf_metadata
+
+UINT32, FLOAT32, BOOL, STRING, ARRAY, UINT64 = 4, 6, 7, 8, 9, 10
+
+
+def gguf_string(value: str, byte_order: str = "<") -> bytes:
+    encoded = value.encode("utf-8")
+    return struct.pack(byte_order + "Q", len(encoded)) + encoded
+
+
+def gguf_value(value_type: int, value, byte_order: str = "<") -> bytes:
+    if value_type == STRING:
+        return gguf_string(value, byte_order)
+    if value_type == ARRAY:
+        item_type, items = value
+        return struct.pack(byte_order + "IQ", item_type, len(items)) + b"".join(
+            gguf_value(item_type, item, byte_order) for item in items
+        )
+    return struct.pack(byte_order + {UINT32: "I", FLOAT32: "f", BOOL: "?", UINT64: "Q"}[value_type], value)
+
+
+def gguf_file(fields: list[tuple[str, int, object]], byte_order: str = "<", version: int = 3) -> bytes:
+    header = b"GGUF" + struct.pack(byte_order + "IQQ", version, 0, len(fields))
+    return header + b"".join(
+        gguf_string(key, byte_order)
+        + struct.pack(byte_order + "I", value_type)
+        + gguf_value(value_type, value, byte_order)
+        for key, value_type, value in fields
+    )
+
+
+VOCAB = [f"tok{index}" for index in range(EAGER_ARRAY_LENGTH * 2)] + ["<s>", "</s>"]
+FIELDS = [
+    ("general.architecture", STRING, "llama"),
+    ("llama.context_length", UINT32, 4096),
+    ("llama.rope.freq_base", FLOAT32, 10000.0),
+    ("tokenizer.ggml.add_bos_token", BOOL, True),
+    ("tokenizer.ggml.tokens", ARRAY, (STRING, VOCAB)),
+    ("tokenizer.ggml.token_type", ARRAY, (UINT32, [1, 3, 3])),
+    ("tokenizer.ggml.bos_token_id", UINT32, len(VOCAB) - 2),
+    ("tokenizer.ggml.eos_token_id", UINT32, len(VOCAB) - 1),
+    ("tokenizer.chat_template", STRING, "{{ messages }}"),
+]
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_header_fields(tmp_path, byte_order):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(gguf_file(FIELDS, byte_order))
+
+    metadata = GGUFMetadata(str(path))
+    assert metadata.version == 3
+    assert metadata.architecture == "llama"
+    assert metadata.get("llama.context_length") == 4096
+    assert metadata.get("llama.rope.freq_base") == 10000.0
+    assert metadata.get("tokenizer.ggml.add_bos_token") is True
+    assert metadata.get("tokenizer.ggml.token_type") == [1, 3, 3]
+    assert metadata.chat_template == "{{ messages }}"
+
+
+def test_long_arrays_are_read_on_demand(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(gguf_file(FIELDS))
+
+    metadata = GGUFMetadata(str(path))
+    tokens = metadata.get("tokenizer.ggml.tokens")
+    assert isinstance(tokens, GGUFArray)
+    assert len(tokens) == len(VOCAB)
+    assert tokens[7] == "tok7"
+    assert (metadata.bos_token, metadata.eos_token) == ("<s>", "</s>")
+    assert metadata.token(len(VOCAB)) == ""
+    assert metadata.token(None) == ""
+    with pytest.raises(IndexError):
+        tokens[len(VOCAB)]
+
+
+def test_truncated_header_at_every_length(tmp_path):
+    data = gguf_file(FIELDS)
+    path = tmp_path / "partial.gguf"
+    for length in range(1, len(data)):
+        path.write_bytes(data[:length])
+        with pytest.raises(ValueError):
+            GGUFMetadata(str(path))
+
+
+def test_not_gguf_and_unsupported_version(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"PK\x03\x04" + b"\0" * 32)
+    with pytest.raises(ValueError, match="not a gguf file"):
+        GGUFMetadata(str(path))
+
+    path.write_bytes(gguf_file(FIELDS, version=1))
+    with pytest.raises(ValueError, match="version 1"):
+        GGUFMetadata(str(path))
+
+
+def test_unknown_value_type_is_corrupt(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"GGUF" + struct.pack("<IQQ", 3, 0, 1) + gguf_string("odd.key") + struct.pack("<I", 99))
+    with pytest.raises(ValueError, match="corrupt"):
+        GGUFMetadata(str(path))
+
+
+def test_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(gguf_file(FIELDS))
+    first = read_gguf_metadata(path)
+    assert read_gguf_metadata(str(path)) is first
+
+    path.write_bytes(gguf_file([("general.architecture", STRING, "qwen2")]))
+    assert read_gguf_metadata(path).architecture == "qwen2"
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from models.document import DOCUMENTSTATUS
+from services.doc import milvus_op
+from services.doc.ingest_queue import DocumentIngestQueue
+from services.doc.milvus_op import DocCollectionOp
+
+
+@pytest.fixture
+def queue():
+    return DocumentIngestQueue(
+        workers=2, retry_delay=10, max_retry_delay=25, reconcile_interval=3600, throughput_window=60
+    )
+
+
+def test_collections_are_served_round_robin(queue):
+    for partition in ("a1", "a2", "a3"):
+        queue.submit(partition, "a")
+    queue.submit("b1", "b")
+    queue.submit("c1", "c")
+
+    order = [queue._next() for _ in range(5)]
+    assert order == [("a", "a1"), ("b", "b1"), ("c", "c1"), ("a", "a2"), ("a", "a3")]
+
+
+def test_queued_or_running_partition_is_not_submitted_twice(queue):
+    queue.submit("a1", "a")
+    queue.submit("a1", "a")
+    assert queue._next() == ("a", "a1")
+
+    queue.submit("a1", "a")
+    assert queue.stats()["queue_depth"] == 0
+    assert queue.stats()["running"] == 1
+
+
+def test_waiting_partition_is_retried_with_growing_delay(queue, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("services.doc.ingest_queue.time.monotonic", lambda: now[0])
+    queue.submit("a1", "a")
+
+    delays = []
+    for _ in range(4):
+        assert queue._next() == ("a", "a1")
+        queue._finish("a", "a1", DOCUMENTSTATUS.WAITING.value)
+        due = queue._deferred[0][0]
+        delays.append(due - now[0])
+        assert queue.stats()["deferred"] == 1
+        now[0] = due
+
+    assert delays == [10, 20, 25, 25]
+
+
+def test_deferred_partition_waits_for_its_turn(queue, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("services.doc.ingest_queue.time.monotonic", lambda: now[0])
+    queue.submit("a1", "a")
+    queue._next()
+    queue._finish("a", "a1", DOCUMENTSTATUS.WAITING.value)
+    queue.submit("b1", "b")
+
+    assert queue._next() == ("b", "b1")
+    now[0] += 10
+    assert queue._next() == ("a", "a1")
+
+
+def test_finished_partition_forgets_its_attempts(queue):
+    queue.submit("a1", "a")
+    queue._next()
+    queue._finish("a", "a1", DOCUMENTSTATUS.WAITING.value)
+    queue._deferred.clear()
+    queue._queued.clear()
+
+    queue.submit("a1", "a")
+    queue._next()
+    queue._finish("a", "a1", DOCUMENTSTATUS.FINISH.value)
+    assert "a1" not in queue._attempts
+    stats = queue.stats()
+    assert (stats["processed"], stats["failed"], stats["running"]) == (1, 0, 0)
+
+
+class FakeQdrant:
+    def __init__(self):
+        self.collections: set[str] = set()
+        self.created: list[str] = []
+
+    def collection_exists(self, collection_name):
+        return collection_name in self.collections
+
+    def create_collection(self, collection_name, vectors_config):
+        # slow enough that racing workers would all see the collection missing
+        time.sleep(0.05)
+        if collection_name in self.collections:
+            raise ValueError(f"Collection `{collection_name}` already exists!")
+        self.created.append(collection_name)
+        self.collections.add(collection_name)
+
+    def create_payload_index(self, collection_name, field_name, field_schema):
+        pass
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [0.0] * 4
+
+
+def test_parallel_first_uploads_create_the_collection_once(monkeypatch):
+    qdrant = FakeQdrant()
+    monkeypatch.setattr(milvus_op, "get_qdrant_client", lambda: qdrant)
+    errors = []
+
+    def upload():
+        try:
+            DocCollectionOp.ensure_vector_collection("kb", FakeEmbeddings(), "ollama")  # type: ignore[arg-type]
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=upload) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert qdrant.created == ["kb"]
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.tools import ToolException
+
+from core.features import knowledge_tool
+from core.features.knowledge_tool import KnowledgeSearchTool
+from models.document import DOCUMENTSTATUS
+
+
+@pytest.fixture
+def knowledge_bases(monkeypatch):
+    knowledges = {
+        name: SimpleNamespace(
+            collection_name=name,
+            knowledge_name=name.upper(),
+            description=f"about {name}",
+            top_k=top_k,
+            provider="ollama",
+            embedding_model="nomic-embed-text",
+        )
+        for name, top_k in (("a", 3), ("b", 6), ("empty", 5))
+    }
+    documents = {
+        "a": [SimpleNamespace(partition_name="a1", document_status=DOCUMENTSTATUS.FINISH.value)],
+        "b": [
+            SimpleNamespace(partition_name="b1", document_status=DOCUMENTSTATUS.FINISH.value),
+            SimpleNamespace(partition_name="b2", document_status=DOCUMENTSTATUS.WAITING.value),
+        ],
+        "empty": [],
+    }
+    searches = []
+
+    def search(table_info, query, provider, embedding_model, top_k, reranking_model, r):
+        searches.append(({name: [doc.partition_name for doc in docs] for name, docs in table_info.items()}, top_k))
+        return f"context for {query}", []
+
+    monkeypatch.setattr(
+        knowledge_tool, "get_collection_by_name", lambda collection_name: knowledges.get(collection_name)
+    )
+    monkeypatch.setattr(
+        knowledge_tool, "get_documents_by_collection_name", lambda collection_name: documents[collection_name]
+    )
+    monkeypatch.setattr(knowledge_tool, "get_search_context", search)
+    return searches
+
+
+def test_selected_knowledge_bases_are_searched_in_one_call(knowledge_bases):
+    tool = KnowledgeSearchTool.from_knowledge_bases({"a": [], "b": [], "missing": []}, hit_callbacks=[])
+    assert tool.name == "knowledge_search"
+    assert list(tool.collections) == ["a", "b"]
+
+    assert asyncio.run(tool._arun("question")) == "context for question"
+    assert knowledge_bases == [({"a": ["a1"], "b": ["b1"]}, 3)]
+
+
+def test_knowledge_base_without_documents_is_skipped(knowledge_bases):
+    tool = KnowledgeSearchTool.from_knowledge_bases({"a": [], "empty": []}, hit_callbacks=[])
+    asyncio.run(tool._arun("question"))
+    assert knowledge_bases == [({"a": ["a1"]}, 3)]
+
+    single = KnowledgeSearchTool.from_knowledge("empty", [], hit_callbacks=[])
+    assert single.name == "knowledge_search_empty"
+    with pytest.raises(ToolException, match="EMPTY has no document"):
+        asyncio.run(single._arun("question"))
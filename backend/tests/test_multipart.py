@@ -0,0 +1,99 @@
+import io
+
+import pytest
+
+from utils.multipart import MultipartParser
+
+BOUNDARY = b"----argoBoundary42"
+
+
+def body(*parts: tuple[str, bytes], preamble: bytes = b"") -> bytes:
+    """A multipart body from (header lines, content) pairs."""
+    chunks = [preamble]
+    for headers, content in parts:
+        chunks.append(b"--" + BOUNDARY + b"\r\n" + headers.encode() + b"\r\n\r\n" + content + b"\r\n")
+    chunks.append(b"--" + BOUNDARY + b"--\r\n")
+    return b"".join(chunks)
+
+
+def chunked(data: bytes, chunk_size: int) -> list[bytes]:
+    return [data[start : start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+def parse(chunks: list[bytes], skip: tuple[str, ...] = ()) -> tuple[list, MultipartParser]:
+    parts: list = []
+
+    def on_part(name, filename, content_type):
+        if name in skip:
+            parts.append((name, filename, content_type, None))
+            return None
+        writer = io.BytesIO()
+        parts.append((name, filename, content_type, writer))
+        return writer
+
+    parser = MultipartParser(BOUNDARY, on_part)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return [
+        (name, filename, content_type, writer.getvalue() if writer else None)
+        for name, filename, content_type, writer in parts
+    ], parser
+
+
+FILE_CONTENT = b"line one\r\n--not the boundary\r\n--" + BOUNDARY[:-1] + b"\r\n\r\nend"
+UPLOAD = body(
+    ('Content-Disposition: form-data; name="knowledge"', b"kb-1"),
+    ('Content-Disposition: form-data; name="file"; filename="notes.md"\r\nContent-Type: text/markdown', FILE_CONTENT),
+    ('Content-Disposition: form-data; name="empty"', b""),
+    preamble=b"ignored preamble\r\n",
+)
+EXPECTED = [
+    ("knowledge", None, None, b"kb-1"),
+    ("file", "notes.md", "text/markdown", FILE_CONTENT),
+    ("empty", None, None, b""),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 17, len(BOUNDARY) + 3, len(UPLOAD)])
+def test_parts_survive_any_chunk_split(chunk_size):
+    parts, parser = parse(chunked(UPLOAD, chunk_size))
+    assert parts == EXPECTED
+    assert parser.complete
+
+
+def test_boundary_split_at_every_offset():
+    for split in range(1, len(UPLOAD)):
+        parts, parser = parse([UPLOAD[:split], UPLOAD[split:]])
+        assert parts == EXPECTED, split
+        assert parser.complete
+
+
+def test_skipped_part_is_not_written():
+    parts, parser = parse(chunked(UPLOAD, 4), skip=("file",))
+    assert parts[1] == ("file", "notes.md", "text/markdown", None)
+    assert parts[2] == ("empty", None, None, b"")
+    assert parser.complete
+
+
+def test_encoded_filename():
+    data = body(("Content-Disposition: form-data; name=\"file\"; filename*=UTF-8''%E7%AC%94%E8%AE%B0.txt", b"x"))
+    parts, _ = parse(chunked(data, 7))
+    assert parts == [("file", "笔记.txt", None, b"x")]
+
+
+def test_truncated_body_is_not_complete():
+    parts, parser = parse(chunked(UPLOAD[: -len(BOUNDARY)], 9))
+    assert not parser.complete
+    assert [name for name, _, _, _ in parts] == ["knowledge", "file", "empty"]
+
+
+def test_part_without_name_is_rejected():
+    with pytest.raises(ValueError, match="without a name"):
+        parse(chunked(body(('Content-Disposition: form-data; filename="a.txt"', b"x")), 8))
+
+
+def test_oversized_headers_are_rejected():
+    parser = MultipartParser(BOUNDARY, lambda *args: None, max_header_size=64)
+    parser.feed(b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="')
+    with pytest.raises(ValueError, match="too large"):
+        parser.feed(b"x" * 100)
@@ -0,0 +1,145 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.model_providers.ollama import ollama_client
+from core.model_providers.ollama.ollama_client import (
+    CircuitBreaker,
+    OllamaUnavailableError,
+    _BreakerAsyncTransport,
+    _BreakerTransport,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ollama_client.time, "monotonic", clock)
+    return clock
+
+
+def transport(breaker: CircuitBreaker, outcomes: list) -> _BreakerTransport:
+    """A breaker transport whose requests end with the next of `outcomes`, an exception or a status code."""
+
+    def handler(request):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return httpx.Response(outcome)
+
+    return _BreakerTransport(httpx.MockTransport(handler), breaker)
+
+
+def send(transport: _BreakerTransport):
+    return transport.handle_request(httpx.Request("GET", "http://ollama:11434/api/tags"))
+
+
+def test_opens_after_threshold_and_fails_fast(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+    client = transport(breaker, [httpx.ConnectError("refused"), httpx.ConnectError("refused")])
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            send(client)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(OllamaUnavailableError, match="refused"):
+        send(client)
+
+
+def test_read_timeout_does_not_count_as_failure(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    client = transport(breaker, [httpx.ReadTimeout("slow")])
+    with pytest.raises(httpx.ReadTimeout):
+        send(client)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize(
+    ("outcome", "state"),
+    [
+        (200, CircuitBreaker.CLOSED),
+        (httpx.ConnectError("refused"), CircuitBreaker.OPEN),
+        (httpx.ReadTimeout("slow"), CircuitBreaker.OPEN),
+        (asyncio.CancelledError(), CircuitBreaker.OPEN),
+        (RuntimeError("stream closed"), CircuitBreaker.OPEN),
+    ],
+)
+def test_half_open_probe_always_settles(clock, outcome, state):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    client = transport(breaker, [httpx.ConnectError("refused"), outcome, 200])
+    with pytest.raises(httpx.ConnectError):
+        send(client)
+
+    clock.now += 10
+    if isinstance(outcome, BaseException):
+        with pytest.raises(type(outcome)):
+            send(client)
+    else:
+        send(client)
+    assert breaker.state == state
+
+    if state == CircuitBreaker.OPEN:
+        with pytest.raises(OllamaUnavailableError):
+            send(client)
+        clock.now += 10
+    assert send(client).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_only_one_probe_while_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    breaker.failure(httpx.ConnectError("refused"))
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_probe_that_never_ends_is_replaced(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    breaker.failure(httpx.ConnectError("refused"))
+    clock.now += 10
+    assert breaker.allow()
+    clock.now += 5
+    assert not breaker.allow()
+    clock.now += 5
+    assert breaker.allow()
+
+
+def test_release_leaves_closed_circuit_alone(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    breaker.release()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_half_open_probe_cancelled(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+    outcomes: list = [httpx.ConnectError("refused"), asyncio.CancelledError()]
+
+    async def handler(request):
+        raise outcomes.pop(0)
+
+    client = _BreakerAsyncTransport({}, breaker)
+    client._transport = lambda: httpx.MockTransport(handler)  # type: ignore[method-assign]
+    request = httpx.Request("GET", "http://ollama:11434/api/tags")
+
+    async def run():
+        with pytest.raises(httpx.ConnectError):
+            await client.handle_async_request(request)
+        clock.now += 10
+        with pytest.raises(asyncio.CancelledError):
+            await client.handle_async_request(request)
+
+    asyncio.run(run())
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 10
+    assert breaker.allow()
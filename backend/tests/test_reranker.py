@@ -0,0 +1,79 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from qdrant_client import models
+
+from configs.settings import RERANK_SETTINGS
+from core.features.embedding_cache import text_hash
+from core.features.reranker import CrossEncoderReranker, RerankStage
+
+
+class SlowReranker:
+    """Scores by text length once `release` is set, recording every batch it was given."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches: list[list[tuple[str, str]]] = []
+
+    def predict(self, pairs):
+        self.batches.append(pairs)
+        self.release.wait(5)
+        return [float(len(text)) for _, text in pairs]
+
+
+def points(count: int, prefix: str = "p") -> list[models.ScoredPoint]:
+    return [
+        models.ScoredPoint(id=index, version=0, score=0.5, payload={"page_content": prefix * (index + 1)})
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def stage(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank-test")
+    monkeypatch.setattr(RerankStage, "_executor", executor)
+    monkeypatch.setattr(RerankStage, "_queued", 0)
+    monkeypatch.setitem(RERANK_SETTINGS, "BATCH_SIZE", 1)
+    monkeypatch.setitem(RERANK_SETTINGS, "BUDGET", 0.05)
+    monkeypatch.setitem(RERANK_SETTINGS, "MAX_QUEUED_BATCHES", 3)
+    stage = RerankStage("test", SlowReranker())  # type: ignore[arg-type]
+    yield stage
+    stage.reranker.release.set()
+    executor.shutdown(wait=True)
+
+
+def test_scores_within_budget(stage):
+    stage.reranker.release.set()
+    assert stage.rerank("q", points(3)) == [1.0, 2.0, 3.0]
+    assert RerankStage._queued == 0
+
+
+def test_timeout_cancels_batches_not_started(stage):
+    assert stage.rerank("q", points(3)) is None
+    assert RerankStage._queued == 1
+
+    stage.reranker.release.set()
+    RerankStage._executor.submit(lambda: None).result(5)
+    # only the batch running at the deadline was scored, it fills the cache for the next identical query
+    assert len(stage.reranker.batches) == 1
+    assert RerankStage._queued == 0
+    assert stage._cached([("test", text_hash("q"), "0")]) == {("test", text_hash("q"), "0"): 1.0}
+
+
+def test_busy_thread_skips_reranking(stage, monkeypatch):
+    monkeypatch.setitem(RERANK_SETTINGS, "MAX_QUEUED_BATCHES", 1)
+    assert stage.rerank("q", points(1)) is None
+    assert RerankStage._queued == 1
+
+    # the batch still runs past its budget, another query does not queue behind it
+    assert stage.rerank("other", points(1, "o")) is None
+    assert len(stage.reranker.batches) == 1
+    assert RerankStage._queued == 1
+
+
+def test_missing_onnxruntime_names_the_extra(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="--extras rerank"):
+        CrossEncoderReranker(str(tmp_path))
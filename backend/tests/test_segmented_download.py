@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from configs.settings import MODEL_DOWNLOAD_SETTINGS
+from services.model import model_download
+from services.model.segmented_download import SEGMENT_MAP_SUFFIX, MirrorRanking, SegmentedDownload, probe_file
+
+CONTENT = bytes(range(256)) * 40
+
+
+class Mirror:
+    """A local HTTP server serving CONTENT, honouring Range headers unless `ranges` is False."""
+
+    def __init__(self, ranges: bool = True, status: int = 200):
+        self.ranges = ranges
+        self.status = status
+        self.requests: list[str] = []
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802
+                requested = self.headers.get("Range", "")
+                mirror.requests.append(requested)
+                if mirror.status != 200:
+                    self.send_error(mirror.status)
+                    return
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested)
+                if mirror.ranges and match:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) + 1 if match.group(2) else len(CONTENT)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(CONTENT)}")
+                else:
+                    start, end = 0, len(CONTENT)
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start))
+                self.end_headers()
+                self.wfile.write(CONTENT[start:end])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/model.gguf"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def mirrors():
+    started: list[Mirror] = []
+
+    def start(**kwargs) -> Mirror:
+        started.append(Mirror(**kwargs))
+        return started[-1]
+
+    yield start
+    for mirror in started:
+        mirror.close()
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "SEGMENT_SIZE", 1000)
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "CHUNK_SIZE", 256)
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "CONNECTIONS", 3)
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "PROGRESS_INTERVAL", 0.05)
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "MAX_RETRIES", 2)
+
+
+def test_ranking_prefers_healthy_then_fast_mirrors():
+    ranking = MirrorRanking(["a", "b", "c", "a"])
+    assert ranking.ordered() == ["a", "b", "c"]
+
+    ranking.record("c", 1000, 1.0)
+    ranking.record("b", 4000, 1.0)
+    assert ranking.ordered() == ["b", "c", "a"]
+
+    ranking.fail("b")
+    assert ranking.best() == "c"
+    # a good segment works a failure off again
+    ranking.record("b", 4000, 1.0)
+    assert ranking.best() == "b"
+
+    ranking.record("a", 0, 1.0)
+    assert ranking.ordered()[-1] == "a"
+
+
+def test_probe_with_and_without_range_support(mirrors):
+    session = requests.Session()
+    assert probe_file(MirrorRanking([mirrors().url]), session) == (len(CONTENT), True)
+    assert probe_file(MirrorRanking([mirrors(ranges=False).url]), session) == (len(CONTENT), False)
+
+
+def test_probe_skips_failing_mirror(mirrors):
+    broken, good = mirrors(status=503), mirrors()
+    ranking = MirrorRanking([broken.url, good.url])
+    assert probe_file(ranking, requests.Session()) == (len(CONTENT), True)
+    assert ranking.best() == good.url
+
+    with pytest.raises(ValueError, match="no mirror"):
+        probe_file(MirrorRanking([broken.url]), requests.Session())
+
+
+def test_segments_download_in_parallel(tmp_path, mirrors):
+    mirror = mirrors()
+    path = tmp_path / "model.gguf"
+    progress = []
+
+    download = SegmentedDownload(
+        str(path),
+        len(CONTENT),
+        MirrorRanking([mirror.url]),
+        on_progress=lambda done, speed: progress.append(done) or True,
+    )
+    assert len(download.segments) == 11
+    assert download.run()
+
+    assert path.read_bytes() == CONTENT
+    assert not os.path.exists(f"{path}{SEGMENT_MAP_SUFFIX}")
+    assert progress[-1] == len(CONTENT)
+    assert all(requested.startswith("bytes=") for requested in mirror.requests)
+
+
+def test_server_ignoring_range_downloads_in_one_stream(tmp_path, mirrors):
+    mirror = mirrors(ranges=False)
+    ranking = MirrorRanking([mirror.url])
+    size, ranges = probe_file(ranking, requests.Session())
+    path = tmp_path / "model.gguf"
+
+    download = SegmentedDownload(str(path), size, ranking, ranges=ranges)
+    assert download.connections == 1
+    assert download.run()
+    assert path.read_bytes() == CONTENT
+
+
+def test_mirror_ignoring_range_mid_download_loses_its_traffic(tmp_path, mirrors):
+    ignoring, good = mirrors(ranges=False), mirrors()
+    ranking = MirrorRanking([ignoring.url, good.url])
+    path = tmp_path / "model.gguf"
+
+    assert SegmentedDownload(str(path), len(CONTENT), ranking).run()
+    assert path.read_bytes() == CONTENT
+    # a full 200 answer to a range request is never written into a segment
+    assert ranking.best() == good.url
+    assert len(ignoring.requests) <= MODEL_DOWNLOAD_SETTINGS["CONNECTIONS"]
+
+
+def test_resume_fetches_only_missing_bytes(tmp_path, mirrors):
+    mirror = mirrors()
+    path = tmp_path / "model.gguf"
+    path.write_bytes(CONTENT[:2500] + b"\0" * (len(CONTENT) - 2500))
+    segments = [[start, min(start + 1000, len(CONTENT)), 0] for start in range(0, len(CONTENT), 1000)]
+    segments[0][2], segments[1][2], segments[2][2] = 1000, 1000, 500
+    (tmp_path / f"model.gguf{SEGMENT_MAP_SUFFIX}").write_text(json.dumps({"size": len(CONTENT), "segments": segments}))
+
+    assert SegmentedDownload(str(path), len(CONTENT), MirrorRanking([mirror.url])).run()
+    assert path.read_bytes() == CONTENT
+    assert "bytes=2500-2999" in mirror.requests
+    assert not any(requested.startswith(("bytes=0-", "bytes=1000-")) for requested in mirror.requests)
+
+
+def test_stopped_download_keeps_its_segment_map(tmp_path, mirrors):
+    mirror = mirrors()
+    path = tmp_path / "model.gguf"
+    download = SegmentedDownload(
+        str(path), len(CONTENT), MirrorRanking([mirror.url]), on_progress=lambda done, speed: False
+    )
+    download.throttle = lambda size: 0.05
+
+    assert download.run() is False
+    assert os.path.exists(f"{path}{SEGMENT_MAP_SUFFIX}")
+    assert download.done < len(CONTENT)
+
+
+def test_site_latency_is_probed_once_per_ttl(monkeypatch):
+    now = [1000.0]
+    probes, downloads = [], []
+    monkeypatch.setattr(model_download.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(model_download, "site_latency_checked_at", None)
+    monkeypatch.setattr(model_download, "get_site_latency", lambda: probes.append(now[0]))
+    monkeypatch.setattr(model_download, "process_downloading_model_huggingface", downloads.append)
+    monkeypatch.setattr(model_download, "process_downloading_model_ollama", downloads.append)
+    monkeypatch.setitem(MODEL_DOWNLOAD_SETTINGS, "SITE_LATENCY_TTL", 600)
+
+    ollama = SimpleNamespace(model_name="qwen", source="qwen2.5:7b")
+    model_download.process_downloading_model(ollama)
+    assert probes == []
+
+    huggingface = SimpleNamespace(model_name="gemma", source="google/gemma-gguf")
+    for _ in range(3):
+        # a retry or resume of the same download
+        model_download.process_downloading_model(huggingface)
+        now[0] += 100
+    assert probes == [1000.0]
+
+    now[0] = 1700.0
+    model_download.process_downloading_model(huggingface)
+    assert probes == [1000.0, 1700.0]
+    assert downloads == [ollama] + [huggingface] * 4
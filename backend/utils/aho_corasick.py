@@ -0,0 +1,62 @@
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton: finds every occurrence of a set of strings in a single pass over a text.
+
+    Built once for a set of patterns, `iter` then costs the length of the text plus the matches, whatever the
+    number of patterns. Empty patterns are ignored.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: list[str] = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        self._goto: list[dict[str, int]] = [{}]
+        # pattern ids ending at each node, its own and those of the nodes its failure links lead to
+        self._out: list[tuple[int, ...]] = [()]
+        self._fail: list[int] = [0]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = self._goto[node][char] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append(())
+                    self._fail.append(0)
+                node = next_node
+            self._out[node] += (pattern_id,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def iter(self, text: str) -> Iterator[tuple[int, str]]:
+        """(start index, pattern) of every occurrence in `text`, overlapping ones included, by end position."""
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                for pattern_id in out[node]:
+                    pattern = patterns[pattern_id]
+                    yield position - len(pattern) + 1, pattern
+
+    def find(self, text: str) -> set[str]:
+        """The patterns occurring in `text`."""
+        return {pattern for _, pattern in self.iter(text)}
@@ -1,15 +1,110 @@
 import hashlib
 import json
+import logging
+import mmap
+import os
+import time
+from collections.abc import Callable
+from typing import Optional
 
+from configs.env import ARGO_STORAGE_PATH_FILE_DIGESTS
 
-def calculate_sha256(file_path):
+
+def calculate_sha256(file_path, block_size: int = 1024 * 1024):
     sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as fp:
-        for byte_block in iter(lambda: fp.read(4096), b""):
+        for byte_block in iter(lambda: fp.read(block_size), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
 
+def calculate_large_file_sha256(
+    file_path,
+    block_size: int = 16 * 1024 * 1024,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """
+    sha256 of a large file without holding it in memory, reported as (hashed bytes, total bytes).
+
+    The file is mapped and hashed through zero-copy views, so the kernel read-ahead overlaps the disk reads
+    with hashing; files that cannot be mapped are read in blocks instead.
+    """
+    sha256_hash = hashlib.sha256()
+    total = os.path.getsize(file_path)
+    with open(file_path, "rb") as fp:
+        try:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mapped = None
+        if mapped is None:
+            done = 0
+            for byte_block in iter(lambda: fp.read(block_size), b""):
+                sha256_hash.update(byte_block)
+                done += len(byte_block)
+                if on_progress:
+                    on_progress(done, total)
+            return sha256_hash.hexdigest()
+
+        with mapped:
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, total, block_size):
+                    with view[start : start + block_size] as block:
+                        sha256_hash.update(block)
+                    if on_progress:
+                        on_progress(min(start + block_size, total), total)
+    return sha256_hash.hexdigest()
+
+
+def _digest_record(file_path) -> str:
+    file_path = os.path.abspath(file_path)
+    return os.path.join(ARGO_STORAGE_PATH_FILE_DIGESTS, f"{hashlib.sha256(file_path.encode('utf-8')).hexdigest()}.json")
+
+
+def remove_file_digest(file_path):
+    """Forget the digest remembered by `cached_file_sha256` for a file that is deleted or replaced."""
+    try:
+        os.remove(_digest_record(file_path))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logging.warning(f"Failed to remove the remembered digest of {file_path}")
+
+
+def cached_file_sha256(file_path, on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    sha256 of a file, remembered under the app storage keyed by path, size and mtime.
+
+    A retried import of a multi-GB model then reuses the digest instead of reading the whole file again. The
+    digest is not written next to the file, which may belong to the user or sit in a read-only folder.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    record = _digest_record(file_path)
+    try:
+        with open(record, encoding="utf-8") as fp:
+            cached = json.load(fp)
+        unchanged = cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns
+        if cached.get("path") == file_path and unchanged:
+            return cached["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    started = time.monotonic()
+    digest = calculate_large_file_sha256(file_path, on_progress=on_progress)
+    logging.info(f"sha256 of {file_path} ({stat.st_size} bytes) took {time.monotonic() - started:.1f}s")
+    try:
+        temp_path = f"{record}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as fp:
+            json.dump({"path": file_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}, fp)
+        os.replace(temp_path, record)
+    except OSError:
+        # the digest is simply computed again next time
+        logging.warning(f"Failed to remember the digest of {file_path}")
+    return digest
+
+
 def calculate_content_sha256(file_content: bytes) -> str:
     sha256_hash = hashlib.sha256()
     sha256_hash.update(file_content)
@@ -0,0 +1,91 @@
+from collections.abc import Callable
+from email.parser import HeaderParser
+from email.utils import collapse_rfc2231_value
+from typing import Optional, Protocol
+
+
+class PartWriter(Protocol):
+    def write(self, data: bytes): ...
+
+
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser.
+
+    Body chunks are passed to `feed` as they arrive. For every part `on_part(name, filename, content_type)` is
+    called and returns the writer that receives the part body, or None to skip it. Only the tail that may
+    hold the next boundary is kept between chunks, so memory does not grow with the part size.
+    """
+
+    _PREAMBLE, _DELIMITER, _HEADERS, _BODY, _END = range(5)
+
+    def __init__(
+        self,
+        boundary: bytes,
+        on_part: Callable[[str, Optional[str], Optional[str]], Optional[PartWriter]],
+        max_header_size: int = 16 * 1024,
+    ):
+        self._delimiter = b"\r\n--" + boundary
+        self._on_part = on_part
+        self._max_header_size = max_header_size
+        # the first boundary is not preceded by a line break, add one so every boundary looks the same
+        self._buffer = b"\r\n"
+        self._state = self._PREAMBLE
+        self._writer: Optional[PartWriter] = None
+
+    @property
+    def complete(self) -> bool:
+        return self._state == self._END
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        while True:
+            if self._state in (self._PREAMBLE, self._BODY):
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    keep = len(self._delimiter) - 1
+                    if len(self._buffer) > keep:
+                        self._emit(self._buffer[:-keep])
+                        self._buffer = self._buffer[-keep:]
+                    return
+                self._emit(self._buffer[:index])
+                self._writer = None
+                self._buffer = self._buffer[index + len(self._delimiter) :]
+                self._state = self._DELIMITER
+            elif self._state == self._DELIMITER:
+                if len(self._buffer) < 2:
+                    return
+                if self._buffer.startswith(b"--"):
+                    self._buffer = b""
+                    self._state = self._END
+                    return
+                self._state = self._HEADERS
+            elif self._state == self._HEADERS:
+                # the buffer still starts with the line break after the boundary, so empty headers match too
+                index = self._buffer.find(b"\r\n\r\n")
+                if index < 0:
+                    if len(self._buffer) > self._max_header_size:
+                        raise ValueError("multipart part headers too large")
+                    return
+                self._start_part(self._buffer[:index].decode("utf-8", errors="replace"))
+                self._buffer = self._buffer[index + 4 :]
+                self._state = self._BODY
+            else:
+                self._buffer = b""
+                return
+
+    def _start_part(self, raw_headers: str):
+        headers = HeaderParser().parsestr(raw_headers.strip("\r\n").replace("\r\n", "\n"))
+        name = headers.get_param("name", header="content-disposition")
+        filename = headers.get_param("filename", header="content-disposition")
+        if not name:
+            raise ValueError("multipart part without a name")
+        self._writer = self._on_part(
+            collapse_rfc2231_value(name),
+            collapse_rfc2231_value(filename) if filename is not None else None,
+            headers.get_content_type() if headers.get("content-type") else None,
+        )
+
+    def _emit(self, data: bytes):
+        if self._state == self._BODY and self._writer is not None and data:
+            self._writer.write(data)